@@ -8,6 +8,7 @@ from bfres.Common import StringTable
 from enum import IntEnum
 from .pixelfmt import TextureFormat
 from .pixelfmt.swizzle import Swizzle, BlockLinearSwizzle
+from .Surface import Surface
 
 
 class Header(BinaryStruct):
@@ -51,6 +52,13 @@ class Header(BinaryStruct):
     )
 
 
+def _pow2RoundUp(val):
+    """Round up to next power of 2."""
+    res = 1
+    while res < val: res <<= 1
+    return res
+
+
 class BRTI:
     """A BRTI in a BNTX."""
     Header = Header
@@ -82,6 +90,7 @@ class BRTI:
     def __init__(self):
         self.file       = None
         self.mipOffsets = []
+        self._surfaces  = {} # (layer, level) => Surface
 
 
     def dump(self):
@@ -127,8 +136,14 @@ class BRTI:
         return '\n'.join(res).replace('\n', '\n  ')
 
 
-    def readFromFile(self, file:BinaryFile, offset=0):
-        """Decode objects from the file."""
+    def readFromFile(self, file:BinaryFile, offset=0, headersOnly=False):
+        """Decode objects from the file.
+
+        headersOnly: If True, don't read the image data until it's
+            needed. The file must then remain open.
+
+        The pixels aren't decoded until they're accessed.
+        """
         self.file          = file
         self.header        = self.Header().readFromFile(file, offset)
         self.name          = self.header['name']
@@ -137,16 +152,113 @@ class BRTI:
         self.width         = self.header['width']
         self.height        = self.header['height']
         self.channel_types = self.header['channel_types']
+        self.numLayers     = max(1, self.header['array_cnt'])
+        self.numLevels     = max(1, self.header['mipmap_cnt'])
+        self._data         = None
 
-        self.swizzle = BlockLinearSwizzle(self.width,
-            self.fmt_type.bytesPerPixel,
-            self.header['block_height'])
         self._readMipmaps()
-        self._readData()
-        self.pixels, self.depth = self.fmt_type.decode(self)
+        self._computeBlockHeights()
+        self.dataOffset = self.file.read('Q', self.header['ptrs_offset'])
+        if not headersOnly: self._readData()
         return self
 
 
+    @property
+    def data(self):
+        """The raw (swizzled) image data of all layers and levels."""
+        if self._data is None: self._readData()
+        return self._data
+
+
+    @property
+    def pixels(self):
+        """The decoded pixels of the base image."""
+        return self.surface(0, 0).pixels
+
+
+    @property
+    def depth(self):
+        """Bits per channel of the decoded pixels."""
+        # don't read the data just to answer this.
+        base = self._surfaces.get((0, 0), None)
+        if base is None: return self.fmt_type.depth
+        return base.depth
+
+
+    @property
+    def swizzle(self):
+        """The swizzle of the base image."""
+        return self.surface(0, 0).swizzle
+
+
+    def surface(self, layer=0, level=0) -> Surface:
+        """Get the image at given array layer and mip level.
+
+        The image is only decoded when its `pixels` are accessed.
+        """
+        key = (layer, level)
+        if key not in self._surfaces:
+            self._surfaces[key] = self._makeSurface(layer, level)
+        return self._surfaces[key]
+
+
+    def mip(self, level, layer=0) -> Surface:
+        """Get given mip level of given array layer."""
+        return self.surface(layer, level)
+
+
+    def layer(self, idx, level=0) -> Surface:
+        """Get given array layer (or cube face)."""
+        return self.surface(idx, level)
+
+
+    def _makeSurface(self, layer, level):
+        """Build the Surface for given layer and mip level."""
+        if layer < 0 or layer >= self.numLayers:
+            raise IndexError("Texture '%s' has no layer %d (count %d)" % (
+                self.name, layer, self.numLayers))
+        if level < 0 or level >= self.numLevels:
+            raise IndexError("Texture '%s' has no mip level %d (count %d)" % (
+                self.name, level, self.numLevels))
+
+        # each layer holds all of its mip levels.
+        layerSize = len(self.data) // self.numLayers
+        start = self._mipOffset(level)
+        if level + 1 < self.numLevels:
+            end = self._mipOffset(level + 1)
+        else:
+            end = layerSize
+        base = layer * layerSize
+        data = memoryview(self.data)[base + start : base + end]
+
+        return Surface(self, layer, level, data,
+            max(1, self.width  >> level),
+            max(1, self.height >> level),
+            self.blockHeights[level])
+
+
+    def _mipOffset(self, level):
+        """Get offset of mip level relative to the image data."""
+        if len(self.mipOffsets) == 0: return 0
+        return self.mipOffsets[level] - self.mipOffsets[0]
+
+
+    def _computeBlockHeights(self):
+        """Compute the block height of each mip level."""
+        # the block height shrinks for each level whose height in
+        # tiles is less than the base level's block height in lines.
+        fmt   = self.fmt_type
+        lines = self.header['block_height'] * 8
+        shift = 0
+        self.blockHeights = []
+        for level in range(self.numLevels):
+            height = max(1, self.height >> level)
+            rows   = (height + fmt.tileHeight - 1) // fmt.tileHeight
+            if _pow2RoundUp(rows) < lines: shift += 1
+            self.blockHeights.append(
+                max(1, self.header['block_height'] >> shift))
+
+
     def _readMipmaps(self):
         """Read the mipmap images."""
         for i in range(self.header['mipmap_cnt']):
@@ -157,5 +269,5 @@ class BRTI:
 
     def _readData(self):
         """Read the raw image data."""
-        base = self.file.read('Q', self.header['ptrs_offset'])
-        self.data = self.file.read(self.header['data_len'], base)
+        self._data = memoryview(self.file.read(
+            self.header['data_len'], self.dataOffset))
@@ -0,0 +1,110 @@
+import logging; log = logging.getLogger(__name__)
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import types
+import numpy as np
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError: # Python < 3.8
+    shared_memory = None
+from .pixelfmt import TextureFormat
+from .Surface import Surface
+from .BRTI import BRTI
+
+
+def _decodeJob(job):
+    """Decode one image in a worker process.
+
+    job: (name, format ID, data type, width, height, block height,
+        raw data)
+
+    Returns (shared memory name or raw bytes, shape, dtype, depth).
+    """
+    name, fmtId, dtype, width, height, blkHeight, data = job
+    tex = types.SimpleNamespace(
+        name      = name,
+        fmt_type  = TextureFormat.get(fmtId)(),
+        fmt_dtype = BRTI.TextureDataType(dtype),
+    )
+    pixels = Surface(tex, 0, 0, data, width, height, blkHeight).pixels
+    pixels = np.asarray(pixels)
+    if pixels.dtype == object:
+        raise TypeError("Texture format %s can't be decoded in parallel" %
+            type(tex.fmt_type).__name__)
+    depth = tex.fmt_type.depth
+
+    if shared_memory is None or pixels.nbytes == 0:
+        return pixels.tobytes(), pixels.shape, pixels.dtype.str, depth
+
+    # hand the result back through shared memory instead of
+    # pickling it through the pipe.
+    shm = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+    out = np.ndarray(pixels.shape, pixels.dtype, buffer=shm.buf)
+    out[...] = pixels
+    del out
+    shm.close()
+    # the parent process unlinks it, so don't let this process's
+    # resource tracker "clean it up" as a leak when we exit.
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm.name, pixels.shape, pixels.dtype.str, depth
+
+
+def _collect(result):
+    """Get the pixels returned by `_decodeJob`."""
+    src, shape, dtype, depth = result
+    if type(src) is bytes:
+        return np.frombuffer(src, dtype).reshape(shape), depth
+
+    shm = shared_memory.SharedMemory(name=src)
+    try:
+        pixels = np.ndarray(shape, dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return pixels, depth
+
+
+def _discard(result):
+    """Free the shared memory of a result of `_decodeJob` that won't
+    be collected."""
+    src = result[0]
+    if type(src) is bytes: return
+    try: shm = shared_memory.SharedMemory(name=src)
+    except FileNotFoundError: return
+    shm.close()
+    shm.unlink()
+
+
+def decodeParallel(textures, workers):
+    """Decode the base image of each BRTI using a process pool.
+
+    textures: List of BRTI.
+    workers:  Number of worker processes.
+
+    Textures whose pixels are already decoded are skipped.
+    If any fails, its exception is raised after the others finish.
+    """
+    todo = []
+    jobs = []
+    for tex in textures:
+        base = tex.surface(0, 0)
+        if base.decoded: continue
+        todo.append(base)
+        jobs.append((tex.name, tex.fmt_type.id, int(tex.fmt_dtype),
+            base.width, base.height, base.blkHeight, bytes(base.data)))
+
+    log.debug("Decoding %d textures with %d workers", len(jobs), workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_decodeJob, job): surface
+            for surface, job in zip(todo, jobs)}
+        try:
+            for future in as_completed(futures):
+                surface = futures.pop(future)
+                surface.setPixels(*_collect(future.result()))
+        finally:
+            # if a job failed, the others still left their results
+            # in shared memory, which must be freed.
+            for future in futures: future.cancel()
+            for future in futures:
+                if future.cancelled() or future.exception() is not None:
+                    continue
+                _discard(future.result())
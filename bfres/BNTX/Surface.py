@@ -0,0 +1,65 @@
+import logging; log = logging.getLogger(__name__)
+from .pixelfmt.swizzle import BlockLinearSwizzle
+
+
+class Surface:
+    """A single image in a BRTI: one mip level of one array layer.
+
+    Has the same attributes as BRTI that the pixel formats use to
+    decode, so it can be passed to `TextureFormat.decode()`.
+    The pixels are only decoded when first accessed.
+    """
+
+    def __init__(self, tex, layer, level, data, width, height,
+    blkHeight):
+        """Create Surface.
+
+        tex:       BRTI this surface belongs to.
+        layer:     Array layer (or cube face) index.
+        level:     Mip level.
+        data:      Swizzled image data.
+        width:     Width in pixels.
+        height:    Height in pixels.
+        blkHeight: Block height of this level, in GOBs.
+        """
+        fmt = tex.fmt_type
+        self.tex       = tex
+        self.name      = '%s[%d].mip%d' % (tex.name, layer, level)
+        self.layer     = layer
+        self.level     = level
+        self.data      = data
+        self.width     = width
+        self.height    = height
+        self.blkHeight = blkHeight
+        self.fmt_type  = fmt
+        self.fmt_dtype = tex.fmt_dtype
+        self.depth     = fmt.depth
+        self.swizzle   = BlockLinearSwizzle(
+            (width + fmt.tileWidth - 1) // fmt.tileWidth,
+            fmt.bytesPerPixel, blkHeight)
+        self._pixels   = None
+
+
+    def __str__(self):
+        return "<Surface('%s' %dx%d) at 0x%x>" % (
+            self.name, self.width, self.height, id(self))
+
+
+    @property
+    def pixels(self):
+        """The decoded pixels."""
+        if self._pixels is None:
+            self._pixels, self.depth = self.fmt_type.decode(self)
+        return self._pixels
+
+
+    @property
+    def decoded(self):
+        """Whether the pixels have been decoded yet."""
+        return self._pixels is not None
+
+
+    def setPixels(self, pixels, depth):
+        """Set the decoded pixels, eg if decoded elsewhere."""
+        self._pixels = pixels
+        self.depth   = depth
@@ -0,0 +1,193 @@
+import logging; log = logging.getLogger(__name__)
+import hashlib
+import os
+import os.path
+import struct
+import tempfile
+import weakref
+import numpy as np
+
+
+class TextureCache:
+    """On-disk cache of decoded texture images.
+
+    Entries are keyed by a hash of the raw image data along with
+    the parameters that affect decoding, so a texture is found
+    again no matter which file it came from.
+    Least recently used entries are removed when the cache grows
+    beyond its size limit.
+    """
+
+    def __init__(self, path, maxSize=1<<30, compress=False):
+        """Create TextureCache.
+
+        path:     Directory to store the cache in.
+        maxSize:  Maximum total size of cached files, in bytes.
+        compress: Whether to compress new entries.
+        """
+        self.path     = path
+        self.maxSize  = maxSize
+        self.compress = compress
+        self.hits     = 0
+        self.misses   = 0
+        # Surface => [key, whether it's in the cache], so each
+        # texture is only hashed and looked up once.
+        self._seen    = weakref.WeakKeyDictionary()
+        os.makedirs(path, exist_ok=True)
+
+
+    def __str__(self):
+        return "<TextureCache('%s') at 0x%x>" % (self.path, id(self))
+
+
+    @property
+    def hitRate(self):
+        """Fraction of lookups that were found in the cache."""
+        total = self.hits + self.misses
+        if total == 0: return 0
+        return self.hits / total
+
+
+    def key(self, surface) -> str:
+        """Compute cache key for a Surface."""
+        h = hashlib.sha1()
+        h.update(struct.pack('<6I',
+            surface.fmt_type.id, int(surface.fmt_dtype),
+            surface.width, surface.height, surface.blkHeight,
+            len(surface.data)))
+        h.update(surface.data)
+        return h.hexdigest()
+
+
+    def _getKey(self, surface) -> str:
+        """Get a Surface's key, computing it only once."""
+        seen = self._seen.get(surface, None)
+        if seen is None:
+            seen = self._seen[surface] = [self.key(surface), False]
+        return seen[0]
+
+
+    def _entryPath(self, key, ext):
+        return os.path.join(self.path, key + ext)
+
+
+    def get(self, surface):
+        """Look up a Surface's decoded pixels.
+
+        Returns (pixels, depth), or None if not cached.
+        """
+        key = self._getKey(surface)
+        for ext in ('.npy', '.npz'):
+            path = self._entryPath(key, ext)
+            try:
+                if ext == '.npy':
+                    pixels = np.load(path)
+                else:
+                    with np.load(path) as f: pixels = f['pixels']
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError, KeyError) as ex:
+                log.warning("Discarding bad texture cache entry %s: %s",
+                    path, ex)
+                self._remove(path)
+                continue
+
+            os.utime(path) # mark as recently used
+            self._seen[surface][1] = True
+            self.hits += 1
+            return pixels, pixels.dtype.itemsize * 8
+
+        self.misses += 1
+        return None
+
+
+    def put(self, surface, pixels, key=None, evict=True) -> bool:
+        """Store a Surface's decoded pixels.
+
+        key:   The Surface's `key()`, if already known.
+        evict: Whether to evict old entries afterward.
+        Returns whether it was stored.
+        """
+        if key is None: key = self._getKey(surface)
+        pixels = np.asarray(pixels)
+        ext    = '.npz' if self.compress else '.npy'
+
+        # write to a temp file first so that a half-written entry
+        # is never seen by another import.
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if self.compress: np.savez_compressed(f, pixels=pixels)
+                else: np.save(f, pixels)
+            os.replace(tmp, self._entryPath(key, ext))
+        except OSError:
+            log.exception("Failed writing texture cache entry")
+            self._remove(tmp)
+            return False
+        self._getKey(surface)
+        self._seen[surface][1] = True
+        if evict: self.evict()
+        return True
+
+
+    def load(self, textures):
+        """Fill in pixels of BRTIs' base images from the cache.
+
+        Returns the number of textures found.
+        """
+        found = 0
+        for tex in textures:
+            surface = tex.surface(0, 0)
+            if surface.decoded: continue
+            res = self.get(surface)
+            if res is not None:
+                surface.setPixels(*res)
+                found += 1
+        return found
+
+
+    def store(self, textures):
+        """Store decoded base images of BRTIs in the cache.
+
+        Textures found by `load()` aren't stored again, and the ones
+        it didn't find aren't looked for again.
+        """
+        stored = 0
+        for tex in textures:
+            surface = tex.surface(0, 0)
+            seen = self._seen.get(surface, None)
+            if seen is not None and seen[1]: continue # already cached
+            key = self._getKey(surface)
+            if seen is None and (os.path.exists(self._entryPath(key, '.npy'))
+            or os.path.exists(self._entryPath(key, '.npz'))):
+                continue
+            stored += self.put(surface, surface.pixels, key, evict=False)
+        # evicting scans the whole cache, so only do it once.
+        if stored: self.evict()
+
+
+    def evict(self):
+        """Remove least recently used entries until the cache
+        is within its size limit.
+        """
+        entries = []
+        total   = 0
+        for name in os.listdir(self.path):
+            if not name.endswith(('.npy', '.npz')): continue
+            path = os.path.join(self.path, name)
+            try: st = os.stat(path)
+            except FileNotFoundError: continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.maxSize: break
+            log.debug("Evicting texture cache entry %s", path)
+            self._remove(path)
+            total -= size
+
+
+    def _remove(self, path):
+        try: os.remove(path)
+        except FileNotFoundError: pass
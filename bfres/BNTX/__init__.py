@@ -7,6 +7,8 @@ from bfres.BinaryFile import BinaryFile
 from bfres.Common import StringTable
 from .NX import NX
 from .BRTI import BRTI
+from .ParallelDecoder import decodeParallel
+from .TextureCache import TextureCache
 
 class Header(BinaryStruct):
     """BNTX header."""
@@ -74,8 +76,14 @@ class BNTX:
         return '\n'.join(res).replace('\n', '\n  ')
 
 
-    def decode(self):
-        """Decode objects from the file."""
+    def decode(self, headersOnly=False, workers=None):
+        """Decode objects from the file.
+
+        headersOnly: If True, only read the textures' headers;
+            their image data is read when first needed.
+        workers: If set, decode all textures' pixels now, using
+            this many processes.
+        """
         self.strings = StringTable().readFromFile(self.file,
             self.header['strings_offs'])
 
@@ -85,6 +93,21 @@ class BNTX:
         offs = self.nx['info_ptrs_offset']
         for i in range(self.nx['num_textures']):
             brtiOffs = self.file.read('Q', offs)
-            brti = BRTI().readFromFile(self.file, brtiOffs)
+            brti = BRTI().readFromFile(self.file, brtiOffs,
+                headersOnly=headersOnly)
             self.textures.append(brti)
             offs += 8
+
+        if workers: self.decodePixels(workers)
+
+
+    def decodePixels(self, workers=None):
+        """Decode all textures' pixels now.
+
+        workers: Number of processes to use. If not set, decode
+            in this process, one texture at a time.
+        """
+        if workers and len(self.textures) > 1:
+            decodeParallel(self.textures, workers)
+        else:
+            for tex in self.textures: tex.pixels
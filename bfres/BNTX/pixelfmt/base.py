@@ -14,6 +14,9 @@
 # along with botwtools.  If not, see <https://www.gnu.org/licenses/>.
 import logging; log = logging.getLogger(__name__)
 import struct
+import numpy as np
+from bfres.Exceptions import MalformedFileError
+from .swizzle import Swizzle, BlockLinearSwizzle
 
 types = { # name => id, bytes per pixel
     'R5G6B5':    {'id':0x07, 'bpp': 2},
@@ -47,10 +50,21 @@ types = { # name => id, bytes per pixel
 
 fmts = {}
 
+# bits per channel => numpy type of decoded pixel arrays
+depthTypes = {
+     8: np.uint8,
+    16: np.uint16,
+    32: np.uint32,
+}
+
 class TextureFormat:
     id = None
-    bytesPerPixel = 1
+    bytesPerPixel = 1 # per tile, for compressed formats
+    tileWidth  = 1 # pixels per tile, for compressed formats
+    tileHeight = 1
     depth = 8
+    channelOrder = 'BGRA' # order of channels in decoded pixels
+    decodeArray = None # override to decode whole image at once
 
     @staticmethod
     def get(id):
@@ -61,7 +75,17 @@ class TextureFormat:
             raise TypeError("Unsupported texure format")
 
 
+    @property
+    def dtype(self):
+        """The numpy type of one channel of a decoded pixel."""
+        return depthTypes[self.depth]
+
+
     def decode(self, tex):
+        if self.decodeArray is not None:
+            data = self.deswizzle(tex)
+            return self.decodeArray(data, tex.width, tex.height), self.depth
+
         pixels = []
         decode = self.decodePixel
         bpp    = self.bytesPerPixel
@@ -75,6 +99,28 @@ class TextureFormat:
         return pixels, self.depth
 
 
+    def deswizzle(self, tex):
+        """Get the texture's pixel data in linear order.
+
+        Returns a flat numpy array of bytes.
+        """
+        bpp  = self.bytesPerPixel
+        size = tex.width * tex.height * bpp
+        data = np.frombuffer(tex.data, dtype=np.uint8)
+        if type(tex.swizzle) is Swizzle: # already linear
+            return data[0:size]
+
+        offs = tex.swizzle.getOffsets(tex.width, tex.height)
+        if offs.size and offs.max() + bpp > len(data):
+            log.error("Texture: swizzled offset 0x%X out of bounds (len = 0x%X)",
+                offs.max(), len(data))
+            raise MalformedFileError("Texture data out of bounds")
+
+        # gather each pixel's bytes from its swizzled position
+        idxs = offs[..., None] + np.arange(bpp)
+        return data[idxs].reshape(-1)
+
+
     def decodePixel(self, pixel):
         raise TypeError("No decoder for textue format " +
             type(self).__name__)
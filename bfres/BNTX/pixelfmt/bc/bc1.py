@@ -6,6 +6,8 @@ from .base import BCn, TextureFormat, unpackRGB565, clamp
 class BC1(TextureFormat, BCn):
     id = 0x1A
     bytesPerPixel = 8
+    tileWidth  = 4
+    tileHeight = 4
 
 
     def decode(self, tex):
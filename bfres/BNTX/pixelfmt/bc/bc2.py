@@ -6,6 +6,8 @@ from .base import BCn, TextureFormat, unpackRGB565, clamp
 class BC2(TextureFormat, BCn):
     id = 0x1B
     bytesPerPixel = 16
+    tileWidth  = 4
+    tileHeight = 4
 
 
     def decode(self, tex):
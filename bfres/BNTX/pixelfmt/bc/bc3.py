@@ -6,6 +6,8 @@ from .base import BCn, TextureFormat, unpackRGB565, clamp
 class BC3(TextureFormat, BCn):
     id = 0x1C
     bytesPerPixel = 16
+    tileWidth  = 4
+    tileHeight = 4
 
 
     def decode(self, tex):
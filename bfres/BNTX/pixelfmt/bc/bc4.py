@@ -6,6 +6,8 @@ from .base import BCn, TextureFormat, unpackRGB565, clamp
 class BC4(TextureFormat, BCn):
     id = 0x1D
     bytesPerPixel = 8
+    tileWidth  = 4
+    tileHeight = 4
 
 
     def decode(self, tex):
@@ -6,6 +6,8 @@ from .base import BCn, TextureFormat, unpackRGB565, clamp
 class BC5(TextureFormat, BCn):
     id = 0x1E
     bytesPerPixel = 16
+    tileWidth  = 4
+    tileHeight = 4
 
 
     def decode(self, tex):
@@ -13,79 +13,90 @@
 # You should have received a copy of the GNU General Public License
 # along with botwtools.  If not, see <https://www.gnu.org/licenses/>.
 import logging; log = logging.getLogger(__name__)
-import struct
+import numpy as np
 from .base import TextureFormat
 
+# These formats decode the whole (deswizzled) image at once, rather
+# than one pixel at a time. Each returns an array of shape
+# (height, width, 4) of type `self.dtype`, with channels in RGBA order.
+
 
 class R5G6B5(TextureFormat):
     id = 0x07
     bytesPerPixel = 2
+    channelOrder  = 'RGBA'
 
-    def decodePixel(self, pixel):
-        pixel = struct.unpack('H', pixel)
-        r =  (pixel        & 0x1F) << 3
-        g = ((pixel >>  5) & 0x3F) << 2
-        b = ((pixel >> 11) & 0x1F) << 3
-        a = 0xFF
-        return r, g, b, a
+    def decodeArray(self, data, width, height):
+        px  = np.frombuffer(data, '<u2').reshape(height, width)
+        res = np.empty((height, width, 4), self.dtype)
+        res[..., 0] =  (px        & 0x1F) << 3
+        res[..., 1] = ((px >>  5) & 0x3F) << 2
+        res[..., 2] = ((px >> 11) & 0x1F) << 3
+        res[..., 3] = 0xFF
+        return res
 
 
 class R8G8(TextureFormat):
     id = 0x09
     bytesPerPixel = 2
+    channelOrder  = 'RGBA'
 
-    def decodePixel(self, pixel):
-        pixel = struct.unpack('H', pixel)
-        r =  (pixel        & 0xFF)
-        g = ((pixel >>  8) & 0xFF)
-        b = ((pixel >> 11) & 0x1F) << 3
-        a = 0xFF
-        return r, g, b, a
+    def decodeArray(self, data, width, height):
+        px  = np.frombuffer(data, np.uint8).reshape(height, width, 2)
+        res = np.empty((height, width, 4), self.dtype)
+        res[..., 0:2] = px
+        res[..., 2] = 0
+        res[..., 3] = 0xFF
+        return res
 
 
 class R16(TextureFormat):
     id = 0x0A
     bytesPerPixel = 2
     depth = 16
+    channelOrder  = 'RGBA'
 
-    def decodePixel(self, pixel):
-        r = struct.unpack('H', pixel)
-        g = 0xFFFF
-        b = 0xFFFF
-        a = 0xFFFF
-        return r, g, b, a
+    def decodeArray(self, data, width, height):
+        px  = np.frombuffer(data, '<u2').reshape(height, width)
+        res = np.full((height, width, 4), 0xFFFF, self.dtype)
+        res[..., 0] = px
+        return res
 
 
 class R8G8B8A8(TextureFormat):
     id = 0x0B
     bytesPerPixel = 4
+    channelOrder  = 'RGBA'
 
-    def decodePixel(self, pixel):
-        return pixel
+    def decodeArray(self, data, width, height):
+        # already in the output format, so just view it as such.
+        return np.frombuffer(data, np.uint8).reshape(height, width, 4)
 
 
 class R11G11B10(TextureFormat):
     id = 0x0F
     bytesPerPixel = 4
     depth = 16
+    channelOrder  = 'RGBA'
 
-    def decodePixel(self, pixel):
-        pixel = struct.unpack('I', pixel)
-        r =  ( pixel        & 0x07FF) << 5
-        g =  ((pixel >> 11) & 0x07FF) << 5
-        b =  ((pixel >> 22) & 0x03FF) << 6
-        a =  0xFFFF
-        return r, g, b, a
+    def decodeArray(self, data, width, height):
+        px  = np.frombuffer(data, '<u4').reshape(height, width)
+        res = np.empty((height, width, 4), self.dtype)
+        res[..., 0] = ( px        & 0x07FF) << 5
+        res[..., 1] = ((px >> 11) & 0x07FF) << 5
+        res[..., 2] = ((px >> 22) & 0x03FF) << 6
+        res[..., 3] = 0xFFFF
+        return res
 
 
 class R32(TextureFormat):
     id = 0x14
     bytesPerPixel = 4
     depth = 32
+    channelOrder  = 'RGBA'
 
-    def decodePixel(self, pixel):
-        r =  struct.unpack('I', pixel)
-        g =  0xFFFFFFFF
-        b =  0xFFFFFFFF
-        a =  0xFFFFFFFF
-        return r, g, b, a
+    def decodeArray(self, data, width, height):
+        px  = np.frombuffer(data, '<u4').reshape(height, width)
+        res = np.full((height, width, 4), 0xFFFFFFFF, self.dtype)
+        res[..., 0] = px
+        return res
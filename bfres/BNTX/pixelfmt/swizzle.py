@@ -15,6 +15,7 @@
 import logging; log = logging.getLogger(__name__)
 import struct
 import math
+import numpy as np
 
 
 def countLsbZeros(val):
@@ -29,7 +30,14 @@ class Swizzle:
         self.bpp   = bpp
 
     def getOffset(self, x, y):
-        return (y * self.width) + x
+        return ((y * self.width) + x) * self.bpp
+
+    def getOffsets(self, width, height):
+        """Get the offsets of every pixel in a width x height image,
+        as an array of shape (height, width).
+        """
+        y, x = np.mgrid[0:height, 0:width]
+        return self.getOffset(x, y)
 
 
 class BlockLinearSwizzle(Swizzle):
@@ -42,7 +50,8 @@ class BlockLinearSwizzle(Swizzle):
         self.xShift    = countLsbZeros(512 * blkHeight)
 
     def getOffset(self, x, y):
-        x <<= self.bppShift
+        # works on ints or on numpy arrays of coordinates.
+        x = x << self.bppShift
         return (
             ((y >> self.bhShift) * self.gobStride) +
             ((x >> 6) << self.xShift) +
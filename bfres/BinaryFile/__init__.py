@@ -21,6 +21,8 @@ class BinaryFile:
         self.file   = file
         self.name   = file.name
         self.endian = endian
+        self.checkOffsets = True # have BinaryStructs check offsets
+        self.strCache = {} # (offset, format...) => string read from there
 
         # get size
         pos = file.tell()
@@ -41,6 +41,14 @@ class StringOffset(Offset):
             # get the offset
             offset = super().readFromFile(file, offset)
 
+        # strings are often referred to from many places, so only
+        # read each one once.
+        cache = getattr(file, 'strCache', None)
+        key   = (offset, self.lenprefix, self.maxlen, self.encoding)
+        if cache is not None and offset is not None:
+            s = cache.get(key, None)
+            if s is not None: return s
+
         # get the string
         if offset is not None: file.seek(offset)
         if self.lenprefix is not None:
@@ -56,6 +64,7 @@ class StringOffset(Offset):
                 offset, self.encoding, s[0:15])
             raise
 
+        if cache is not None and offset is not None: cache[key] = s
         return s
 
 
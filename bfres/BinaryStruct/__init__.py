@@ -125,6 +125,8 @@ class BinaryStruct:
 
     def _checkOffsets(self, res, file):
         """Check if offsets are sane."""
+        # files can turn this off if they check them some other way.
+        if not getattr(file, 'checkOffsets', True): return
         from .Offset import Offset
         for field in self.orderedFields:
             typ  = field['type']
@@ -15,3 +15,8 @@ class UnsupportedFormatError(Exception):
 
 class MalformedFileError(Exception):
     """File is corrupted or unreadable."""
+
+
+class NoFileError(Exception):
+    """Object has no file to read from, eg because it was loaded
+    from a snapshot, and something it hasn't read was asked for."""
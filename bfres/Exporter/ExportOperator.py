@@ -13,8 +13,7 @@ class ExportOperator(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
     bl_idname    = "export_scene.nxbfres"
     bl_label     = "Export NX BFRES"
     bl_options   = {'UNDO'}
-    #filename_ext = ".bfres"
-    filename_ext = ".dat"
+    filename_ext = ".bfres"
 
     filter_glob  = bpy.props.StringProperty(
         default="*.sbfres;*.bfres",
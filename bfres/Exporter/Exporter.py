@@ -8,12 +8,31 @@ import tempfile
 import shutil
 import struct
 import math
+import numpy as np
 from bfres.Exceptions import UnsupportedFileTypeError
 from bfres.BinaryFile import BinaryFile
 from bfres import YAZ0, FRES, BNTX
+from bfres.FRES.FresWriter import FresWriter
 #from .ModelImporter import ModelImporter
 #from .TextureImporter import TextureImporter
 
+# max bones affecting one vertex.
+MAX_INFLUENCES = 4
+
+# max error allowed when storing attributes in smaller formats.
+ATTR_TOLERANCE = {
+    '_n': 1/256,
+    '_u': 1/1024,
+}
+
+
+def _getArray(collection, attr, dtype, count, comps=1):
+    """Read an attribute of every item of a Blender collection."""
+    res = np.empty(count * comps, dtype=dtype)
+    collection.foreach_get(attr, res)
+    if comps > 1: res = res.reshape(count, comps)
+    return res
+
 
 class Exporter:
     def __init__(self, operator, context):
@@ -33,16 +52,18 @@ class Exporter:
         if len(objects) == 0:
             raise RuntimeError("No objects selected and no objects visible.")
 
-        self.outFile = open(self.path, 'wb')
+        name = os.path.splitext(os.path.basename(path))[0]
+        self.writer = FresWriter(name)
+        self.model  = self.writer.addModel(name)
+        self.materials = {} # name => index
         try:
             for i, obj in enumerate(objects):
                 log.info("Exporting object %d of %d: %s",
                     i+1, len(objects), obj.name)
                 self.exportObject(obj)
+            self.writer.write(self.path)
         except:
             log.exception("Export FAILED")
-        finally:
-            self.outFile.close()
 
         log.info("Export finished.")
         return {'FINISHED'}
@@ -69,74 +90,131 @@ class Exporter:
     def exportMesh(self, obj):
         """Export a mesh."""
         log.debug("Exporting mesh: %s", obj)
-        attrs = self._makeAttrBufferDataForMesh(obj)
-        faces = []
-        for poly in obj.data.polygons:
-            faces.append(list(poly.vertices))
-        log.debug("Mesh has %d faces", len(faces))
-        data = {
-            'attrs': attrs,
-            'faces': faces,
-            'groupNames': [group.name for group in obj.vertex_groups],
-        }
-        data = bytes(repr(data), 'utf-8')
-        log.debug("Writing %d bytes", len(data))
-        self.outFile.write(data)
+        mesh = obj.data
+        attrs, faces = self._makeAttrBufferDataForMesh(obj)
+        log.debug("Mesh has %d vertices, %d triangles",
+            len(attrs['_p0']), len(faces) // 3)
+
+        matName = 'default'
+        if len(mesh.materials) > 0 and mesh.materials[0] is not None:
+            matName = mesh.materials[0].name
+        if matName not in self.materials:
+            self.materials[matName] = self.writer.addMaterial(
+                self.model, matName)
+
+        self.writer.addShape(self.model, obj.name, attrs, [faces],
+            material=self.materials[matName], tolerance=ATTR_TOLERANCE,
+            optimize=True)
 
 
     def _makeAttrBufferDataForMesh(self, obj):
-        """Make the attribute buffer data for a mesh."""
-        positions = []
-        normals   = []
-        texCoords = []
-        idxs      = []
-        weights   = []
-
-        # make FRES attribute dicts
+        """Make the attribute buffer data for a mesh.
+
+        Returns (attrs, faces): dict of attribute name => array,
+        and triangle list of indices into them.
+        """
+        mesh   = obj.data
+        nVtxs  = len(mesh.vertices)
+        nLoops = len(mesh.loops)
+        nPolys = len(mesh.polygons)
+
+        positions = _getArray(mesh.vertices, 'co',     np.float32, nVtxs, 3)
+        normals   = _getArray(mesh.vertices, 'normal', np.float32, nVtxs, 3)
+        loopVtxs  = _getArray(mesh.loops, 'vertex_index', np.int64, nLoops)
+        uvs = [_getArray(layer.data, 'uv', np.float32, nLoops, 2)
+            for layer in mesh.uv_layers]
+
+        # triangulate polygons as fans: each polygon of n loops
+        # becomes n-2 triangles of (first, i+1, i+2).
+        loopStart = _getArray(mesh.polygons, 'loop_start', np.int64, nPolys)
+        loopTotal = _getArray(mesh.polygons, 'loop_total', np.int64, nPolys)
+        nTris = np.maximum(loopTotal - 2, 0)
+        first = np.repeat(loopStart, nTris)
+        step  = np.arange(nTris.sum()) - np.repeat(np.cumsum(nTris) - nTris,
+            nTris)
+        tris  = np.stack((first, first + step + 1, first + step + 2), axis=1)
+
+        # UVs are per loop, but the game wants them per vertex, so
+        # split vertices that have different UVs in different faces.
+        # compare the UVs' bits, so equal values match exactly.
+        key = np.concatenate([loopVtxs[:, None]] +
+            [uv.view(np.int32).astype(np.int64) for uv in uvs], axis=1)
+        _, loopOf, newIdx = np.unique(key, axis=0,
+            return_index=True, return_inverse=True)
+        newIdx = newIdx.reshape(-1)
+        vtxOf  = loopVtxs[loopOf]
+        if len(vtxOf) > nVtxs:
+            log.debug("Split %d vertices for UVs", len(vtxOf) - nVtxs)
+
+        # convert from Blender's Z-up to the game's Y-up.
+        def convert(v): return np.stack((v[:, 0], v[:, 2], -v[:, 1]), axis=1)
         attrs = {
-            '_i0': idxs,
-            '_n0': normals,
-            '_p0': positions,
-            '_w0': weights,
+            '_p0': convert(positions[vtxOf]),
+            '_n0': convert(normals[vtxOf]),
         }
+        for i, uv in enumerate(uvs):
+            attrs['_u%d' % i] = uv[loopOf]
 
-        # make a list of UV coordinates for each layer
-        uvs = obj.data.uv_layers
-        numUVs = len(uvs)
-        for i in range(numUVs):
-            lst = []
-            attrs['_u%d' % i] = lst
-            texCoords.append(lst)
-
-        # add each vertex to attribute buffers
-        for vtx in obj.data.vertices:
-            # groups: Weights for the vertex groups this vertex is member of
-            # index: Index of this vertex
-            # normal: Vertex Normal
-            x, y, z = vtx.co
-            positions.append((x, y, z))
+        if len(obj.vertex_groups) > 0:
+            idxs, wgts = self._getWeights(obj, nVtxs)
+            attrs['_i0'] = idxs[vtxOf]
+            attrs['_w0'] = wgts[vtxOf]
 
-            nx, ny, nz = vtx.normal
-            normals.append((nx, ny, nz))
+        return attrs, newIdx[tris].reshape(-1)
 
-            if len(vtx.groups) > 4:
-                log.warning("Vertex has more than 4 groups: %s, %s",
-                    vtx, vtx.groups)
-            idx, wgt = [], []
-            # export weights sorted from strongest to weakest
-            for group in reversed(sorted(vtx.groups, key=lambda g:g.weight)):
-                idx.append(group.group)
-                wgt.append(group.weight)
-            idxs.append(idx)
-            weights.append(wgt)
 
-            for uv in range(numUVs):
-                u, v = uvs[uv].data[vtx.index].uv
-                texCoords[uv].append((u, v))
-
-        return attrs
+    def _getWeights(self, obj, nVtxs):
+        """Get vertex weights as `_i0` and `_w0` arrays."""
+        # Blender has no bulk access to vertex groups, so this
+        # part is done per vertex.
+        groupOf = self._getSkinIdxs(obj)
+        idxs = np.zeros((nVtxs, MAX_INFLUENCES), dtype=np.int64)
+        wgts = np.zeros((nVtxs, MAX_INFLUENCES))
+        nOver = 0
+        for vtx in obj.data.vertices:
+            groups = sorted(((g.weight, g.group) for g in vtx.groups),
+                reverse=True)
+            if len(groups) > MAX_INFLUENCES: nOver += 1
+            for j, (weight, group) in enumerate(groups[0:MAX_INFLUENCES]):
+                wgts[vtx.index, j] = weight
+                idxs[vtx.index, j] = groupOf[group]
+        if nOver:
+            log.warning("%d vertices in %s have more than %d groups; using the strongest",
+                nOver, obj.name, MAX_INFLUENCES)
+
+        # vertices in no group belong to the root entirely.
+        total = wgts.sum(axis=1)
+        wgts[total <= 0, 0] = 1
+        total[total <= 0] = 1
+        wgts /= total[:, None]
+
+        # quantize so each vertex's weights still sum to 255.
+        q = np.floor(wgts * 255).astype(np.int64)
+        q[:, 0] += 255 - q.sum(axis=1)
+        return idxs, q
+
+
+    def _getSkinIdxs(self, obj):
+        """Get the smooth matrix index for each of an object's
+        vertex groups, adding bones for them as needed.
+        """
+        bones  = self.model['bones']
+        smooth = self.model['smoothBones']
+        if len(smooth) == 0: smooth.append(0) # the root
+        boneIdx = {bone['name']: i for i, bone in enumerate(bones)}
+        res = []
+        for group in obj.vertex_groups:
+            if group.name not in boneIdx:
+                boneIdx[group.name] = len(bones)
+                bones.append({'name':group.name, 'parent':0})
+            bone = boneIdx[group.name]
+            if bone not in smooth: smooth.append(bone)
+            res.append(smooth.index(bone))
+        return res
 
 
     def exportArmature(self, obj):
         """Export an armature."""
         # TODO
+        log.warning("Armature export not implemented; exporting %s as one bone per vertex group",
+            obj.name)
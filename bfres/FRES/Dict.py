@@ -36,9 +36,90 @@ class Node(BinaryStruct):
         self.data_offset  = data['data_offset']
         self.left         = None
         self.right        = None
+        self.index        = None # index of the item this node names
         return self
 
 
+    def __getstate__(self):
+        # the field definitions come from the class.
+        state = dict(self.__dict__)
+        state.pop('fields', None)
+        state.pop('orderedFields', None)
+        return state
+
+
+    @property
+    def refBit(self):
+        """The bit index this node tests, as a signed number.
+        (The root node's is -1.)
+        """
+        val = self.search_value
+        if val & 0x80000000: val -= 0x100000000
+        return val
+
+
+def _getRefBit(key:bytes, bit:int) -> int:
+    """Get the bit of `key` which a node tests.
+
+    Bits are counted from the least significant bit of the last
+    character of the key; bits past the start of the key are 0.
+    """
+    charIdx = bit >> 3
+    if bit < 0 or charIdx >= len(key): return 0
+    return (key[len(key) - 1 - charIdx] >> (bit & 7)) & 1
+
+
+def makeTree(names) -> list:
+    """Build the nodes of a Dict naming `names`.
+
+    Returns list of (search value, left index, right index, name):
+    the root first, then one node per name, in the same order.
+
+    Raises ValueError if a name is empty or repeated, since those
+    can't be told apart by any bit.
+    """
+    keys   = [name.encode('shift-jis') for name in names]
+    bits   = [-1]     # bit each node tests
+    childs = [[0, 0]] # left, right node index
+
+    def walk(key, limit=None):
+        parent, child = 0, childs[0][0]
+        while bits[parent] < bits[child] and \
+        (limit is None or bits[child] < limit):
+            parent = child
+            child  = childs[child][_getRefBit(key, bits[child])]
+        return parent, child
+
+    for key in keys:
+        # find the first bit where this key differs from the
+        # closest existing one.
+        closest = walk(key)[1]
+        other   = b'' if closest == 0 else keys[closest - 1]
+        bit = 0
+        maxBit = 8 * max(len(key), len(other))
+        while bit < maxBit and \
+        _getRefBit(key, bit) == _getRefBit(other, bit):
+            bit += 1
+        if bit >= maxBit:
+            raise ValueError("Can't add duplicate or empty name '%s' to Dict"
+                % key.decode('shift-jis'))
+
+        # insert a node testing that bit above the first node
+        # that tests a later one.
+        parent, child = walk(key, bit)
+        idx = len(bits)
+        side = _getRefBit(key, bit)
+        node = [0, 0]
+        node[side], node[1 - side] = idx, child
+        bits.append(bit)
+        childs.append(node)
+        if parent == 0: childs[0][0] = idx
+        else: childs[parent][_getRefBit(key, bits[parent])] = idx
+
+    return [(bit & 0xFFFFFFFF, left, right, name) for bit, (left, right), name
+        in zip(bits, childs, [''] + list(names))]
+
+
 class Dict(FresObject):
     """A name dict in an FRES."""
 
@@ -87,9 +168,38 @@ class Dict(FresObject):
         # build tree
         self.root = self.nodes[0]
         for i, node in enumerate(self.nodes):
+            node.index = i - 1 # root doesn't name an item
             try: node.left  = self.nodes[node.left_idx]
             except IndexError: node.left = None
             try: node.right = self.nodes[node.right_idx]
             except IndexError: node.right = None
 
         return self
+
+
+    def find(self, name:str) -> Node:
+        """Find the node for given name.
+
+        Walks the tree the same way the game does, so only
+        about log2(n) nodes are visited.
+        Returns None if not found.
+        """
+        key    = name.encode('shift-jis')
+        parent = self.root
+        child  = parent.left
+        while child is not None and parent.refBit < child.refBit:
+            parent = child
+            if _getRefBit(key, child.refBit): child = child.right
+            else: child = child.left
+
+        if child is None or child is self.root or child.name != name:
+            return None
+        return child
+
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+
+    def __len__(self):
+        return len(self.nodes) - 1
@@ -52,6 +52,9 @@ class DumpMixin:
 
 
     def _dumpStringTable(self, res):
+        if self.strtab is None:
+            res.append("  StrTab: not loaded")
+            return
         res.append("  StrTab│N/A │%08X│N/A     │size=0x%06X num_strs=%d" % (
             self.header['str_tab_offset'],
             self.header['str_tab_size'],
@@ -60,13 +63,16 @@ class DumpMixin:
 
 
     def _dumpRLT(self, res):
+        if self.rlt is None:
+            res.append("  Relocation table: not loaded")
+            return
         res.append(self.rlt.dump())
 
 
     def _dumpModels(self, res):
         res.append("  Models: %d" % len(self.models))
         for i, model in enumerate(self.models):
-            res.append(model.dump())
+            if model is not None: res.append(model.dump())
 
 
     def _dumpAnimations(self, res):
@@ -20,6 +20,7 @@ class Header(BinaryStruct):
 
 class EmbeddedFile(FresObject):
     """A file embedded in an FRES."""
+    Header = Header
 
     def __init__(self, fres, name=None):
         self.fres         = fres
@@ -54,6 +55,13 @@ class EmbeddedFile(FresObject):
         return self
 
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_tempFile']    = None
+        state['_tempBinFile'] = None
+        return state
+
+
     def toTempFile(self) -> BinaryFile:
         """Dump to a temporary file."""
         if self._tempFile is None:
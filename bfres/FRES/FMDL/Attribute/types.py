@@ -1,4 +1,7 @@
 import logging; log = logging.getLogger(__name__)
+import struct
+import numpy as np
+from bfres.FRES.Snapshot import registerFunction
 
 def unpack10bit(val):
     if type(val) in (list, tuple):
@@ -28,6 +31,68 @@ def unpackArmHalfFloat(val):
         return sign * (2 ** (exp-15)) * (1+frac)
 
 
+def unpack10bitArray(vals):
+    """Vectorized `unpack10bit`.
+
+    vals: Array of packed values, one per vertex.
+    Returns float array of shape (n, 3).
+    """
+    vals  = np.asarray(vals, dtype=np.uint32).reshape(-1, 1)
+    parts = vals >> np.array([0, 10, 20], dtype=np.uint32)
+    res   = (parts & 0x1FF).astype(np.float32)
+    res[(parts & 0x200) != 0] *= -1
+    return res / 511
+
+
+def unpackArmHalfFloatArray(vals):
+    """Vectorized `unpackArmHalfFloat`."""
+    vals = np.asarray(vals, dtype=np.uint16)
+    frac = (vals & 0x3FF) / 0x3FF
+    exp  = ((vals >> 10) & 0x1F).astype(np.int32)
+    sign = np.where(vals & 0x8000, -1, 1)
+    res  = np.where(exp == 0, (2.0 ** -14) * frac,
+        np.exp2(exp - 15) * (1 + frac))
+    return (sign * res).astype(np.float32)
+
+
+def pack10bitArray(vals):
+    """Inverse of `unpack10bitArray`.
+
+    vals: Float array of shape (n, 3). Values are clamped to -1..1.
+    Returns uint32 array of shape (n, 1).
+    """
+    vals  = np.nan_to_num(np.asarray(vals, dtype=np.float64).reshape(-1, 3))
+    parts = np.minimum(np.rint(np.abs(vals) * 511), 0x1FF).astype(np.uint32)
+    parts[vals < 0] |= 0x200
+    res = parts[:, 0] | (parts[:, 1] << 10) | (parts[:, 2] << 20)
+    return res.reshape(-1, 1)
+
+
+def packArmHalfFloatArray(vals):
+    """Inverse of `unpackArmHalfFloatArray`.
+
+    Values too large for the format are clamped to its largest
+    value, which is 2 ** 17, since there is no Inf.
+    Returns uint16 array of the same shape.
+    """
+    vals = np.nan_to_num(np.asarray(vals, dtype=np.float64))
+    mag  = np.abs(vals)
+    # the fraction is divided by 0x3FF, not 0x400, so each exponent
+    # covers [1, 2] and the steps don't match IEEE half floats.
+    exp  = np.frexp(mag)[1] + 14 # mag is in [2**(exp-15), 2**(exp-14))
+    sub  = mag < 2.0 ** -14
+    exp  = np.where(sub, 0, exp)
+    frac = np.where(sub, mag * (2.0 ** 14),
+        mag / np.exp2(exp - 15) - 1)
+    frac = np.rint(frac * 0x3FF)
+    big  = exp > 0x1F
+    exp  = np.where(big, 0x1F, exp)
+    frac = np.where(big, 0x3FF, frac)
+    res  = (exp.astype(np.uint16) << 10) | frac.astype(np.uint16)
+    res[vals < 0] |= 0x8000
+    return res
+
+
 
 typeRanges = { # name: (min, max)
     'b': (       -128,        127),
@@ -40,6 +105,10 @@ typeRanges = { # name: (min, max)
 
 
 # attribute format ID => struct fmt
+# `func` converts one vertex's values; `arrayFunc` converts
+# an array of all vertices' values, and `packFunc` converts
+# them back. `components` is the number of values it decodes to,
+# if not the number of values in `fmt`.
 # type IDs do NOT match up with gx2Enum.h (wrong version?)
 attrFmts = {
     0x0201: {
@@ -87,6 +156,9 @@ attrFmts = {
         'ctype': 'float',
         'name':  '10bit',
         'func':  unpack10bit,
+        'arrayFunc': unpack10bitArray,
+        'packFunc':  pack10bitArray,
+        'components': 3,
     },
     0x1202: {
         'fmt':   '2h',
@@ -113,12 +185,16 @@ attrFmts = {
         'ctype': 'float',
         'name':  'half[2]',
         'func':  unpackArmHalfFloat,
+        'arrayFunc': unpackArmHalfFloatArray,
+        'packFunc':  packArmHalfFloatArray,
     },
     0x1505: {
         'fmt':   '4H',
         'ctype': 'float',
         'name':  'half[4]',
         'func':  unpackArmHalfFloat,
+        'arrayFunc': unpackArmHalfFloatArray,
+        'packFunc':  packArmHalfFloatArray,
     },
     0x1705: {
         'fmt':   '2f',
@@ -137,3 +213,107 @@ for id, fmt in attrFmts.items():
     if typ in typeRanges:
         if 'min' not in fmt: fmt['min'] = typeRanges[typ][0]
         if 'max' not in fmt: fmt['max'] = typeRanges[typ][1]
+    # snapshots of attributes refer to their format's functions.
+    for key in ('func', 'arrayFunc', 'packFunc'):
+        if key in fmt: registerFunction(fmt[key])
+
+
+def formatComponents(fmtId) -> int:
+    """Get the number of values an attribute format decodes to."""
+    fmt = attrFmts[fmtId]
+    return fmt.get('components', int(fmt['fmt'][:-1] or 1))
+
+
+def formatSize(fmtId) -> int:
+    """Get the size in bytes of one value of an attribute format."""
+    return struct.calcsize('<' + attrFmts[fmtId]['fmt'])
+
+
+def encodeArray(fmtId, vals, fill=0) -> np.ndarray:
+    """Convert values to an attribute format.
+
+    fmtId: Attribute format ID.
+    vals:  Array of shape (n, components). Integer arrays are stored
+        as-is; float arrays stored in integer formats are normalized,
+        so that 1.0 becomes the format's `max` (as `decodeArray` and
+        the importer expect).
+    fill:  Value of missing components, eg 1 for positions' W.
+    Returns array of shape (n, count) of the format's type, where
+    count is the number of values in the format's struct fmt.
+    Raises ValueError if the values don't fit the format.
+    """
+    fmt = attrFmts.get(fmtId, None)
+    if fmt is None:
+        raise ValueError("Unknown attribute format 0x%04X" % fmtId)
+    vals = np.asarray(vals)
+    if vals.ndim == 1: vals = vals[:, None]
+    comps = formatComponents(fmtId)
+    if vals.shape[1] > comps:
+        raise ValueError("Can't store %d components in format %s" % (
+            vals.shape[1], fmt['name']))
+    if vals.shape[1] < comps:
+        vals = np.concatenate((vals,
+            np.full((len(vals), comps - vals.shape[1]), fill, vals.dtype)),
+            axis=1)
+
+    if 'packFunc' in fmt: res = fmt['packFunc'](vals)
+    elif fmt['ctype'] != 'int': res = vals
+    elif vals.dtype.kind in 'iub':
+        if len(vals) and (vals.min() < fmt['min'] or vals.max() > fmt['max']):
+            raise ValueError("Values %d to %d are out of range for format %s" % (
+                vals.min(), vals.max(), fmt['name']))
+        res = vals
+    else:
+        res = np.clip(np.rint(np.nan_to_num(vals) * fmt['max']),
+            fmt['min'], fmt['max'])
+    return res.astype('<' + fmt['fmt'][-1]).reshape(len(vals), -1)
+
+
+def decodeArray(fmtId, data, normalize=False) -> np.ndarray:
+    """Convert values from an attribute format.
+
+    fmtId:     Attribute format ID.
+    data:      Array from `encodeArray`.
+    normalize: Divide integer formats' values by their `max`.
+    Returns array of shape (n, components).
+    """
+    fmt  = attrFmts[fmtId]
+    func = fmt.get('arrayFunc', None)
+    if func is not None:
+        res = func(data).reshape(len(data), -1)
+    else:
+        res = np.asarray(data)
+    if normalize and fmt['ctype'] == 'int':
+        res = res / fmt['max']
+    return res
+
+
+def chooseFormat(vals, tolerance, candidates=None):
+    """Find the smallest format that can store float values.
+
+    vals:       Float array of shape (n, components).
+    tolerance:  Max error allowed in any value.
+    candidates: Format IDs to consider. (default: all)
+    Returns the format ID, or None if none are accurate enough.
+    Of formats with the same size, the lowest ID is used.
+    """
+    vals = np.asarray(vals, dtype=np.float64)
+    if vals.ndim == 1: vals = vals[:, None]
+    if candidates is None: candidates = attrFmts.keys()
+    candidates = sorted((formatSize(fmtId), fmtId) for fmtId in candidates
+        if formatComponents(fmtId) >= vals.shape[1])
+
+    tried = set()
+    for size, fmtId in candidates:
+        fmt = attrFmts[fmtId]
+        key = (fmt['fmt'], fmt.get('packFunc', None))
+        if key in tried: continue # same encoding as a previous one
+        tried.add(key)
+
+        res = decodeArray(fmtId, encodeArray(fmtId, vals), normalize=True)
+        err = np.abs(res[:, 0:vals.shape[1]] - vals)
+        if len(vals) == 0 or err.max() <= tolerance:
+            log.debug("Chose attribute format %s, max error %f",
+                fmt['name'], err.max() if len(vals) else 0)
+            return fmtId
+    return None
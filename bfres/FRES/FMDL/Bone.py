@@ -15,7 +15,7 @@ from .LOD       import LOD
 from .Vertex    import Vertex
 import struct
 import math
-import mathutils # Blender
+import numpy as np
 
 
 class BoneStruct(BinaryStruct):
@@ -79,6 +79,7 @@ class Bone(FresObject):
         self.fres   = fres
         self.offset = None
         self.parent = None # to be set by FSKL on read
+        self.index  = None # index in FSKL.bones, set by FSKL on read
 
 
     def __str__(self):
@@ -139,67 +140,21 @@ class Bone(FresObject):
         return self
 
 
-    def computeTransform(self):
-        """Compute final transformation matrix."""
-        T = self.pos
-        S = self.scale
-        R = self.rot
-
-        # why have these flags instead of just setting the
-        # values to 0/1? WTF Nintendo.
-        # they seem to only be set when the values already are
-        # 0 (or 1, for scale) anyway.
-        #if self.flags['NO_ROTATION']:    R = Vec4(0, 0, 0, 1)
-        #if self.flags['NO_TRANSLATION']: T = Vec3(0, 0, 0)
-        #if self.flags['SCALE_VOL_1']:    S = Vec3(1, 1, 1)
-        if self.flags['SEG_SCALE_COMPENSATE']:
-            # apply inverse of parent's scale
-            if self.parent:
-                S[0] *= 1 / self.parent.scale[0]
-                S[1] *= 1 / self.parent.scale[1]
-                S[2] *= 1 / self.parent.scale[2]
-            else:
-                log.warning("Bone '%s' has flag SEG_SCALE_COMPENSATE but no parent", self.name)
-        # no idea what "scale uniformly" actually means.
-        # XXX billboarding, rigid mtxs, if ever used.
-
-        # Build matrices from these transformations.
-        T = mathutils.Matrix.Translation(T).to_4x4().transposed()
-        Sm = mathutils.Matrix.Translation((0, 0, 0)).to_4x4()
-        Sm[0][0] = S[0]
-        Sm[1][1] = S[1]
-        Sm[2][2] = S[2]
-        S = Sm
-        R = self._fromEulerAngles(R).to_matrix().to_4x4().transposed()
-        if self.parent:
-            P = self.parent.computeTransform()#.to_4x4()
-        else:
-            P = mathutils.Matrix.Translation((0, 0, 0)).to_4x4()
-        M = mathutils.Matrix.Translation((0, 0, 0)).to_4x4()
-
-        # Apply transformations. (order is important!)
-        M = M * S
-        M = M * R
-        M = M * T
-        M = M * P
-
-        #log.debug("Final bone transform %s: %s", self.name, M)
-        return M
-
-
-    def _fromAxisAngle(self, axis, angle):
-        return mathutils.Quaternion((
-            math.cos(angle / 2),
-            axis[0] * math.sin(angle / 2),
-            axis[1] * math.sin(angle / 2),
-            axis[2] * math.sin(angle / 2),
-        ))
-
-    def _fromEulerAngles(self, rot):
-        x = self._fromAxisAngle((1,0,0), rot[0])
-        y = self._fromAxisAngle((0,1,0), rot[1])
-        z = self._fromAxisAngle((0,0,1), rot[2])
-        #q = x * y * z
-        q = z * y * x
-        if q.w < 0: q *= -1
-        return q
+    def computeTransform(self) -> np.ndarray:
+        """Compute final transformation matrix.
+
+        Returns a 4x4 array, laid out to be multiplied by row vectors.
+        Uses the skeleton's cached matrices; see
+        `FSKL.computeWorldTransforms()`.
+        """
+        idx = self.fskl._updateBone(self)
+        return self.fskl.worldMtxs[idx].copy()
+
+
+    def computeLocalTransform(self) -> np.ndarray:
+        """Compute transformation matrix relative to the parent bone.
+
+        The final matrix is this times the parent's final matrix.
+        """
+        idx = self.fskl._updateBone(self)
+        return self.fskl.localMtxs[idx].copy()
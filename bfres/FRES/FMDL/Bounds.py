@@ -0,0 +1,164 @@
+"""Compute and check the bounding volumes of shapes.
+
+Each FSHP stores a bounding box (center and extent) for each
+submesh of its first LOD, plus one for the whole shape, and a
+bounding sphere radius for each LOD, around its box's center.
+"""
+import logging; log = logging.getLogger(__name__)
+import numpy as np
+
+# max difference allowed between stored and computed bounds,
+# relative to the size of the shape.
+DEFAULT_TOLERANCE = 1e-3
+
+
+def computeBounds(positions, idxs, ranges) -> dict:
+    """Compute the bounds of index ranges.
+
+    positions: Array of shape (num_vtxs, 3+).
+    idxs:      Index buffer.
+    ranges:    List of (offset, count) into `idxs`, eg submeshes.
+    Returns dict of arrays, one item per range:
+        'center': Center of the bounding box.
+        'extent': Half the size of the bounding box.
+        'radius': Radius of the smallest sphere around the center
+            that contains the vertices.
+    Empty ranges have all zeros.
+    """
+    positions = np.asarray(positions, dtype=np.float64)[:, 0:3]
+    idxs   = np.asarray(idxs).reshape(-1)
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    n      = len(ranges)
+    center = np.zeros((n, 3))
+    extent = np.zeros((n, 3))
+    radius = np.zeros(n)
+
+    offs, counts = ranges[:, 0], ranges[:, 1]
+    counts = np.clip(counts, 0, np.maximum(len(idxs) - offs, 0))
+    used   = counts > 0
+    if not used.any():
+        return {'center':center, 'extent':extent, 'radius':radius}
+
+    # gather every range's indices into one array, so each
+    # reduction is done over all ranges at once.
+    offs, counts = offs[used], counts[used]
+    starts = np.cumsum(counts) - counts
+    sel  = np.arange(counts.sum()) + np.repeat(offs - starts, counts)
+    pts  = positions[idxs[sel]]
+    lo   = np.minimum.reduceat(pts, starts)
+    hi   = np.maximum.reduceat(pts, starts)
+    mid  = (lo + hi) / 2
+    dist = np.sqrt(((pts - np.repeat(mid, counts, axis=0)) ** 2).sum(axis=1))
+
+    center[used] = mid
+    extent[used] = (hi - lo) / 2
+    radius[used] = np.maximum.reduceat(dist, starts)
+    return {'center':center, 'extent':extent, 'radius':radius}
+
+
+def computeShapeBounds(fshp) -> dict:
+    """Compute the bounds a FSHP should have.
+
+    Returns dict:
+        'bbox':      Array of shape (n, 2, 3) of the center and
+            extent of each of LOD 0's submeshes, then the whole shape,
+            like `FSHP.bbox`.
+        'radius':    Array of the smallest bounding sphere radius of
+            each LOD, like `FSHP.bradius`.
+        'maxRadius': Array of the radius of the sphere around each
+            LOD's bounding box, the largest one that makes sense.
+        'submeshes': List of `computeBounds` results for each LOD's
+            submeshes.
+    """
+    positions = fshp.fvtx.attrData['_p0']
+    subs = []
+    for lod in fshp.lods:
+        # the reader reads one more submesh than the header says.
+        ranges = [(s['offset'], s['count'])
+            for s in lod.submeshes[0:lod.header['submesh_cnt']]]
+        subs.append(computeBounds(positions, lod.idx_buf, ranges))
+
+    allIdxs = np.concatenate([np.zeros(0, dtype=np.int64)] +
+        [lod.idx_buf for lod in fshp.lods])
+    whole = computeBounds(positions, allIdxs, [(0, len(allIdxs))])
+    lods  = [computeBounds(positions, lod.idx_buf, [(0, len(lod.idx_buf))])
+        for lod in fshp.lods]
+
+    if subs: first = subs[0]
+    else: first = {'center':np.zeros((0, 3)), 'extent':np.zeros((0, 3))}
+    bbox = np.stack((
+        np.concatenate((first['center'], whole['center'])),
+        np.concatenate((first['extent'], whole['extent'])),
+    ), axis=1)
+    return {
+        'bbox':      bbox,
+        'radius':    np.array([b['radius'][0] for b in lods]),
+        'maxRadius': np.array([np.sqrt((b['extent'][0] ** 2).sum())
+            for b in lods]),
+        'submeshes': subs,
+    }
+
+
+def checkShapeBounds(fshp, tolerance=DEFAULT_TOLERANCE) -> list:
+    """Compare a FSHP's stored bounds to the ones computed from
+    its vertices.
+
+    tolerance: Max difference allowed, relative to the shape's size.
+    A radius matches if the sphere contains the vertices and is no
+    bigger than the one around their bounding box.
+    Returns list of mismatches, as dicts:
+        'shape':    Shape name.
+        'what':     'center', 'extent', 'radius' or 'count'.
+        'index':    Index of the bounding box, or LOD for radii.
+        'stored':   Value in the file.
+        'computed': Value computed from the vertices.
+    """
+    res   = []
+    calc  = computeShapeBounds(fshp)
+    size  = 2 * np.sqrt((calc['bbox'][-1, 1] ** 2).sum())
+    atol  = tolerance * (size if size > 0 else 1)
+    def add(what, index, stored, computed):
+        res.append({'shape':fshp.name, 'what':what, 'index':index,
+            'stored':stored, 'computed':computed})
+
+    bbox = fshp.bbox
+    if bbox is None:
+        add('count', 'bbox', 0, len(calc['bbox']))
+    else:
+        if len(bbox) != len(calc['bbox']):
+            add('count', 'bbox', len(bbox), len(calc['bbox']))
+        n    = min(len(bbox), len(calc['bbox']))
+        diff = np.abs(bbox[0:n] - calc['bbox'][0:n]).max(axis=2)
+        for i, j in zip(*np.nonzero(diff > atol)):
+            add(('center', 'extent')[j], int(i),
+                bbox[i, j].tolist(), calc['bbox'][i, j].tolist())
+
+    radius = fshp.bradius
+    if radius is None:
+        add('count', 'radius', 0, len(calc['radius']))
+    else:
+        if len(radius) != len(calc['radius']):
+            add('count', 'radius', len(radius), len(calc['radius']))
+        n   = min(len(radius), len(calc['radius']))
+        bad = ((radius[0:n] < calc['radius'][0:n] - atol) |
+            (radius[0:n] > calc['maxRadius'][0:n] + atol))
+        for i in np.nonzero(bad)[0]:
+            add('radius', int(i), float(radius[i]), float(calc['radius'][i]))
+
+    for m in res:
+        log.warning("Shape %s %s %s: stored %s, computed %s", m['shape'],
+            m['what'], m['index'], m['stored'], m['computed'])
+    return res
+
+
+def checkShapes(fshps, tolerance=DEFAULT_TOLERANCE) -> list:
+    """Check the bounds of several FSHPs.
+
+    Returns list of mismatches of all of them, as from
+    `checkShapeBounds`.
+    """
+    res = []
+    for fshp in fshps: res += checkShapeBounds(fshp, tolerance)
+    log.info("Checked bounds of %d shapes: %d mismatches", len(fshps),
+        len(res))
+    return res
@@ -23,6 +23,11 @@ class Buffer:
                 size, len(self.data))
             raise MalformedFileError("Buffer data out of bounds")
 
+        self._makeViews()
+
+
+    def _makeViews(self):
+        """Make the views of the data as various types."""
         fmts = {
               'int8': 'b',
              'uint8': 'B',
@@ -48,6 +53,22 @@ class Buffer:
                 pass
 
 
+    def __getstate__(self):
+        # the views are rebuilt on load.
+        return {
+            'file':   None,
+            'size':   self.size,
+            'stride': self.stride,
+            'offset': self.offset,
+            'data':   self.data,
+        }
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._makeViews()
+
+
     def dump(self):
         """Dump to string for debug."""
         data = []
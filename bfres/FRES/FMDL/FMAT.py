@@ -6,7 +6,9 @@ from bfres.BinaryStruct.Switch import Offset32, Offset64, String
 from bfres.BinaryFile import BinaryFile
 from bfres.FRES.FresObject import FresObject
 from bfres.FRES.Dict import Dict
+from bfres.Exceptions import MalformedFileError
 import struct
+import numpy as np
 
 
 shaderParamTypes = {
@@ -21,6 +23,35 @@ shaderParamTypes = {
 }
 
 
+# one entry of the shader param array.
+shaderParamFields = (
+    ('unk00',  'u8'), # always 0
+    ('name',   'u8'), # -> name
+    ('type',   'u1'), # key of shaderParamTypes
+    ('size',   'u1'),
+    ('offset', 'u2'), # offset in shader param data
+    ('unk14',  'i4'), # always -1
+    ('idx0',   'u2'), # both always == index
+    ('idx1',   'u2'),
+    ('unk1C',  'u4'),
+)
+
+# one entry of the render param array.
+renderParamFields = (
+    ('name',  'u8'), # -> name
+    ('offs',  'u8'), # -> values
+    ('count', 'u2'),
+    ('type',  'u2'), # index in renderParamTypes
+    ('pad',   'u4'),
+)
+renderParamTypes = ('float[2]', 'float', 'str')
+
+
+def _makeDtype(fields, byteOrderFmt):
+    """Make a numpy dtype from a field list, in the given byte order."""
+    return np.dtype([(name, byteOrderFmt + typ) for name, typ in fields])
+
+
 class ShaderAssign(BinaryStruct):
     fields = (
         String  ('name'),  Padding(4),
@@ -78,9 +109,36 @@ class Header(BinaryStruct):
 
 
 class FMAT(FresObject):
-    """A material object in an FRES."""
+    """A material object in an FRES.
+
+    Only the header and texture list are read up front. Other
+    sections are read when one of their attributes is first
+    accessed; see `_sections`.
+    """
     Header = Header
 
+    # attribute => method that reads it.
+    _sections = {
+        'render_param_dict': '_readDicts',
+        'sampler_dict':      '_readDicts',
+        'shader_param_dict': '_readDicts',
+        'user_data_dict':    '_readDicts',
+        'renderParams':      '_readRenderParams',
+        'shaderParamTable':  '_readShaderParams',
+        'shaderParamData':   '_readShaderParams',
+        'shaderParamNames':  '_readShaderParams',
+        '_shaderParamIdxs':  '_readShaderParams',
+        'shaderParams':      '_makeShaderParams',
+        'samplerData':       '_readSamplerList',
+        'samplerSlots':      '_readSamplerList',
+        'samplers':          '_makeSamplers',
+        'shader_assign':     '_readShaderAssign',
+        'vtxAttrs':          '_readShaderAssign',
+        'texAttrs':          '_readShaderAssign',
+        'mat_param_dict':    '_readShaderAssign',
+        'materialParams':    '_readMaterialParams',
+    }
+
     def __init__(self, fres):
         self.fres         = fres
         self.header       = None
@@ -96,6 +154,39 @@ class FMAT(FresObject):
         )
 
 
+    def __getattr__(self, name):
+        # only called for attributes that aren't set yet.
+        reader = type(self)._sections.get(name, None)
+        if reader is None or self.__dict__.get('header', None) is None:
+            raise AttributeError("'%s' object has no attribute '%s'" % (
+                type(self).__name__, name))
+        getattr(self, reader)()
+        return self.__dict__[name]
+
+
+    def __getstate__(self):
+        # a saved FMAT has no file to read from later.
+        self.readAll()
+        return self.__dict__
+
+
+    def readAll(self):
+        """Read all sections that haven't been read yet."""
+        for name in self._sections: getattr(self, name)
+        return self
+
+
+    def getShaderParam(self, name):
+        """Get the value of a shader param.
+
+        Returns a tuple, or None if there is no such param.
+        Only this param is unpacked.
+        """
+        idx = self._shaderParamIdxs.get(name, None)
+        if idx is None: return None
+        return self._unpackShaderParam(idx)
+
+
     def dump(self):
         """Dump to string for debug."""
         dicts = ('render_param', 'sampler', 'shader_param', 'user_data')
@@ -164,17 +255,28 @@ class FMAT(FresObject):
         self.headerOffset = offset
         self.header = self.fres.read(Header(), offset)
         self.name   = self.header['name']
-
-        self._readDicts()
-        self._readRenderParams()
-        self._readShaderParams()
         self._readTextureList()
-        self._readSamplerList()
-        self._readShaderAssign()
-
         return self
 
 
+    def _readArray(self, offset, count, dtype):
+        """Read `count` items of `dtype` from the file."""
+        dtype = np.dtype(dtype)
+        if count == 0: return np.zeros(0, dtype)
+        size = count * dtype.itemsize
+        data = self.fres.read(size, offset)
+        if len(data) < size:
+            raise MalformedFileError("FMAT '%s': array at 0x%X is out of bounds"
+                % (self.name, offset))
+        return np.frombuffer(data, dtype)
+
+
+    def _readStrs(self, offset, count):
+        """Read `count` strings from an array of offsets."""
+        offsets = self._readArray(offset, count, self.fres.byteOrderFmt+'u8')
+        return [self.fres.readStr(int(offs)) for offs in offsets]
+
+
     def _readDicts(self):
         """Read the dicts."""
         dicts = ('render_param', 'sampler', 'shader_param', 'user_data')
@@ -187,121 +289,156 @@ class FMAT(FresObject):
 
     def _readDict(self, offs, name):
         """Read a Dict."""
-        d = Dict(self.fres).readFromFRES(offs)
-        return d
+        return self.fres.resolve(Dict, offs)
 
 
     def _readRenderParams(self):
         """Read the render params list."""
-        self.renderParams = {}
-        types = ('float[2]', 'float', 'str')
-        base  = self.header['render_param_offs']
-
-        for i in range(self.header['render_param_cnt']):
-            name, offs, cnt, typ, pad = self.fres.read(
-                'QQHHI', base + (i*24))
-            name = self.fres.readStr(name)
-
-            if pad != 0:
+        renderParams = {}
+        bo    = self.fres.byteOrderFmt
+        table = self._readArray(self.header['render_param_offs'],
+            self.header['render_param_cnt'],
+            _makeDtype(renderParamFields, bo))
+
+        for entry in table:
+            name = self.fres.readStr(int(entry['name']))
+            offs, cnt, typ = int(entry['offs']), int(entry['count']), \
+                int(entry['type'])
+            if entry['pad'] != 0:
                 log.warning("FRES: FMAT Render info '%s' padding=0x%X",
-                    name, pad)
-            try: typeName = types[typ]
+                    name, entry['pad'])
+            try: typeName = renderParamTypes[typ]
             except IndexError: typeName = '0x%X' % typ
 
-            param = {
+            if typ == 0:
+                vals = self._readArray(offs, cnt * 2, bo+'f4')
+                vals = [tuple(v) for v in vals.reshape(cnt, 2).tolist()]
+            elif typ == 1:
+                vals = self._readArray(offs, cnt, bo+'f4').tolist()
+            elif typ == 2:
+                vals = self._readStrs(offs, cnt)
+            else:
+                log.warning("FMAT Render param '%s' unknown type 0x%X",
+                    name, typ)
+                vals = ['<unknown>'] * cnt
+
+            if name in renderParams:
+                log.warning("FMAT: Duplicate render param '%s'", name)
+            renderParams[name] = {
                 'name':  name,
                 'count': cnt,
-                'type':  types[typ],
-                'vals':  [],
+                'type':  typeName,
+                'vals':  vals,
             }
-            for j in range(cnt):
-                if   typ == 0: val=self.fres.read('2f', offs)
-                elif typ == 1: val=self.fres.read('f',  offs)
-                elif typ == 2:
-                    offs = self.fres.read('Q', offs)
-                    val  = self.fres.readStr(offs)
-                else:
-                    log.warning("FMAT Render param '%s' unknown type 0x%X",
-                        name, typ)
-                    val = '<unknown>'
-                param['vals'].append(val)
-
-            #log.debug("Render param: %-5s[%d] %-32s: %s",
-            #    typeName, cnt, name, ', '.join(map(str, param['vals'])))
-
-            if name in self.renderParams:
-                log.warning("FMAT: Duplicate render param '%s'", name)
-            self.renderParams[name] = param
+        self.renderParams = renderParams
 
 
     def _readShaderParams(self):
-        """Read the shader param list."""
-        self.shaderParams = {}
-        #print("FRES: FMAT Shader params:")
-
-        array_offs = self.header['shader_param_array_offs']
-        data_offs  = self.header['shader_param_data_offs']
-        for i in range(self.header['shader_param_cnt']):
-            # unk0: always 0; unk14: always -1
-            # idx0, idx1: both always == i
-            unk0, name, type, size, offset, unk14, idx0, idx1 = \
-                self.fres.read('QQBBHiHH', array_offs + (i*32))
-
-            name = self.fres.readStr(name)
-            type = shaderParamTypes[type]
-            if unk0:
-                log.debug("Shader param '%s' unk0=0x%X", name, unk0)
-            if unk14 != -1:
-                log.debug("Shader param '%s' unk14=%d", name, unk14)
-            if idx0 != i or idx1 != i:
-                log.debug("Shader param '%s' idxs=%d, %d (expected %d)",
-                    name, idx0, idx1, i)
-
-            data = self.fres.read(size, data_offs + offset)
-            data = struct.unpack(type['fmt'], data)
-
-            #log.debug("%-38s %-5s %s", name, type['name'],
-            #    type['outfmt'] % data)
-
-            if name in self.shaderParams:
+        """Read the shader param table and data.
+
+        The values stay packed in `shaderParamData` until they're
+        asked for, by `getShaderParam` or `shaderParams`.
+        """
+        table = self._readArray(self.header['shader_param_array_offs'],
+            self.header['shader_param_cnt'],
+            _makeDtype(shaderParamFields, self.fres.byteOrderFmt))
+        size = self.header['shader_param_data_size']
+        data = self.fres.read(size, self.header['shader_param_data_offs']) \
+            if size else b''
+
+        names = [self.fres.readStr(int(offs)) for offs in table['name']]
+        idxs  = {}
+        for i, name in enumerate(names):
+            if name in idxs:
                 log.warning("Duplicate shader param '%s'", name)
-
-            self.shaderParams[name] = {
+            idxs[name] = i
+
+        # unk00: always 0; unk14: always -1; idx0, idx1: both always == i
+        expected = np.arange(len(table))
+        odd = (table['unk00'] != 0) | (table['unk14'] != -1) | \
+            (table['idx0'] != expected) | (table['idx1'] != expected)
+        for i in np.nonzero(odd)[0]:
+            log.debug("Shader param '%s' unk00=0x%X unk14=%d idxs=%d, %d",
+                names[i], table['unk00'][i], table['unk14'][i],
+                table['idx0'][i], table['idx1'][i])
+        end = table['offset'].astype(int) + table['size']
+        for i in np.nonzero(end > len(data))[0]:
+            log.warning("Shader param '%s' data is out of bounds", names[i])
+
+        self.shaderParamTable = table
+        self.shaderParamData  = data
+        self.shaderParamNames = names
+        self._shaderParamIdxs = idxs
+
+
+    def _getShaderParamType(self, typ):
+        """Get the shaderParamTypes entry for a type ID."""
+        res = shaderParamTypes.get(typ, None)
+        if res is None:
+            res = {'fmt':None, 'name':'0x%02X' % typ, 'outfmt':'%s'}
+        return res
+
+
+    def _unpackShaderParam(self, idx):
+        """Unpack the value of the shader param at index `idx`."""
+        entry = self.shaderParamTable[idx]
+        typ   = self._getShaderParamType(int(entry['type']))
+        offs  = int(entry['offset'])
+        data  = self.shaderParamData[offs : offs + int(entry['size'])]
+        if typ['fmt'] is None: return tuple(data)
+        fmt = self.fres.byteOrderFmt + typ['fmt']
+        if len(data) != struct.calcsize(fmt):
+            log.warning("Shader param '%s' is %d bytes, expected %d",
+                self.shaderParamNames[idx], len(data), struct.calcsize(fmt))
+            return tuple(data)
+        return struct.unpack(fmt, data)
+
+
+    def _makeShaderParams(self):
+        """Build the dict of all shader params."""
+        shaderParams = {}
+        for i, entry in enumerate(self.shaderParamTable):
+            name = self.shaderParamNames[i]
+            shaderParams[name] = {
                 'name':   name,
-                'type':   type,
-                'size':   size,
-                'offset': offset,
-                'idxs':   (idx0, idx1),
-                'unk00':  unk0,
-                'unk14':  unk14,
-                'data':   data,
+                'type':   self._getShaderParamType(int(entry['type'])),
+                'size':   int(entry['size']),
+                'offset': int(entry['offset']),
+                'idxs':   (int(entry['idx0']), int(entry['idx1'])),
+                'unk00':  int(entry['unk00']),
+                'unk14':  int(entry['unk14']),
+                'data':   self._unpackShaderParam(i),
             }
+        self.shaderParams = shaderParams
 
 
     def _readTextureList(self):
         """Read the texture list."""
-        self.textures = []
-        for i in range(self.header['tex_ref_cnt']):
-            offs = self.header['tex_ref_array_offs'] + (i*8)
-            offs = self.fres.read('Q', offs)
-            name = self.fres.readStr(offs)
-            slot = self.fres.read('q',
-                self.header['tex_slot_offs'] + (i*8))
-            #log.debug("%3d (%2d): %s", i, slot, name)
-            self.textures.append({'name':name, 'slot':slot})
+        cnt   = self.header['tex_ref_cnt']
+        names = self._readStrs(self.header['tex_ref_array_offs'], cnt)
+        slots = self._readArray(self.header['tex_slot_offs'], cnt,
+            self.fres.byteOrderFmt+'i8')
+        self.textures = [{'name':name, 'slot':int(slot)}
+            for name, slot in zip(names, slots)]
 
 
     def _readSamplerList(self):
         """Read the sampler list."""
-        self.samplers = []
-        for i in range(self.header['sampler_cnt']):
-            data = self.fres.readHexWords(8,
-                self.header['sampler_list_offs'] + (i*32))
-            slot = self.fres.read('q',
-                self.header['sampler_slot_offs'] + (i*8))
-            #log.debug("%3d (%2d): %s", i, slot, data)
-            self.samplers.append({'slot':slot, 'data':data})
-            # XXX no idea what to do with this data
+        # XXX no idea what to do with this data
+        bo  = self.fres.byteOrderFmt
+        cnt = self.header['sampler_cnt']
+        self.samplerData = self._readArray(self.header['sampler_list_offs'],
+            cnt * 8, bo+'u4').reshape(cnt, 8)
+        self.samplerSlots = self._readArray(self.header['sampler_slot_offs'],
+            cnt, bo+'i8')
+
+
+    def _makeSamplers(self):
+        """Build the list of samplers."""
+        self.samplers = [{
+            'slot': int(slot),
+            'data': ' '.join('%08X' % word for word in data),
+        } for slot, data in zip(self.samplerSlots, self.samplerData)]
 
 
     def _readShaderAssign(self):
@@ -310,29 +447,24 @@ class FMAT(FresObject):
         assign = assign.readFromFile(self.fres.file,
             self.header['shader_assign_offs'])
         self.shader_assign = assign
-
-        self.vtxAttrs = []
-        for i in range(assign['num_vtx_attrs']):
-            offs = self.fres.read('Q', assign['vtx_attr_names']+(i*8))
-            name = self.fres.readStr(offs)
-            self.vtxAttrs.append(name)
-
-        self.texAttrs = []
-        for i in range(assign['num_tex_attrs']):
-            offs = self.fres.read('Q', assign['tex_attr_names']+(i*8))
-            name = self.fres.readStr(offs)
-            self.texAttrs.append(name)
-
+        self.vtxAttrs = self._readStrs(assign['vtx_attr_names'],
+            assign['num_vtx_attrs'])
+        self.texAttrs = self._readStrs(assign['tex_attr_names'],
+            assign['num_tex_attrs'])
         self.mat_param_dict = self._readDict(
             assign['mat_param_dict'], "mat_params")
-        self.materialParams = {}
-        #log.debug("material params:")
-        for i in range(assign['num_mat_params']):
+
+
+    def _readMaterialParams(self):
+        """Read the material params."""
+        assign = self.shader_assign
+        vals   = self._readStrs(assign['mat_param_vals'],
+            assign['num_mat_params'])
+        materialParams = {}
+        for i, val in enumerate(vals):
             name = self.mat_param_dict.nodes[i+1].name
-            offs = self.fres.read('Q', assign['mat_param_vals']+(i*8))
-            val  = self.fres.readStr(offs)
-            #log.debug("%-40s: %s", name, val)
-            if name in self.materialParams:
+            if name in materialParams:
                 log.warning("FMAT: duplicate mat_param '%s'", name)
             if name != '':
-                self.materialParams[name] = val
+                materialParams[name] = val
+        self.materialParams = materialParams
@@ -12,6 +12,7 @@ from .FVTX      import FVTX
 from .LOD       import LOD
 from .Vertex    import Vertex
 import struct
+import numpy as np
 
 
 class Header(BinaryStruct):
@@ -31,11 +32,9 @@ class Header(BinaryStruct):
         Offset64('unk38'), # 0x38; 0
 
         # bounding box and bounding radius
-        Offset64('bbox_offset'), # 0x40 => ~24 floats / 8 Vec3s / 6 Vec4s
-        Offset64('bradius_offset'), # 0x48 => => 3F03ADA8 3EFC1658 00000000 00000D14  00000000 00000000 00000000 00000000
-            # as floats:
-            # 3F03ADA8 = 0.5143685340881348
-            # 3EFC1658 = 0.4923579692840576
+        Offset64('bbox_offset'), # 0x40 => (center, extent) Vec3s for
+            # each submesh of LOD 0, then for the whole shape
+        Offset64('bradius_offset'), # 0x48 => one float per LOD
 
         Offset64('unk50'), # 0x50
         ('I',    'flags'), # 0x58
@@ -60,12 +59,25 @@ class FSHP(FresObject):
 
     def __init__(self, fres):
         self.fres         = fres
-        self.fvtx         = None
         self.lods         = None
+        self.bbox         = None
+        self.bradius      = None
         self.header       = None
         self.headerOffset = None
 
 
+    def __getattr__(self, name):
+        # only called for attributes that aren't set yet. the FVTX
+        # is read when it's first used, if it wasn't read with the
+        # shape.
+        if name != 'fvtx':
+            raise AttributeError("'%s' object has no attribute '%s'" % (
+                type(self).__name__, name))
+        if self.__dict__.get('header', None) is None: return None
+        self.fvtx = self.fres.resolve(FVTX, self.header['fvtx_offset'])
+        return self.fvtx
+
+
     def __str__(self):
         return "<FSHP(@%s) at 0x%x>" %(
             '?' if self.headerOffset is None else hex(self.headerOffset),
@@ -87,24 +99,47 @@ class FSHP(FresObject):
         return res
 
 
-    def readFromFRES(self, offset=None):
-        """Read this object from given file."""
+    def readFromFRES(self, offset=None, readVtxs=True):
+        """Read this object from given file.
+
+        readVtxs: Whether to read the FVTX now. Otherwise it's read
+            when `fvtx` is first used.
+        """
         if offset is None: offset = self.fres.file.tell()
         log.debug("Reading FSHP from 0x%06X", offset)
         self.headerOffset = offset
         self.header = self.fres.read(Header(), offset)
         self.name   = self.header['name']
 
-        # read FVTX
-        self.fvtx = FVTX(self.fres).readFromFRES(
-            self.header['fvtx_offset'])
+        # get FVTX; the FMDL shares the same one.
+        if readVtxs:
+            self.fvtx = self.fres.resolve(FVTX, self.header['fvtx_offset'])
 
         # read LODs
         self.lods = []
         offs = self.header['lod_offset']
         for i in range(self.header['lod_cnt']):
-            model = LOD(self.fres).readFromFRES(offs)
+            model = self.fres.resolve(LOD, offs)
             offs += LOD.Header.size
             self.lods.append(model)
 
+        self._readBounds()
         return self
+
+
+    def _readBounds(self):
+        """Read the bounding boxes and radii.
+
+        `bbox` is an array of shape (n, 2, 3) of the center and
+        extent of each box; `bradius` is an array of the bounding
+        sphere radius of each LOD. Either is None if not present.
+        """
+        fmt = self.fres.byteOrderFmt + 'f4'
+        if self.header['bbox_offset'] and self.lods:
+            cnt  = self.lods[0].header['submesh_cnt'] + 1
+            data = self.fres.read(cnt * 6 * 4, self.header['bbox_offset'])
+            self.bbox = np.frombuffer(data, fmt).reshape(cnt, 2, 3)
+        if self.header['bradius_offset']:
+            cnt  = self.header['lod_cnt']
+            data = self.fres.read(cnt * 4, self.header['bradius_offset'])
+            self.bradius = np.frombuffer(data, fmt)
@@ -8,8 +8,10 @@ from bfres.BinaryFile import BinaryFile
 from bfres.FRES.FresObject import FresObject
 from bfres.FRES.Dict import Dict
 from .Bone import Bone
+from . import Transform
 import struct
 import math
+import numpy as np
 
 
 class Header(BinaryStruct):
@@ -44,6 +46,15 @@ class Header(BinaryStruct):
     size = 0x48
 
 
+def _boneKey(bone):
+    """Get the values that a bone's transform depends on.
+
+    The parent must be last.
+    """
+    return (tuple(bone.pos), tuple(bone.rot), tuple(bone.scale),
+        bone.flags['_raw'], id(bone.parent))
+
+
 class FSKL(FresObject):
     """A skeleton in an FRES."""
     Header = Header
@@ -52,6 +63,13 @@ class FSKL(FresObject):
         self.fres         = fres
         self.header       = None
         self.headerOffset = None
+        self.bones        = []
+        self.localMtxs    = None # bone idx => local transform
+        self.worldMtxs    = None # bone idx => final transform
+        self._boneKeys    = []
+        self._levels      = None
+        self._parentIdxs  = None
+        self.mtxToBone    = np.zeros(0, dtype=np.int64)
 
 
     def __str__(self):
@@ -115,38 +133,71 @@ class FSKL(FresObject):
 
 
     def _readSmoothIdxs(self):
-        """Read smooth matrix indices."""
-        self.smooth_idxs = self.fres.read('h',
-            pos   = self.header['smooth_idx_offs'],
-            count = self.header['num_smooth_idxs'])
+        """Read the matrix index => bone index table.
+
+        The smooth matrices come first, then the rigid ones.
+        """
+        nSmooth = self.header['num_smooth_idxs']
+        nRigid  = self.header['num_rigid_idxs']
+        data = self.fres.read(2 * (nSmooth + nRigid),
+            self.header['smooth_idx_offs'])
+        self.mtxToBone   = np.frombuffer(data,
+            self.fres.byteOrderFmt + 'i2').astype(np.int64)
+        self.smooth_idxs = self.mtxToBone[0:nSmooth]
+        self.rigid_idxs  = self.mtxToBone[nSmooth:]
 
 
     def _readSmoothMtxs(self):
-        """Read smooth matrices."""
-        self.smooth_mtxs = []
-        if len(self.smooth_idxs) == 0:
+        """Read smooth matrices.
+
+        These are the inverse bind matrices of the smooth matrices,
+        as an array of shape (num_smooth_idxs, 4, 3), laid out to be
+        multiplied by row vectors.
+        """
+        cnt = self.header['num_smooth_idxs']
+        if cnt == 0:
             log.info("no smooth idxs")
+            self.smooth_mtxs = np.zeros((0, 4, 3), dtype=np.float32)
             return
 
-        for i in range(max(self.smooth_idxs)):
-            # read the matrix
-            mtx = self.fres.read('3f', count = 4,
-                pos = self.header['smooth_mtx_offs'] + (i*16*3))
+        data = self.fres.read(cnt * 4 * 3 * 4,
+            self.header['smooth_mtx_offs'])
+        # they're stored as 3 rows of 4 for column vectors;
+        # transpose to match the other matrices.
+        mtxs = np.frombuffer(data, self.fres.byteOrderFmt + 'f4')
+        mtxs = mtxs.reshape(cnt, 3, 4).transpose(0, 2, 1).copy()
+
+        # warn about invalid values, and replace them with zeros
+        bad = ~np.isfinite(mtxs)
+        for i, y, x in zip(*np.nonzero(bad)):
+            log.warning("Skeleton smooth mtx %d element [%d,%d] is %s",
+                i, x, y, mtxs[i, y, x])
+        mtxs[bad] = 0
+        self.smooth_mtxs = mtxs
+
 
-            # warn about invalid values
-            for y in range(4):
-                for x in range(3):
-                    n = mtx[y][x]
-                    if math.isnan(n) or math.isinf(n):
-                        log.warning("Skeleton smooth mtx %d element [%d,%d] is %s",
-                            i, x, y, n)
+    @property
+    def invBindMtxs(self) -> np.ndarray:
+        """The smooth matrices as an array of shape (n, 4, 4)."""
+        res = np.zeros((len(self.smooth_mtxs), 4, 4))
+        res[:, :, 0:3] = self.smooth_mtxs
+        res[:, 3, 3]   = 1
+        return res
 
-            # replace all invalid values with zeros
-            flt = lambda e: \
-                0 if (math.isnan(e) or math.isinf(e)) else e
-            mtx = list(map(lambda row: list(map(flt, row)), mtx))
 
-            self.smooth_mtxs.append(mtx)
+    def remapIndices(self, idxs) -> np.ndarray:
+        """Convert vertices' matrix indices (`_i0` attribute values)
+        to bone indices.
+
+        idxs: Array of matrix indices, of any shape.
+        Returns array of bone indices of the same shape, with -1
+        for indices that aren't in the table.
+        """
+        idxs  = np.asarray(idxs, dtype=np.int64)
+        table = self.mtxToBone
+        valid = (idxs >= 0) & (idxs < len(table))
+        if len(table) == 0: return np.full(idxs.shape, -1)
+        return np.where(valid, table[np.where(valid, idxs, 0)], -1)
 
 
     def _readBones(self):
@@ -158,7 +209,8 @@ class FSKL(FresObject):
 
         # read the bones
         for i in range(self.header['num_bones']):
-            b = Bone(self.fres).readFromFRES(offs)
+            b = self.fres.resolve(Bone, offs)
+            b.index = i
             self.bones.append(b)
             if b.name in self.bonesByName:
                 log.warning("Duplicate bone name '%s'", b.name)
@@ -177,5 +229,145 @@ class FSKL(FresObject):
             else:
                 bone.parent = None
 
-        self.boneIdxGroups = Dict(self.fres).readFromFRES(
+        self.boneIdxGroups = self.fres.resolve(Dict,
             self.header['bone_idx_group_offs'])
+
+
+    def computeWorldTransforms(self) -> np.ndarray:
+        """Compute every bone's final transformation matrix.
+
+        Returns an array of shape (num_bones, 4, 4), laid out like
+        `Bone.computeLocalTransform()`. The local matrices are
+        kept in `localMtxs`.
+
+        Results are cached; only bones that changed since the last
+        call, and their descendants, are recomputed.
+        """
+        n = len(self.bones)
+        keys = [_boneKey(bone) for bone in self.bones]
+        if self.worldMtxs is None or len(self._boneKeys) != n \
+        or any(k[-1] != old[-1] for k, old in zip(keys, self._boneKeys)):
+            # the hierarchy itself changed.
+            self.localMtxs = np.zeros((n, 4, 4))
+            self.worldMtxs = np.zeros((n, 4, 4))
+            self._boneKeys = [None] * n
+            self._computeLevels()
+            for i, bone in enumerate(self.bones): bone.index = i
+
+        parents = self._parentIdxs
+        dirty   = np.array([k != old for k, old in
+            zip(keys, self._boneKeys)], dtype=bool)
+        if not dirty.any(): return self.worldMtxs
+
+        # a scale compensated bone also depends on its parent's scale.
+        comp = np.array([bool(bone.flags['SEG_SCALE_COMPENSATE'])
+            for bone in self.bones], dtype=bool)
+        comp &= parents >= 0
+        dirty[comp] |= dirty[parents[comp]]
+        idxs = np.nonzero(dirty)[0]
+        self.localMtxs[idxs] = self._computeLocalMtxs(idxs)
+
+        # redo everything below a changed bone.
+        Transform.concatHierarchy(self.localMtxs, parents, self._levels,
+            out=self.worldMtxs, dirty=dirty)
+
+        self._boneKeys = keys
+        return self.worldMtxs
+
+
+    def _updateBone(self, bone) -> int:
+        """Make sure a bone's cached matrices are current.
+
+        Only the bone and its ancestors are checked, since its
+        matrices don't depend on any others.
+        Returns the bone's index.
+        """
+        if bone.index is None or bone.index >= len(self.bones) \
+        or self.bones[bone.index] is not bone:
+            bone.index = self.bones.index(bone) # built by hand
+        keys = self._boneKeys
+        b, n = bone, 0
+        while b is not None and n <= len(self.bones):
+            idx = b.index
+            if self.worldMtxs is None or idx is None or idx >= len(keys) \
+            or keys[idx] != _boneKey(b):
+                self.computeWorldTransforms()
+                break
+            b  = b.parent
+            n += 1
+        return bone.index
+
+
+    @property
+    def parentIdxs(self) -> np.ndarray:
+        """Index of each bone's parent, or -1 if none."""
+        self.computeWorldTransforms() # make sure it's up to date
+        return self._parentIdxs
+
+
+    def computePoseTransforms(self, pos=None, rot=None, scale=None) \
+    -> np.ndarray:
+        """Compute every bone's final transformation matrix for a pose.
+
+        pos:   Array of shape (num_bones, 3) of bone positions.
+        rot:   Array of shape (num_bones, 3) of Euler rotations.
+        scale: Array of shape (num_bones, 3) of bone scales.
+        Any not given are taken from the bones.
+
+        Returns an array of shape (num_bones, 4, 4), like
+        `computeWorldTransforms()`, but doesn't cache it.
+        """
+        self.computeWorldTransforms() # make sure hierarchy is current
+        idxs  = np.arange(len(self.bones))
+        local = self._computeLocalMtxs(idxs, pos, rot, scale)
+        return Transform.concatHierarchy(local, self._parentIdxs,
+            self._levels)
+
+
+    def _getBoneValues(self, vals, attr):
+        """Get array of bones' values, if not given."""
+        if vals is None:
+            vals = [getattr(bone, attr)[0:3] for bone in self.bones]
+        return np.array(vals, dtype=float).reshape(len(self.bones), 3)
+
+
+    def _computeLocalMtxs(self, idxs, pos=None, rot=None, scale=None):
+        """Compute local transformation matrices of given bones.
+
+        pos, rot, scale: Values of all bones to use instead of
+            their own.
+        """
+        pos     = self._getBoneValues(pos,   'pos')[idxs]
+        rot     = self._getBoneValues(rot,   'rot')[idxs]
+        scales  = self._getBoneValues(scale, 'scale')
+        scale   = scales[idxs]
+        parents = self._parentIdxs[idxs]
+
+        # why have these flags instead of just setting the
+        # values to 0/1? WTF Nintendo.
+        # they seem to only be set when the values already are
+        # 0 (or 1, for scale) anyway.
+        #if self.flags['NO_ROTATION']:    R = Vec4(0, 0, 0, 1)
+        #if self.flags['NO_TRANSLATION']: T = Vec3(0, 0, 0)
+        #if self.flags['SCALE_VOL_1']:    S = Vec3(1, 1, 1)
+        for i, idx in enumerate(idxs):
+            bone = self.bones[idx]
+            if bone.flags['SEG_SCALE_COMPENSATE']:
+                # apply inverse of parent's scale
+                if parents[i] >= 0:
+                    scale[i] /= scales[parents[i]]
+                else:
+                    log.warning("Bone '%s' has flag SEG_SCALE_COMPENSATE but no parent", bone.name)
+        # no idea what "scale uniformly" actually means.
+        # XXX billboarding, rigid mtxs, if ever used.
+
+        return Transform.composeSRT(scale, Transform.quatFromEuler(rot),
+            pos)
+
+
+    def _computeLevels(self):
+        """Group bones by their depth in the hierarchy."""
+        idxs = {id(bone): i for i, bone in enumerate(self.bones)}
+        self._parentIdxs = np.array([idxs.get(id(bone.parent), -1)
+            for bone in self.bones], dtype=np.int64)
+        self._levels = Transform.hierarchyLevels(self._parentIdxs)
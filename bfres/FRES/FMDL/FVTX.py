@@ -12,6 +12,7 @@ from .Buffer import Buffer
 from .Vertex import Vertex
 import struct
 import math
+import numpy as np
 
 
 class BufferStrideStruct(BinaryStruct):
@@ -70,7 +71,9 @@ class FVTX(FresObject):
         self.headerOffset = None
         self.attrs        = []
         self.buffers      = []
+        self.attrData     = {} # attr name => array of values
         self.vtx_attrib_dict = None
+        self._vtxs        = None
 
 
     def __str__(self):
@@ -143,10 +146,16 @@ class FVTX(FresObject):
         return self
 
 
+    def getAttr(self, name):
+        """Get the Attribute with given name, or None."""
+        node = self.vtx_attrib_dict.find(name)
+        if node is None or node.index >= len(self.attrs): return None
+        return self.attrs[node.index]
+
+
     def _readDicts(self):
         """Read the dicts belonging to this FVTX."""
-        self.vtx_attrib_dict = Dict(self.fres)
-        self.vtx_attrib_dict.readFromFRES(
+        self.vtx_attrib_dict = self.fres.resolve(Dict,
             self.header['vtx_attrib_dict_offs'])
 
 
@@ -197,49 +206,81 @@ class FVTX(FresObject):
             offs += AttrStruct.size
 
 
+    def __getstate__(self):
+        # the Vertex objects are rebuilt from attrData when needed.
+        state = dict(self.__dict__)
+        state['_vtxs'] = None
+        return state
+
+
+    @property
+    def vtxs(self):
+        """The vertices, as Vertex objects.
+
+        These are only built when first accessed; `attrData` holds
+        the same values as arrays.
+        """
+        if self._vtxs is None: self._vtxs = self._makeVtxs()
+        return self._vtxs
+
+
+    def decodeAttr(self, attr) -> np.ndarray:
+        """Decode the values of an attribute for all vertices.
+
+        Returns an array of shape (num_vtxs, components).
+        """
+        if attr.buf_idx >= len(self.buffers) or attr.buf_idx < 0:
+            log.error("Attribute '%s' uses buffer %d, but max index is %d",
+                attr.name, attr.buf_idx, len(self.buffers)-1)
+            raise MalformedFileError("Invalid buffer index for attribute "+attr.name)
+        buf   = self.buffers[attr.buf_idx]
+        fmt   = attr.format
+        count = int(fmt['fmt'][:-1] or 1)
+        dtype = np.dtype('<' + fmt['fmt'][-1])
+        nVtxs = self.header['num_vtxs']
+        if nVtxs == 0: return np.zeros((0, count), dtype)
+
+        end = attr.buf_offs + ((nVtxs-1) * buf.stride) + \
+            (count * dtype.itemsize)
+        if end > len(buf.data):
+            log.error("Attribute '%s' reading out of bounds from buffer %d (%d vtxs, offset 0x%X stride 0x%X fmt '%s', max = 0x%X)",
+                attr.name, attr.buf_idx, nVtxs, attr.buf_offs,
+                buf.stride, fmt['fmt'], len(buf.data))
+            raise MalformedFileError("Invalid buffer offset for attribute "+attr.name)
+
+        data = np.ndarray((nVtxs, count), dtype, buffer=buf.data,
+            offset=attr.buf_offs, strides=(buf.stride, dtype.itemsize))
+        func = fmt.get('arrayFunc', None)
+        if func: data = func(data)
+        else: data = data.copy() # don't keep the buffer alive
+
+        # validate
+        if data.dtype.kind == 'f':
+            bad = np.nonzero(~np.isfinite(data).all(axis=1))[0]
+            if len(bad) > 0:
+                log.warning("%d Inf/NaN values in attribute %s (first at vtx %d, buffer %d base 0x%X)",
+                    len(bad), attr.name, bad[0], attr.buf_idx,
+                    attr.buf_offs)
+        return data
+
+
     def _readVtxs(self):
         """Read the vertices from the buffers."""
-        self.vtxs = []
+        self.attrData = {}
+        self._vtxs    = None
+        for attr in self.attrs:
+            if attr.format is None: continue # already warned about
+            self.attrData[attr.name] = self.decodeAttr(attr)
+
+
+    def _makeVtxs(self):
+        """Build Vertex objects from `attrData`."""
+        attrs = [(attr, self.attrData[attr.name].tolist())
+            for attr in self.attrs if attr.name in self.attrData]
+        vtxs = []
         for iVtx in range(self.header['num_vtxs']):
             vtx = Vertex()
-            for attr in self.attrs: # get the data for each attribute
-                if attr.buf_idx >= len(self.buffers) or attr.buf_idx < 0:
-                    log.error("Attribute '%s' uses buffer %d, but max index is %d",
-                        attr.name, attr.buf_idx, len(self.buffers)-1)
-                    raise MalformedFileError("Invalid buffer index for attribute "+attr.name)
-                buf  = self.buffers[attr.buf_idx]
-                offs = attr.buf_offs + (iVtx * buf.stride)
-                fmt  = attr.format
-                #log.debug("Read attr '%s' from buffer %d, offset 0x%X, stride 0x%X, fmt %s",
-                #    attr.name, attr.buf_idx, attr.buf_offs,
-                #    buf.stride, fmt['name'])
-
-                # get the conversion function if any
-                func = None
-                if type(fmt) is dict:
-                    func = fmt.get('func', None)
-                    fmt  = fmt['fmt']
-
-                # get the data
-                try:
-                    data = struct.unpack_from(fmt, buf.data, offs)
-                except struct.error:
-                    log.error("Attribute '%s' reading out of bounds from buffer %d (vtx %d of %d = offset 0x%X fmt '%s', max = 0x%X)",
-                        attr.name, attr.buf_idx, iVtx,
-                        self.header['num_vtxs'], offs, fmt,
-                        len(buf.data))
-                    raise MalformedFileError("Invalid buffer offset for attribute "+attr.name)
-                if func: data = func(data)
-
-                # validate
-                d = data
-                if type(d) not in (list, tuple): d = [d]
-                for v in d:
-                    if math.isinf(v) or math.isnan(v):
-                        log.warning("%s value in attribute %s vtx %d (offset 0x%X buffer %d base 0x%X)",
-                            str(v), attr.name, iVtx, offs,
-                            attr.buf_idx, attr.buf_offs)
-
-                vtx.setAttr(attr, data)
-
-            self.vtxs.append(vtx)
+            for attr, vals in attrs:
+                vtx.setAttr(attr, vals[iVtx])
+            vtxs.append(vtx)
+        return vtxs
@@ -8,38 +8,45 @@ from bfres.FRES.FresObject import FresObject
 from bfres.FRES.Dict import Dict
 from bfres.Exceptions import MalformedFileError
 import struct
+import numpy as np
 
 
 primTypes = {
-    # where did these come from?
-    # id: (min, incr, name)
-    #0x01: (1, 1, 'points'),
-    #0x02: (2, 2, 'lines'),
-    #0x03: (2, 1, 'line_strip'),
-    #0x04: (3, 3, 'triangles'),
-    #0x05: (3, 1, 'triangle_fan'),
-    #0x06: (3, 1, 'triangle_strip'),
-    #0x0A: (4, 4, 'lines_adjacency'),
-    #0x0B: (4, 1, 'line_strip_adjacency'),
-    #0x0C: (6, 1, 'triangles_adjacency'),
-    #0x0D: (6, 6, 'triangle_strip_adjacency'),
-    #0x11: (3, 3, 'rects'),
-    #0x12: (2, 1, 'line_loop'),
-    #0x13: (4, 4, 'quads'),
-    #0x14: (4, 2, 'quad_strip'),
-    #0x82: (2, 2, 'tesselate_lines'),
-    #0x83: (2, 1, 'tesselate_line_strip'),
-    #0x84: (3, 3, 'tesselate_triangles'),
-    #0x86: (3, 1, 'tesselate_triangle_strip'),
-    #0x93: (4, 4, 'tesselate_quads'),
-    #0x94: (4, 2, 'tesselate_quad_strip'),
-
-    # according to Jasper...
     # id: (min, incr, name)
+    # in the order of nn::gfx's PrimitiveTopology.
     0x00: (1, 1, 'point_list'),
     0x01: (2, 2, 'line_list'),
     0x02: (2, 1, 'line_strip'),
     0x03: (3, 3, 'triangle_list'),
+    0x04: (3, 1, 'triangle_strip'),
+    0x05: (4, 4, 'line_list_adjacency'),
+    0x06: (4, 1, 'line_strip_adjacency'),
+    0x07: (6, 6, 'triangle_list_adjacency'),
+    0x08: (6, 2, 'triangle_strip_adjacency'),
+}
+gx2PrimTypes = { # WiiU (GX2PrimitiveType); names match primTypes.
+    # id: (min, incr, name)
+    0x01: (1, 1, 'point_list'),
+    0x02: (2, 2, 'line_list'),
+    0x03: (2, 1, 'line_strip'),
+    0x04: (3, 3, 'triangle_list'),
+    0x05: (3, 1, 'triangle_fan'),
+    0x06: (3, 1, 'triangle_strip'),
+    0x0A: (4, 4, 'line_list_adjacency'),
+    0x0B: (4, 1, 'line_strip_adjacency'),
+    0x0C: (6, 6, 'triangle_list_adjacency'),
+    0x0D: (6, 2, 'triangle_strip_adjacency'),
+    0x11: (3, 3, 'rect_list'),
+    0x12: (2, 1, 'line_loop'),
+    0x13: (4, 4, 'quad_list'),
+    0x14: (4, 2, 'quad_strip'),
+    # tesselated ones are indexed the same as the plain ones.
+    0x82: (2, 2, 'line_list'),
+    0x83: (2, 1, 'line_strip'),
+    0x84: (3, 3, 'triangle_list'),
+    0x86: (3, 1, 'triangle_strip'),
+    0x93: (4, 4, 'quad_list'),
+    0x94: (4, 2, 'quad_strip'),
 }
 idxFormats = {
     0x00: '<I', # I/H are backward from gx2Enum.h???
@@ -124,10 +131,14 @@ class LOD(FresObject):
         self.header = self.fres.read(Header(), offset)
 
         # decode primitive and index formats
+        # WiiU files use GX2's IDs. (FRES doesn't read WiiU headers
+        # yet, so this is for when it does.) Switch files can be
+        # either byte order, so that doesn't tell which.
+        types = gx2PrimTypes if self.fres.platform == 'wiiu' else primTypes
         self.prim_fmt_id = self.header['prim_fmt']
         try:
             self.prim_min, self.prim_size, self.prim_fmt = \
-                primTypes[self.header['prim_fmt']]
+                types[self.header['prim_fmt']]
         except KeyError:
             raise MalformedFileError("Unknown primitive format 0x%X" %
                 self.header['prim_fmt'])
@@ -147,12 +158,15 @@ class LOD(FresObject):
     def _readIdxBuf(self):
         """Read the index buffer."""
         base  = self.fres.bufferSection['buf_offs']
-        self.idx_buf = self.fres.read(self.idx_fmt,
-            pos   = self.header['face_offs'] + base,
-            count = self.header['idx_cnt'])
-
-        for i in range(self.header['idx_cnt']):
-            self.idx_buf[i] += self.header['visibility_group']
+        dtype = np.dtype(self.idx_fmt)
+        size  = self.header['idx_cnt'] * dtype.itemsize
+        data  = self.fres.read(size, self.header['face_offs'] + base)
+        if len(data) < size:
+            raise MalformedFileError("Index buffer out of bounds")
+
+        # widen so adding the visibility group can't overflow.
+        self.idx_buf = np.frombuffer(data, dtype).astype(np.uint32)
+        self.idx_buf += self.header['visibility_group']
 
 
     def _readSubmeshes(self):
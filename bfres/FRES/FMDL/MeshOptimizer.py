@@ -0,0 +1,289 @@
+"""Reorder triangles and vertices for GPU efficiency.
+
+Triangles are reordered so that vertices are reused while still in
+the post-transform vertex cache, using the Tipsify algorithm from
+"Fast Triangle Reordering for Vertex Locality and Reduced Overdraw"
+(Sander, Nehab, Barczak 2007). Vertices are then reordered by first
+use, so they're fetched from memory in order.
+
+The cache is modelled as a FIFO. Efficiency is reported as:
+    ACMR: average cache miss ratio; vertices transformed per
+        triangle. 0.5 to 3; lower is better.
+    ATVR: average transform to vertex ratio; vertices transformed
+        per vertex used. 1 is ideal.
+"""
+import logging; log = logging.getLogger(__name__)
+import numpy as np
+
+# vertex cache size to optimize for, by default.
+DEFAULT_CACHE_SIZE = 16
+
+
+def countCacheMisses(idxs, cacheSize=DEFAULT_CACHE_SIZE) -> int:
+    """Count how many vertices a triangle list transforms.
+
+    idxs:      Array of vertex indices.
+    cacheSize: Number of vertices in the FIFO cache.
+    """
+    idxs = np.asarray(idxs).reshape(-1)
+    if len(idxs) == 0: return 0
+    # a vertex is in the cache if fewer than cacheSize vertices
+    # have missed since it did.
+    stamps = [-cacheSize - 1] * (int(idxs.max()) + 1)
+    time   = 0
+    oldest = -cacheSize # stamp of the oldest vertex in the cache
+    for v in idxs.tolist():
+        if stamps[v] < oldest:
+            stamps[v] = time
+            time   += 1
+            oldest += 1
+    return time
+
+
+def computeACMR(idxs, cacheSize=DEFAULT_CACHE_SIZE) -> float:
+    """Compute the average cache miss ratio of a triangle list."""
+    return computeStats(idxs, cacheSize)['acmr']
+
+
+def computeATVR(idxs, cacheSize=DEFAULT_CACHE_SIZE) -> float:
+    """Compute the average transform to vertex ratio of a
+    triangle list.
+    """
+    return computeStats(idxs, cacheSize)['atvr']
+
+
+def computeStats(idxs, cacheSize=DEFAULT_CACHE_SIZE) -> dict:
+    """Compute the ACMR and ATVR of a triangle list.
+
+    Returns dict with keys 'acmr' and 'atvr'.
+    """
+    nTris  = len(idxs) // 3
+    nVtxs  = len(np.unique(idxs))
+    misses = countCacheMisses(idxs, cacheSize)
+    return {
+        'acmr': misses / nTris if nTris else 0.0,
+        'atvr': misses / nVtxs if nVtxs else 0.0,
+    }
+
+
+def optimizeVertexCache(idxs, cacheSize=DEFAULT_CACHE_SIZE) -> np.ndarray:
+    """Reorder a triangle list for vertex cache locality.
+
+    idxs:      Array of vertex indices, 3 per triangle.
+    cacheSize: Number of vertices in the FIFO cache.
+    Returns the reordered indices; triangles keep their winding.
+    """
+    return _tipsify(idxs, cacheSize)[0]
+
+
+def _tipsify(idxs, cacheSize, cache=None) -> tuple:
+    """Reorder a triangle list for vertex cache locality.
+
+    cache: [stamps, time] of a FIFO cache simulation to continue,
+        eg from the previous index range, or None to start empty.
+        It's updated to the state after the reordered triangles.
+    Returns (idxs, misses): the reordered indices and how many
+    vertices they transform, as `countCacheMisses` would count.
+    """
+    idxs = np.asarray(idxs)
+    if len(idxs) % 3:
+        raise ValueError("Index count %d is not a multiple of 3" % len(idxs))
+    nTris = len(idxs) // 3
+    if nTris == 0: return idxs.copy(), 0
+    flat  = idxs.astype(np.int64)
+    nVtxs = int(flat.max()) + 1
+    if cache is None: cache = [[], cacheSize + 1]
+    stamps, time = cache
+    if len(stamps) < nVtxs: stamps += [-cacheSize - 1] * (nVtxs - len(stamps))
+    startTime = time
+
+    # triangles using each vertex, as offsets into one array.
+    # sorting (vertex, triangle) keys is faster than a stable argsort.
+    live  = np.bincount(flat, minlength=nVtxs)
+    start = np.concatenate(([0], np.cumsum(live))).tolist()
+    adj   = flat * nTris + np.arange(len(flat)) // 3
+    adj.sort()
+    adj   = (adj % nTris).tolist()
+    live  = live.tolist()
+    tris  = flat.tolist()
+
+    emitted = bytearray(nTris)
+    order   = [] # triangles in output order
+    deadEnd = [] # live vertices used, most recent last, to resume from
+    cursor  = 0  # next vertex to resume from if deadEnd is empty
+    fan     = 0  # current fanning vertex
+    while fan >= 0:
+        # emit all of this vertex's remaining triangles. the
+        # vertices they use are the candidates for the next fan.
+        used = []
+        for t in adj[start[fan] : start[fan+1]]:
+            if emitted[t]: continue
+            emitted[t] = 1
+            order.append(t)
+            tri = tris[3*t : 3*t+3]
+            used += tri
+            for v in tri:
+                live[v] -= 1
+                if time - stamps[v] > cacheSize:
+                    stamps[v] = time
+                    time += 1
+
+        # next, fan around the vertex that will stay in the cache
+        # longest while its remaining triangles are emitted. vertices
+        # without any are left out of deadEnd; they never get more.
+        fan  = -1
+        best = -1
+        for v in used:
+            n = live[v]
+            if n <= 0: continue
+            deadEnd.append(v)
+            age  = time - stamps[v]
+            prio = age if age + 2 * n <= cacheSize else 0
+            if prio > best:
+                best = prio
+                fan  = v
+
+        if fan < 0: # dead end; go back to a recent vertex
+            while deadEnd:
+                v = deadEnd.pop()
+                if live[v] > 0:
+                    fan = v
+                    break
+        while fan < 0 and cursor < nVtxs: # or any unfinished vertex
+            if live[cursor] > 0: fan = cursor
+            cursor += 1
+
+    cache[1] = time
+    order = np.array(order, dtype=np.int64)
+    return idxs.reshape(-1, 3)[order].reshape(-1), time - startTime
+
+
+def optimizeVertexFetch(lods, numVtxs) -> tuple:
+    """Reorder vertices by first use.
+
+    lods:    List of index arrays sharing the same vertices.
+        Earlier arrays decide the order first.
+    numVtxs: Number of vertices.
+    Returns (lods, order): the remapped index arrays, and the old
+    index of each new vertex. Unused vertices go last.
+    """
+    allIdxs = np.concatenate([np.asarray(idxs, dtype=np.int64).reshape(-1)
+        for idxs in lods] + [np.arange(numVtxs)])
+    used, first = np.unique(allIdxs, return_index=True)
+    order = used[np.argsort(first, kind='stable')]
+    remap = np.empty(len(order), dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    return [remap[np.asarray(idxs, dtype=np.int64)].astype(
+        np.asarray(idxs).dtype) for idxs in lods], order
+
+
+def optimizeMesh(lods, numVtxs, cacheSize=DEFAULT_CACHE_SIZE,
+ranges=None, stats=True) -> tuple:
+    """Reorder triangles and vertices of a mesh.
+
+    lods:      List of triangle list index arrays sharing the same
+        vertices.
+    numVtxs:   Number of vertices.
+    cacheSize: Number of vertices in the FIFO cache.
+    ranges:    For each LOD, list of (offset, count) of index
+        ranges (eg submeshes) to keep separate, or None.
+    stats:     Also count the cache misses of the original order.
+        If False, the 'Before' stats are None.
+    Returns (lods, order, stats): the new index arrays, the old
+    index of each new vertex (to reorder attributes with), and
+    list of dicts of ACMR and ATVR before and after for each LOD.
+    """
+    newLods, lodStats = [], []
+    for i, idxs in enumerate(lods):
+        idxs   = np.asarray(idxs).reshape(-1)
+        res    = idxs.copy()
+        cache  = [[], cacheSize + 1] # carried across ranges
+        misses = 0
+        for offs, cnt in (ranges[i] if ranges and ranges[i] is not None
+        else [(0, len(idxs))]):
+            res[offs:offs+cnt], n = _tipsify(idxs[offs:offs+cnt],
+                cacheSize, cache)
+            misses += n
+        newLods.append(res)
+
+        nTris  = len(idxs) // 3
+        nVtxs  = int(np.count_nonzero(np.bincount(idxs))) if len(idxs) else 0
+        before = countCacheMisses(idxs, cacheSize) if stats else None
+        lodStats.append({
+            'acmrBefore': _ratio(before, nTris),
+            'atvrBefore': _ratio(before, nVtxs),
+            'acmrAfter':  _ratio(misses, nTris),
+            'atvrAfter':  _ratio(misses, nVtxs),
+        })
+
+    newLods, order = optimizeVertexFetch(newLods, numVtxs)
+    return newLods, order, lodStats
+
+
+def _ratio(misses, count):
+    """Divide a miss count for ACMR/ATVR, passing None through."""
+    if misses is None: return None
+    return misses / count if count else 0.0
+
+
+def _getRanges(lod):
+    """Get the index ranges of a LOD's submeshes, or None if they
+    don't divide its triangles cleanly.
+    """
+    # the reader reads one more submesh than the header says.
+    subs = sorted(set((s['offset'], s['count'])
+        for s in lod.submeshes[0:lod.header['submesh_cnt']]))
+    end = 0
+    for offs, cnt in subs:
+        if offs != end or cnt % 3: return None
+        end += cnt
+    if end != len(lod.idx_buf): return None
+    return subs
+
+
+def optimizeShapes(fshps, cacheSize=DEFAULT_CACHE_SIZE, stats=True) -> dict:
+    """Reorder the triangles and vertices of FSHPs in place.
+
+    Shapes sharing a FVTX are optimized together. The FVTXs'
+    `attrData` and the LODs' `idx_buf` and submeshes are replaced;
+    the FVTXs' raw `buffers` are left as they were.
+    stats: Passed to `optimizeMesh`.
+    Returns dict of FSHP name => list of stats for each LOD.
+    """
+    groups = {} # id(fvtx) => [fvtx, [fshps]]
+    for fshp in fshps:
+        groups.setdefault(id(fshp.fvtx), [fshp.fvtx, []])[1].append(fshp)
+
+    result = {}
+    for fvtx, shapes in groups.values():
+        lods = [lod for fshp in shapes for lod in fshp.lods]
+        skip = [lod for lod in lods if lod.prim_fmt != 'triangle_list']
+        if skip:
+            log.warning("Not optimizing %s: LODs use %s, not triangle lists",
+                ', '.join(fshp.name for fshp in shapes), skip[0].prim_fmt)
+            continue
+
+        newIdxs, order, lodStats = optimizeMesh(
+            [lod.idx_buf for lod in lods], fvtx.header['num_vtxs'],
+            cacheSize, [_getRanges(lod) for lod in lods], stats)
+        for lod, idxs in zip(lods, newIdxs):
+            lod.idx_buf = idxs
+            for sub in lod.submeshes:
+                sub['idxs'] = idxs[sub['offset'] : sub['offset'] + sub['count']]
+        for name, data in fvtx.attrData.items():
+            fvtx.attrData[name] = data[order]
+        fvtx._vtxs = None
+
+        i = 0
+        for fshp in shapes:
+            result[fshp.name] = lodStats[i : i + len(fshp.lods)]
+            i += len(fshp.lods)
+            for iLod, st in enumerate(result[fshp.name]):
+                if st['acmrBefore'] is None:
+                    log.info("Shape %s LOD %d: ACMR %.3f, ATVR %.3f",
+                        fshp.name, iLod, st['acmrAfter'], st['atvrAfter'])
+                else:
+                    log.info("Shape %s LOD %d: ACMR %.3f => %.3f, ATVR %.3f => %.3f",
+                        fshp.name, iLod, st['acmrBefore'], st['acmrAfter'],
+                        st['atvrBefore'], st['atvrAfter'])
+    return result
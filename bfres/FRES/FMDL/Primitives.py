@@ -0,0 +1,305 @@
+"""Convert index buffers between primitive types.
+
+Strips, fans, loops, quads and adjacency formats are expanded into
+point, line or triangle lists, and triangle lists can be turned back
+into strips or adjacency lists. Primitive types are named as in
+`LOD.primTypes` and `LOD.gx2PrimTypes`.
+
+Strips and fans may be split by a restart index, if one is given.
+Triangles with a repeated vertex are dropped, since strips use them
+to join pieces together.
+"""
+import logging; log = logging.getLogger(__name__)
+import numpy as np
+from bfres.Exceptions import UnsupportedFormatError
+
+# primitive type => number of vertices in each basic primitive
+# it's made of (points, lines or triangles).
+primSizes = {
+    'point_list':               1,
+    'line_list':                2,
+    'line_strip':               2,
+    'line_loop':                2,
+    'line_list_adjacency':      2,
+    'line_strip_adjacency':     2,
+    'triangle_list':            3,
+    'triangle_strip':           3,
+    'triangle_fan':             3,
+    'triangle_list_adjacency':  3,
+    'triangle_strip_adjacency': 3,
+    'rect_list':                3,
+    'quad_list':                3,
+    'quad_strip':               3,
+}
+
+
+def _segments(idxs, restart):
+    """Find where each index's strip starts and ends.
+
+    Returns (valid, start, end): whether each index is a vertex
+    (not a restart), and the positions of the first and one past the
+    last index of the strip each index belongs to.
+    """
+    n = len(idxs)
+    valid = np.ones(n, dtype=bool) if restart is None else idxs != restart
+    pos   = np.arange(n)
+    cut   = np.nonzero(~valid)[0]
+    # each restart ends one strip and starts the next.
+    start = np.concatenate(([0], cut + 1))
+    end   = np.concatenate((cut, [n]))
+    seg   = np.searchsorted(cut, pos, side='left')
+    return valid, start[seg], end[seg]
+
+
+def _strip(idxs, restart, size, step, offsets):
+    """Pick primitives out of strips.
+
+    size:    Number of indices the first primitive uses.
+    step:    Number of indices between primitives.
+    offsets: List of index offsets of each primitive's vertices,
+        relative to its first index; or pair of lists, for even and
+        odd primitives.
+    Returns array of shape (n, len(offsets)).
+    """
+    valid, start, end = _segments(idxs, restart)
+    first = np.nonzero(valid)[0]
+    first = first[((first - start[first]) % step == 0) &
+        (first + size <= end[first])]
+    if type(offsets[0]) is not list: offsets = (offsets, offsets)
+    odd   = ((first - start[first]) // step) % 2 == 1
+    offs  = np.where(odd[:, None], offsets[1], offsets[0])
+    return idxs[first[:, None] + offs]
+
+
+def _lineLoop(idxs, restart):
+    lines = _strip(idxs, restart, 2, 1, [0, 1])
+    # close each loop back to its first vertex.
+    valid, start, end = _segments(idxs, restart)
+    heads = np.unique(start[valid])
+    tails = np.unique(end[valid]) - 1
+    close = np.stack((idxs[tails], idxs[heads]), axis=1)
+    close = close[tails > heads]
+    return np.concatenate((lines, close))
+
+
+def _triangleFan(idxs, restart):
+    valid, start, end = _segments(idxs, restart)
+    first = np.nonzero(valid)[0]
+    first = first[(first > start[first]) & (first + 2 <= end[first])]
+    return np.stack((idxs[start[first]], idxs[first], idxs[first+1]), axis=1)
+
+
+def _quadStrip(idxs, restart):
+    quads = _strip(idxs, restart, 4, 2, [0, 1, 3, 2])
+    return quads[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3)
+
+
+_expand = { # type => func(idxs, restart) => array of primitives
+    'point_list': lambda idxs, restart: _strip(idxs, restart, 1, 1, [0]),
+    'line_list':  lambda idxs, restart: _strip(idxs, restart, 2, 2, [0, 1]),
+    'line_strip': lambda idxs, restart: _strip(idxs, restart, 2, 1, [0, 1]),
+    'line_loop':  _lineLoop,
+    'line_list_adjacency': lambda idxs, restart:
+        _strip(idxs, restart, 4, 4, [1, 2]),
+    'line_strip_adjacency': lambda idxs, restart:
+        _strip(idxs, restart, 4, 1, [1, 2]),
+    'triangle_list': lambda idxs, restart:
+        _strip(idxs, restart, 3, 3, [0, 1, 2]),
+    # every other triangle is swapped to keep the same winding.
+    'triangle_strip': lambda idxs, restart:
+        _strip(idxs, restart, 3, 1, ([0, 1, 2], [1, 0, 2])),
+    'triangle_fan': _triangleFan,
+    'triangle_list_adjacency': lambda idxs, restart:
+        _strip(idxs, restart, 6, 6, [0, 2, 4]),
+    'triangle_strip_adjacency': lambda idxs, restart:
+        _strip(idxs, restart, 6, 2, ([0, 2, 4], [2, 0, 4])),
+    # the fourth corner of a rect is computed by the GPU, and has no
+    # index, so only the triangle that's given can be used.
+    'rect_list': lambda idxs, restart:
+        _strip(idxs, restart, 3, 3, [0, 1, 2]),
+    'quad_list': lambda idxs, restart:
+        _strip(idxs, restart, 4, 4, [0, 1, 2, 0, 2, 3]).reshape(-1, 3),
+    'quad_strip': _quadStrip,
+}
+
+
+def decompose(prim, idxs, restart=None) -> np.ndarray:
+    """Expand an index buffer into basic primitives.
+
+    prim:    Primitive type name.
+    idxs:    Index buffer.
+    restart: Index value that starts a new strip, or None.
+    Returns array of shape (n, primSizes[prim]) of the vertex indices
+    of each point, line or triangle. Degenerate lines and triangles
+    (using one vertex twice) are removed.
+    Raises UnsupportedFormatError if the type isn't known.
+    """
+    func = _expand.get(prim, None)
+    if func is None:
+        raise UnsupportedFormatError("Unsupported prim format: %s" % prim)
+    if prim == 'rect_list':
+        log.warning("Rects have no index for their fourth corner; using half of each")
+    idxs = np.asarray(idxs).reshape(-1)
+    res  = func(idxs, restart)
+    if res.shape[1] > 1:
+        bad = res[:, 0] == res[:, 1]
+        for i in range(2, res.shape[1]):
+            bad |= (res[:, i] == res[:, 0]) | (res[:, i] == res[:, i-1])
+        res = res[~bad]
+    return res
+
+
+def toTriangleList(prim, idxs, restart=None) -> np.ndarray:
+    """Convert an index buffer to a triangle list.
+
+    Returns index array, 3 per triangle, in the same order and
+    winding as the original.
+    Raises UnsupportedFormatError if the type isn't made of
+    triangles.
+    """
+    if primSizes.get(prim, 3) != 3:
+        raise UnsupportedFormatError("Can't make triangles from %s" % prim)
+    return decompose(prim, idxs, restart).reshape(-1)
+
+
+def toLineList(prim, idxs, restart=None) -> np.ndarray:
+    """Convert an index buffer to a line list.
+
+    Triangle types are converted to their edges.
+    Returns index array, 2 per line.
+    """
+    res = decompose(prim, idxs, restart)
+    if res.shape[1] == 1:
+        raise UnsupportedFormatError("Can't make lines from %s" % prim)
+    if res.shape[1] == 3: res = res[:, [0, 1, 1, 2, 2, 0]]
+    return res.reshape(-1)
+
+
+def _findNeighbours(tris):
+    """Find the triangle on the other side of each edge.
+
+    tris: Array of shape (n, 3).
+    Returns array of shape (n, 3): for each triangle, the index of
+    the triangle that has edge i (from vertex i to the next) going
+    the other way, or -1.
+    """
+    n = len(tris)
+    if n == 0: return np.zeros((0, 3), dtype=np.int64)
+    tris  = tris.astype(np.int64)
+    big   = int(tris.max()) + 1
+    src   = tris.reshape(-1)
+    dst   = tris[:, [1, 2, 0]].reshape(-1)
+    keys  = src * big + dst
+    order = np.argsort(keys, kind='stable')
+    skeys = keys[order]
+    twin  = dst * big + src
+    pos   = np.searchsorted(skeys, twin)
+    pos   = np.minimum(pos, len(skeys) - 1)
+    found = skeys[pos] == twin
+    res   = np.where(found, order[pos] // 3, -1)
+    return res.reshape(n, 3)
+
+
+def makeTriangleStrip(idxs, restart=None) -> np.ndarray:
+    """Convert a triangle list to a triangle strip.
+
+    idxs:    Triangle list.
+    restart: Index value to separate strips with, or None to join
+        them with degenerate triangles.
+    Returns the strip's index array. Expanding it again gives the
+    same triangles with the same winding, but not in the same order
+    or starting at the same vertex.
+    """
+    idxs = np.asarray(idxs)
+    tris = idxs.reshape(-1, 3)
+    tris = tris[(tris[:, 0] != tris[:, 1]) & (tris[:, 1] != tris[:, 2]) &
+        (tris[:, 2] != tris[:, 0])]
+    nbrs = _findNeighbours(tris).tolist()
+    tris = tris.tolist()
+
+    used   = bytearray(len(tris))
+    strips = []
+    for t in range(len(tris)):
+        if used[t]: continue
+        used[t] = 1
+        # start along whichever edge has an unused neighbour.
+        tri, nbr = tris[t], nbrs[t]
+        rot = 0
+        for e in (1, 2, 0):
+            if nbr[e] >= 0 and not used[nbr[e]]:
+                rot = (e + 2) % 3 # so that edge is the last two
+                break
+        strip = tri[rot:] + tri[:rot]
+
+        # add each next triangle that shares the last edge.
+        cur = t
+        while True:
+            a, b = strip[-2], strip[-1]
+            if len(strip) % 2 == 0: a, b = b, a # odd triangle
+            # find that edge of the current triangle.
+            tri, nbr = tris[cur], nbrs[cur]
+            nxt = -1
+            for e in range(3):
+                if tri[e] == a and tri[(e+1) % 3] == b:
+                    nxt = nbr[e]
+                    break
+            if nxt < 0 or used[nxt]: break
+            # the vertex of it that isn't on the edge.
+            tri = tris[nxt]
+            c = [v for v in tri if v != a and v != b]
+            if len(c) != 1: break
+            used[nxt] = 1
+            strip.append(c[0])
+            cur = nxt
+        strips.append(strip)
+
+    res = []
+    for strip in strips:
+        if res:
+            if restart is not None: res.append(restart)
+            else:
+                res += [res[-1], strip[0]]
+                # the strip must start on an even triangle.
+                if len(res) % 2: res.append(strip[0])
+        res += strip
+    log.debug("Made %d triangles into %d strips of %d indices",
+        len(tris), len(strips), len(res))
+    return np.array(res, dtype=idxs.dtype)
+
+
+def makeTriangleListAdjacency(idxs) -> np.ndarray:
+    """Convert a triangle list to a triangle list with adjacency.
+
+    Each triangle gets the vertex opposite each of its edges in the
+    neighbouring triangle; for edges with no neighbour, the edge's
+    own opposite vertex is used.
+    Returns index array, 6 per triangle.
+    """
+    idxs = np.asarray(idxs)
+    tris = idxs.reshape(-1, 3)
+    nbrs = _findNeighbours(tris)
+    res  = np.empty((len(tris), 6), dtype=idxs.dtype)
+    res[:, 0::2] = tris
+    for e in range(3):
+        # the neighbour's vertex that isn't on this edge.
+        a, b = tris[:, e], tris[:, (e+1) % 3]
+        other = tris[nbrs[:, e]]
+        pick  = (other != a[:, None]) & (other != b[:, None])
+        opp   = other[np.arange(len(tris)), np.argmax(pick, axis=1)]
+        res[:, e*2+1] = np.where(nbrs[:, e] >= 0, opp, tris[:, (e+2) % 3])
+    return res.reshape(-1)
+
+
+def fromTriangleList(prim, idxs, restart=None) -> np.ndarray:
+    """Convert a triangle list to another primitive type.
+
+    prim: One of 'triangle_list', 'triangle_strip',
+        'triangle_list_adjacency', 'line_list'.
+    Returns the index array.
+    """
+    if   prim == 'triangle_list':  return np.asarray(idxs).copy()
+    elif prim == 'triangle_strip': return makeTriangleStrip(idxs, restart)
+    elif prim == 'triangle_list_adjacency':
+        return makeTriangleListAdjacency(idxs)
+    elif prim == 'line_list': return toLineList('triangle_list', idxs)
+    raise UnsupportedFormatError("Can't convert triangles to %s" % prim)
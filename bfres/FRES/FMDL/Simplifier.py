@@ -0,0 +1,477 @@
+"""Generate lower LODs by simplifying meshes.
+
+Uses quadric error metrics ("Surface Simplification Using Quadric
+Error Metrics", Garland & Heckbert 1997) with half-edge collapses:
+each collapse moves a vertex onto a neighbour, so LODs can share the
+original vertex buffer and only need new index buffers.
+
+Vertices whose position is shared by other vertices (UV seams, hard
+edges) never move, and vertices on an open border only move along
+it, so seams and borders stay intact. Collapsing vertices whose skin
+weights differ costs extra, so the skinning is preserved.
+"""
+import logging; log = logging.getLogger(__name__)
+import heapq
+import numpy as np
+from .Bounds import computeShapeBounds
+
+DEFAULT_RATIOS = (0.5, 0.25, 0.125)
+
+# cost of collapsing vertices whose skin weights differ entirely,
+# relative to the squared size of the mesh.
+DEFAULT_SKIN_PENALTY = 0.01
+
+# weight of the quadrics that keep borders in place.
+BORDER_WEIGHT = 10.0
+
+# cosine of the most a triangle's normal may turn in one collapse.
+MIN_NORMAL_DOT = 0.5
+
+# vertex classes.
+INTERIOR = 0
+BORDER   = 1 # on an open border; moves only along it
+LOCKED   = 2 # never moves
+
+
+def _planeQuadrics(p0, p1, p2, weight=None):
+    """Compute area-weighted quadrics of triangles' planes.
+
+    Returns array of shape (n, 10): the upper triangle of each
+    4x4 matrix.
+    """
+    n = np.cross(p1 - p0, p2 - p0)
+    area2 = np.linalg.norm(n, axis=1)
+    ok = area2 > 0
+    n[ok] /= area2[ok, None]
+    d = -(n * p0).sum(axis=1)
+    w = area2 / 2
+    if weight is not None: w = w * weight
+    a, b, c = n[:, 0], n[:, 1], n[:, 2]
+    return w[:, None] * np.stack((a*a, a*b, a*c, a*d, b*b, b*c, b*d,
+        c*c, c*d, d*d), axis=1)
+
+
+def _evalQuadric(q, p):
+    """Evaluate a quadric (list of 10) at a point (x, y, z)."""
+    x, y, z = p
+    return (q[0]*x*x + 2*q[1]*x*y + 2*q[2]*x*z + 2*q[3]*x
+        + q[4]*y*y + 2*q[5]*y*z + 2*q[6]*y
+        + q[7]*z*z + 2*q[8]*z + q[9])
+
+
+def _evalQuadrics(q, p):
+    """Vectorized `_evalQuadric`."""
+    x, y, z = p[:, 0], p[:, 1], p[:, 2]
+    return (q[:,0]*x*x + 2*q[:,1]*x*y + 2*q[:,2]*x*z + 2*q[:,3]*x
+        + q[:,4]*y*y + 2*q[:,5]*y*z + 2*q[:,6]*y
+        + q[:,7]*z*z + 2*q[:,8]*z + q[:,9])
+
+
+def _cross(a, b):
+    return (a[1]*b[2] - a[2]*b[1], a[2]*b[0] - a[0]*b[2],
+        a[0]*b[1] - a[1]*b[0])
+
+
+class Simplifier:
+    """Simplifies a triangle list by collapsing edges.
+
+    Usage:
+        lods = Simplifier(positions, idxs).simplify((0.5, 0.25))
+    """
+
+    def __init__(self, positions, idxs, skinIdxs=None, skinWeights=None,
+    skinPenalty=DEFAULT_SKIN_PENALTY, lockedVtxs=None):
+        """Create Simplifier.
+
+        positions:   Array of shape (num_vtxs, 3).
+        idxs:        Triangle list of vertex indices.
+        skinIdxs:    Array of shape (num_vtxs, n) of the bones
+            affecting each vertex (eg `_i0`), or None.
+        skinWeights: Array of the same shape of the weight of each
+            (eg `_w0`), or None for equal weights.
+        skinPenalty: Cost of collapsing vertices with entirely
+            different weights, relative to the mesh's squared size.
+        lockedVtxs:  Indices of vertices that must not move, or None.
+        """
+        self.positions = np.asarray(positions, dtype=np.float64)[:, 0:3]
+        self.idxs = np.asarray(idxs, dtype=np.int64).reshape(-1)
+        if len(self.idxs) % 3:
+            raise ValueError("Index count %d is not a multiple of 3" %
+                len(self.idxs))
+        self.numVtxs = len(self.positions)
+        self.lockedVtxs = lockedVtxs
+        self._makeSkins(skinIdxs, skinWeights, skinPenalty)
+
+
+    def _makeSkins(self, skinIdxs, skinWeights, skinPenalty):
+        """Convert skin weights to a hashable form per vertex."""
+        self.skins = None
+        if skinIdxs is None: return
+        skinIdxs = np.asarray(skinIdxs, dtype=np.int64)
+        if skinIdxs.ndim == 1: skinIdxs = skinIdxs[:, None]
+        if skinWeights is None:
+            skinWeights = np.ones(skinIdxs.shape)
+        skinWeights = np.asarray(skinWeights, dtype=np.float64)
+        total = skinWeights.sum(axis=1, keepdims=True)
+        total[total <= 0] = 1
+        skinWeights = skinWeights / total
+
+        # identify vertices with the same weights, so most edges
+        # don't need comparing.
+        bones = np.where(skinWeights > 0, skinIdxs, -1)
+        order = np.argsort(bones, axis=1, kind='stable')
+        key   = np.concatenate((np.take_along_axis(bones, order, 1),
+            np.take_along_axis(skinWeights, order, 1)), axis=1)
+        self.skinIds = np.unique(key, axis=0, return_inverse=True)[1] \
+            .reshape(-1)
+
+        self.skins = []
+        for idxs, wgts in zip(skinIdxs.tolist(), skinWeights.tolist()):
+            skin = {}
+            for bone, wgt in zip(idxs, wgts):
+                if wgt > 0: skin[bone] = skin.get(bone, 0) + wgt
+            self.skins.append(skin)
+
+        if len(self.positions):
+            size = np.ptp(self.positions, axis=0)
+            self.skinPenalty = skinPenalty * float((size * size).sum())
+        else: self.skinPenalty = 0
+
+
+    def _skinDiff(self, u, v):
+        """Get how different two vertices' skin weights are (0 to 2)."""
+        su, sv = self.skins[u], self.skins[v]
+        if su == sv: return 0
+        return sum(abs(su.get(b, 0) - sv.get(b, 0))
+            for b in su.keys() | sv.keys())
+
+
+    def _setup(self):
+        """Build the quadrics, adjacency and collapse queue."""
+        pos  = self.positions
+        tris = self.idxs.reshape(-1, 3)
+        nVtxs, nTris = self.numVtxs, len(tris)
+
+        # vertex quadrics, from the planes of their triangles.
+        p0, p1, p2 = pos[tris[:, 0]], pos[tris[:, 1]], pos[tris[:, 2]]
+        triQ = _planeQuadrics(p0, p1, p2)
+        quads = np.zeros((nVtxs, 10))
+        for i in range(3): np.add.at(quads, tris[:, i], triQ)
+
+        # edges used by only one triangle are open borders. add
+        # quadrics of planes perpendicular to them, to keep them
+        # in place.
+        edges = np.concatenate((tris[:, [0, 1]], tris[:, [1, 2]],
+            tris[:, [2, 0]]))
+        faceOf  = np.tile(np.arange(nTris), 3)
+        key     = np.sort(edges, axis=1)
+        _, inv, counts = np.unique(key, axis=0, return_inverse=True,
+            return_counts=True)
+        inv = inv.reshape(-1)
+        border = counts[inv] == 1
+        if border.any():
+            be = edges[border]
+            e0, e1 = pos[be[:, 0]], pos[be[:, 1]]
+            normal = np.cross(p1 - p0, p2 - p0)[faceOf[border]]
+            # a third point off the face, so the plane contains the
+            # edge and is perpendicular to the face.
+            bq = _planeQuadrics(e0, e1, e0 + normal, BORDER_WEIGHT)
+            np.add.at(quads, be[:, 0], bq)
+            np.add.at(quads, be[:, 1], bq)
+
+        # classify vertices.
+        cls = np.full(nVtxs, INTERIOR, dtype=np.int8)
+        cls[edges[border].reshape(-1)] = BORDER
+        nonManifold = counts[inv] > 2
+        cls[edges[nonManifold].reshape(-1)] = LOCKED
+        _, posInv, posCounts = np.unique(pos, axis=0, return_inverse=True,
+            return_counts=True)
+        cls[posCounts[posInv.reshape(-1)] > 1] = LOCKED
+        if self.lockedVtxs is not None: cls[self.lockedVtxs] = LOCKED
+
+        # a collapse's error is the merged quadric at v's position,
+        # so keep each vertex's own part to add to its neighbour's.
+        selfErr = _evalQuadrics(quads, pos)
+        self.quads   = quads.tolist()
+        if self.skins is not None: self._skinIds = self.skinIds.tolist()
+        self.selfErr = selfErr.tolist()
+        self.pos     = [tuple(p) for p in pos.tolist()]
+        self.cls     = cls.tolist()
+        self.tris    = tris.tolist()
+        self.alive   = bytearray(b'\1') * nTris
+        self.numTris = nTris
+        self.vtxTris = [set() for i in range(nVtxs)]
+        for t, (a, b, c) in enumerate(self.tris):
+            self.vtxTris[a].add(t)
+            self.vtxTris[b].add(t)
+            self.vtxTris[c].add(t)
+
+        # initial collapse costs, computed all at once.
+        u, v = edges[:, 0], edges[:, 1]
+        u, v = np.concatenate((u, v)), np.concatenate((v, u))
+        ok = (cls[u] == INTERIOR) | ((cls[u] == BORDER) &
+            (cls[v] != INTERIOR) & np.tile(border, 2))
+        u, v = u[ok], v[ok]
+        cost = _evalQuadrics(quads[u], pos[v]) + selfErr[v]
+        if self.skins is not None:
+            diff = np.nonzero(self.skinIds[u] != self.skinIds[v])[0]
+            cost[diff] += self.skinPenalty * np.array([self._skinDiff(a, b)
+                for a, b in zip(u[diff].tolist(), v[diff].tolist())])
+
+        # only queue each vertex's cheapest collapse. it's looked for
+        # again when that one turns out to be out of date.
+        order = np.lexsort((cost, u))
+        u, v, cost = u[order], v[order], cost[order]
+        first = np.ones(len(u), dtype=bool)
+        first[1:] = u[1:] != u[:-1]
+        self.heap = list(zip(cost[first].tolist(), u[first].tolist(),
+            v[first].tolist()))
+        heapq.heapify(self.heap)
+        self.queued = [None] * nVtxs # vertex => its entry in the heap
+        for entry in self.heap: self.queued[entry[1]] = entry
+        self.rejected = {} # vertex => neighbours it can't collapse onto
+
+
+    def _edgeCost(self, u, v):
+        """Get the cost of collapsing u onto v, or None if it's not
+        allowed.
+        """
+        cu, cv = self.cls[u], self.cls[v]
+        if cu == LOCKED: return None
+        if cu == BORDER:
+            if cv == INTERIOR: return None
+            # only along the border: one triangle uses this edge.
+            if len(self.vtxTris[u] & self.vtxTris[v]) != 1: return None
+        cost = _evalQuadric(self.quads[u], self.pos[v]) + self.selfErr[v]
+        if self.skins is not None and self._skinIds[u] != self._skinIds[v]:
+            cost += self.skinPenalty * self._skinDiff(u, v)
+        return cost
+
+
+    def _neighbours(self, u):
+        res = set()
+        for t in self.vtxTris[u]: res.update(self.tris[t])
+        res.discard(u)
+        return res
+
+
+    def _queueBest(self, u):
+        """Queue the cheapest allowed collapse of u, if any."""
+        best, target = None, None
+        rejected = self.rejected.get(u, ())
+        for w in self._neighbours(u):
+            if w in rejected: continue
+            cost = self._edgeCost(u, w)
+            if cost is not None and (best is None or cost < best):
+                best, target = cost, w
+        self.queued[u] = None
+        if target is not None: self._queue(best, u, target)
+
+
+    def _queue(self, cost, u, v):
+        """Queue collapsing u onto v, replacing u's other entry."""
+        entry = (cost, u, v)
+        self.queued[u] = entry
+        heapq.heappush(self.heap, entry)
+
+
+    def _canCollapse(self, u, v, nbrsU, nbrsV):
+        """Check that collapsing u onto v keeps the mesh manifold
+        and doesn't flip any triangles.
+        """
+        trisU  = self.vtxTris[u]
+        shared = trisU & self.vtxTris[v]
+        if not shared: return False
+        if self.cls[u] == BORDER and len(shared) != 1: return False
+
+        # the only vertices both are connected to must be the
+        # corners of the triangles being removed.
+        common = nbrsU & nbrsV
+        opposite = set()
+        for t in shared: opposite.update(self.tris[t])
+        opposite.discard(u)
+        opposite.discard(v)
+        if common != opposite: return False
+
+        pos, pv = self.pos, self.pos[v]
+        for t in trisU - shared:
+            a, b, c = self.tris[t]
+            pa, pb, pc = pos[a], pos[b], pos[c]
+            old = _cross(
+                (pb[0]-pa[0], pb[1]-pa[1], pb[2]-pa[2]),
+                (pc[0]-pa[0], pc[1]-pa[1], pc[2]-pa[2]))
+            if   a == u: pa = pv
+            elif b == u: pb = pv
+            else:        pc = pv
+            new = _cross(
+                (pb[0]-pa[0], pb[1]-pa[1], pb[2]-pa[2]),
+                (pc[0]-pa[0], pc[1]-pa[1], pc[2]-pa[2]))
+            dot = old[0]*new[0] + old[1]*new[1] + old[2]*new[2]
+            if dot <= 0 or dot * dot < (MIN_NORMAL_DOT * MIN_NORMAL_DOT *
+            (old[0]*old[0] + old[1]*old[1] + old[2]*old[2]) *
+            (new[0]*new[0] + new[1]*new[1] + new[2]*new[2])):
+                return False
+        return True
+
+
+    def _collapse(self, u, v, nbrsU, nbrsV):
+        """Move vertex u onto v."""
+        trisU  = self.vtxTris[u]
+        shared = trisU & self.vtxTris[v]
+        for t in shared:
+            self.alive[t] = 0
+            self.numTris -= 1
+            for w in self.tris[t]:
+                if w != u: self.vtxTris[w].discard(t)
+        for t in trisU - shared:
+            tri = self.tris[t]
+            tri[tri.index(u)] = v
+            self.vtxTris[v].add(t)
+        self.vtxTris[u] = set()
+        self.queued[u] = None
+        self.quads[v] = [a + b for a, b in zip(self.quads[u], self.quads[v])]
+        self.selfErr[v] = _evalQuadric(self.quads[v], self.pos[v])
+
+        # the costs of existing edges only grow, so they're updated
+        # when they come up. v's all changed, and its new edges may
+        # be the best for the vertices at their other end.
+        self.rejected.pop(u, None)
+        self.rejected.pop(v, None)
+        self._queueBest(v)
+        for w in nbrsU:
+            if w == v: continue
+            if self.rejected.pop(w, None) is not None:
+                # its neighbourhood changed, so try them again.
+                self._queueBest(w)
+            elif w not in nbrsV:
+                cost  = self._edgeCost(w, v)
+                entry = self.queued[w]
+                if cost is not None and (entry is None or cost < entry[0]):
+                    self._queue(cost, w, v)
+
+
+    def simplify(self, ratios=DEFAULT_RATIOS) -> list:
+        """Simplify the mesh.
+
+        ratios: Fraction of triangles to keep for each LOD, in
+            decreasing order.
+        Returns list of index arrays, one per ratio.
+        """
+        self._setup()
+        nTris   = self.numTris
+        targets = [int(round(nTris * r)) for r in ratios]
+        result  = []
+        heap = self.heap
+        for target in targets:
+            while self.numTris > target and heap:
+                entry = heapq.heappop(heap)
+                cost, u, v = entry
+                if self.queued[u] is not entry: continue # replaced
+                newCost = self._edgeCost(u, v) if self.vtxTris[v] else None
+                if newCost is None or (newCost > cost and heap
+                and newCost > heap[0][0]):
+                    # it got more expensive or impossible since it
+                    # was queued, so find u's best one again.
+                    self._queueBest(u)
+                    continue
+                nbrsU, nbrsV = self._neighbours(u), self._neighbours(v)
+                if not self._canCollapse(u, v, nbrsU, nbrsV):
+                    self.rejected.setdefault(u, set()).add(v)
+                    self._queueBest(u)
+                    continue
+                self._collapse(u, v, nbrsU, nbrsV)
+
+            if self.numTris > target:
+                log.info("Can't simplify below %d triangles (target %d)",
+                    self.numTris, target)
+            alive = np.frombuffer(bytes(self.alive), dtype=np.uint8) != 0
+            tris  = np.array(self.tris, dtype=np.int64).reshape(-1, 3)
+            result.append(tris[alive].reshape(-1))
+        return result
+
+
+def simplifyShape(fshp, ratios=DEFAULT_RATIOS,
+skinPenalty=DEFAULT_SKIN_PENALTY) -> list:
+    """Generate lower LODs of a FSHP from its first LOD.
+
+    The new LODs are appended to `fshp.lods`, replacing any others
+    after the first, and use the same FVTX. Each submesh of the first
+    LOD is simplified separately, so the new LODs have the same
+    submeshes; vertices on the seams between them don't move.
+    `fshp.bbox` and `fshp.bradius` are recomputed.
+    Returns the new LODs.
+    """
+    from .LOD import LOD # avoid circular import
+    fvtx = fshp.fvtx
+    base = fshp.lods[0]
+    if base.prim_fmt != 'triangle_list':
+        raise ValueError("Can't simplify %s: LOD 0 uses %s" % (
+            fshp.name, base.prim_fmt))
+
+    positions = np.asarray(fvtx.attrData['_p0'])[:, 0:3]
+    nInfl   = fvtx.header['skin_weight_influence']
+    skinIdx = fvtx.attrData.get('_i0', None)
+    skinWgt = fvtx.attrData.get('_w0', None)
+    if nInfl == 0 or skinIdx is None: skinIdx = skinWgt = None
+    else:
+        skinIdx = skinIdx[:, 0:nInfl]
+        if skinWgt is not None: skinWgt = skinWgt[:, 0:nInfl]
+
+    ranges = [(s['offset'], s['count'])
+        for s in base.submeshes[0:base.header['submesh_cnt']]]
+    if not ranges: ranges = [(0, len(base.idx_buf))]
+    subVtxs = [np.unique(base.idx_buf[offs:offs+cnt]) for offs, cnt in ranges]
+
+    # vertices at a position used by more than one submesh are on a
+    # seam; moving them would open a crack.
+    _, posIds = np.unique(positions, axis=0, return_inverse=True)
+    posIds = posIds.reshape(-1)
+    useCnt = np.bincount(np.concatenate([np.zeros(0, dtype=np.int64)] +
+        [np.unique(posIds[vtxs]) for vtxs in subVtxs]),
+        minlength=len(positions))
+    seam = useCnt[posIds] > 1
+
+    # simplify each submesh, with only the vertices it uses.
+    subLods = [] # submesh => index array of each new LOD
+    for (offs, cnt), vtxs in zip(ranges, subVtxs):
+        if cnt == 0:
+            subLods.append([np.zeros(0, dtype=np.int64)] * len(ratios))
+            continue
+        local = np.searchsorted(vtxs, base.idx_buf[offs:offs+cnt])
+        simplifier = Simplifier(positions[vtxs], local,
+            None if skinIdx is None else skinIdx[vtxs],
+            None if skinWgt is None else skinWgt[vtxs],
+            skinPenalty, lockedVtxs=np.nonzero(seam[vtxs])[0])
+        subLods.append([vtxs[idxs] for idxs in simplifier.simplify(ratios)])
+
+    lods = []
+    for i in range(len(ratios)):
+        parts = [sub[i].astype(base.idx_buf.dtype) for sub in subLods]
+        idxs  = np.concatenate(parts)
+        lod = LOD(fshp.fres)
+        lod.header = dict(base.header, idx_cnt=len(idxs),
+            submesh_cnt=len(parts), visibility_group=0)
+        lod.headerOffset = None
+        lod.prim_fmt_id = base.prim_fmt_id
+        lod.prim_min, lod.prim_size, lod.prim_fmt = \
+            base.prim_min, base.prim_size, base.prim_fmt
+        lod.idx_fmt = base.idx_fmt
+        lod.idx_buf = idxs
+        lod.submeshes = []
+        offs = 0
+        for part in parts:
+            lod.submeshes.append({'offset':offs, 'count':len(part),
+                'idxs':idxs[offs:offs+len(part)]})
+            offs += len(part)
+        # like the reader, one more submesh than the header says.
+        lod.submeshes.append({'offset':0, 'count':len(idxs), 'idxs':idxs})
+        lods.append(lod)
+        log.info("Shape %s: LOD %d has %d of %d triangles", fshp.name,
+            len(lods), len(idxs) // 3, len(base.idx_buf) // 3)
+
+    fshp.lods = [base] + lods
+    fshp.header['lod_cnt'] = len(fshp.lods)
+    bounds = computeShapeBounds(fshp)
+    fshp.bbox    = bounds['bbox'].astype(np.float32)
+    fshp.bradius = bounds['radius'].astype(np.float32)
+    return lods
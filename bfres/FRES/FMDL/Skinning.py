@@ -0,0 +1,109 @@
+"""Linear blend skinning without Blender.
+
+Deforms a FVTX's vertex positions by a pose of its FSKL, eg for
+rendering thumbnails or computing bounds of a posed model.
+"""
+import logging; log = logging.getLogger(__name__)
+import numpy as np
+
+# vertices to deform at once, by default.
+DEFAULT_CHUNK_SIZE = 65536
+
+
+def computeSkinMtxs(fskl, pose=None) -> np.ndarray:
+    """Compute the matrix for each entry of a skeleton's matrix table.
+
+    fskl: The FSKL.
+    pose: Bones' final matrices, from `FSKL.computePoseTransforms()`.
+        (default: the rest pose)
+
+    Returns array of shape (len(fskl.mtxToBone), 4, 4), for row
+    vectors. Smooth matrices include the inverse bind matrix, since
+    smooth skinned vertices are in model space; rigid skinned
+    vertices are relative to their bone, so rigid matrices don't.
+    """
+    if pose is None: pose = fskl.computeWorldTransforms()
+    table = fskl.mtxToBone
+    if len(table) > 0 and (table.min() < 0 or table.max() >= len(pose)):
+        log.warning("Skeleton matrix table references bones that don't exist")
+    res = pose[np.clip(table, 0, max(len(pose) - 1, 0))]
+
+    nSmooth = len(fskl.smooth_mtxs)
+    res[0:nSmooth] = fskl.invBindMtxs @ res[0:nSmooth]
+    return res
+
+
+def skinVertices(fskl, fvtx, pose=None, chunkSize=DEFAULT_CHUNK_SIZE,
+bone=None) -> np.ndarray:
+    """Deform a FVTX's vertex positions.
+
+    fskl:      The FSKL the FVTX is skinned to.
+    fvtx:      The FVTX.
+    pose:      Bones' final matrices, from
+        `FSKL.computePoseTransforms()`. (default: the rest pose)
+    chunkSize: Max number of vertices to deform at once, to limit
+        memory use, or None for all at once.
+    bone:      Index of the bone that vertices with no skinning
+        attributes are relative to. (the shape's `bone_idx`)
+
+    Returns array of shape (num_vtxs, 3).
+    """
+    if pose is None: pose = fskl.computeWorldTransforms()
+    positions = np.asarray(fvtx.attrData['_p0'], dtype=float)[:, 0:3]
+    nVtxs     = len(positions)
+    nInfl     = fvtx.header['skin_weight_influence']
+    idxs      = fvtx.attrData.get('_i0', None)
+
+    if nInfl == 0 or idxs is None:
+        # the whole shape is attached to one bone.
+        if bone is None:
+            log.warning("FVTX isn't skinned and no bone given; not deforming")
+            return positions.copy()
+        mtx = pose[bone]
+        return positions @ mtx[0:3, 0:3] + mtx[3, 0:3]
+
+    skinMtxs = computeSkinMtxs(fskl, pose)[:, :, 0:3] # (n, 4, 3)
+    nInfl    = min(nInfl, idxs.shape[1])
+    idxs     = np.asarray(idxs[:, 0:nInfl], dtype=np.int64)
+    bad      = (idxs < 0) | (idxs >= len(skinMtxs))
+    if bad.any():
+        log.warning("%d vertex matrix indices are out of range (max %d)",
+            bad.sum(), len(skinMtxs) - 1)
+        idxs = np.where(bad, 0, idxs)
+    weights = _getWeights(fvtx, nInfl, nVtxs)
+    weights = np.where(bad, 0, weights)
+
+    if chunkSize is None: chunkSize = max(nVtxs, 1)
+    res = np.empty((nVtxs, 3))
+    for start in range(0, nVtxs, chunkSize):
+        end = min(start + chunkSize, nVtxs)
+        # blend the matrices, then apply them.
+        mtx = np.einsum('vk,vkij->vij', weights[start:end],
+            skinMtxs[idxs[start:end]])
+        res[start:end] = np.einsum('vi,vij->vj',
+            positions[start:end], mtx[:, 0:3]) + mtx[:, 3]
+    return res
+
+
+def _getWeights(fvtx, nInfl, nVtxs):
+    """Get the skin weights as floats summing to 1."""
+    if nInfl == 1 or '_w0' not in fvtx.attrData:
+        weights = np.zeros((nVtxs, nInfl))
+        weights[:, 0] = 1
+        return weights
+
+    attr    = fvtx.attrsByName['_w0']
+    weights = np.array(fvtx.attrData['_w0'], dtype=float)
+    if weights.shape[1] < nInfl:
+        pad = np.zeros((nVtxs, nInfl - weights.shape[1]))
+        weights = np.concatenate((weights, pad), axis=1)
+    weights = weights[:, 0:nInfl]
+    if attr.format['ctype'] == 'int':
+        weights /= attr.format.get('max', 1)
+
+    # weights are quantized, so they might not sum to exactly 1.
+    # give vertices with no weight entirely to their first bone.
+    total = weights.sum(axis=1)
+    weights[total <= 0, 0] = 1
+    total[total <= 0] = 1
+    return weights / total[:, None]
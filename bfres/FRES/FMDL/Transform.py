@@ -0,0 +1,141 @@
+"""Transform math for many bones at once.
+
+Matrices are laid out to be multiplied by row vectors (translation
+in the bottom row), so a bone's final matrix is its local matrix
+times its parent's final matrix.
+Quaternions are (w, x, y, z).
+"""
+import logging; log = logging.getLogger(__name__)
+from bfres.Exceptions import MalformedFileError
+import numpy as np
+
+
+def quatFromAxisAngle(axis, angle):
+    """Make quaternions rotating by `angle` around `axis`.
+
+    angle: Array of angles in radians.
+    Returns array of shape (n, 4).
+    """
+    angle = np.asarray(angle, dtype=float) / 2
+    s = np.sin(angle)
+    return np.stack((np.cos(angle),
+        axis[0] * s, axis[1] * s, axis[2] * s), axis=-1)
+
+
+def quatMul(a, b):
+    """Multiply arrays of quaternions."""
+    aw, ax, ay, az = np.moveaxis(a, -1, 0)
+    bw, bx, by, bz = np.moveaxis(b, -1, 0)
+    return np.stack((
+        aw*bw - ax*bx - ay*by - az*bz,
+        aw*bx + ax*bw + ay*bz - az*by,
+        aw*by - ax*bz + ay*bw + az*bx,
+        aw*bz + ax*by - ay*bx + az*bw,
+    ), axis=-1)
+
+
+def quatFromEuler(rot):
+    """Convert Euler angles to quaternions.
+
+    rot: Array of shape (n, 3) or more; X, Y, Z angles in radians.
+        Extra columns are ignored.
+    Returns array of shape (n, 4), with non-negative W.
+    """
+    rot = np.asarray(rot, dtype=float)
+    x = quatFromAxisAngle((1,0,0), rot[:, 0])
+    y = quatFromAxisAngle((0,1,0), rot[:, 1])
+    z = quatFromAxisAngle((0,0,1), rot[:, 2])
+    q = quatMul(quatMul(z, y), x)
+    q[q[:, 0] < 0] *= -1
+    return q
+
+
+def quatToMatrix(q):
+    """Convert unit quaternions to rotation matrices.
+
+    Returns array of shape (n, 3, 3), for column vectors.
+    """
+    w, x, y, z = np.moveaxis(np.asarray(q, dtype=float), -1, 0)
+    return np.stack((
+        np.stack((1 - 2*(y*y + z*z),     2*(x*y - w*z),     2*(x*z + w*y)), -1),
+        np.stack((    2*(x*y + w*z), 1 - 2*(x*x + z*z),     2*(y*z - w*x)), -1),
+        np.stack((    2*(x*z - w*y),     2*(y*z + w*x), 1 - 2*(x*x + y*y)), -1),
+    ), axis=-2)
+
+
+def composeSRT(scale, quat, pos):
+    """Build matrices from scale, rotation and translation.
+
+    scale: Array of shape (n, 3).
+    quat:  Array of shape (n, 4).
+    pos:   Array of shape (n, 3).
+    Returns array of shape (n, 4, 4): scale, then rotate, then
+    translate.
+    """
+    scale = np.asarray(scale, dtype=float)
+    rot   = quatToMatrix(quat).transpose(0, 2, 1)
+    res   = np.zeros((len(scale), 4, 4))
+    res[:, 0:3, 0:3] = scale[:, :, None] * rot
+    res[:, 3, 0:3]   = np.asarray(pos, dtype=float)[:, 0:3]
+    res[:, 3, 3]     = 1
+    return res
+
+
+def hierarchyLevels(parents):
+    """Group items of a hierarchy by depth.
+
+    parents: Array of each item's parent index, or -1 if none.
+    Returns list of index arrays; roots first, then their children,
+    and so on.
+
+    Raises MalformedFileError if an item is its own ancestor.
+    """
+    parents = np.asarray(parents)
+    n = len(parents)
+    depth = np.full(n, -1)
+    for i in range(n):
+        chain = []
+        j = i
+        while j >= 0 and depth[j] < 0:
+            chain.append(j)
+            if len(chain) > n:
+                raise MalformedFileError(
+                    "Bone %d is its own ancestor" % i)
+            j = parents[j]
+        d = -1 if j < 0 else depth[j]
+        for k in reversed(chain):
+            d += 1
+            depth[k] = d
+
+    if n == 0: return []
+    return [np.nonzero(depth == d)[0] for d in range(depth.max() + 1)]
+
+
+def concatHierarchy(local, parents, levels=None, out=None, dirty=None):
+    """Compute final matrices of a hierarchy from local matrices.
+
+    local:   Array of shape (n, 4, 4).
+    parents: Array of each item's parent index, or -1 if none.
+    levels:  Result of `hierarchyLevels(parents)`, if already known.
+    out:     Array to write the results to.
+    dirty:   Boolean array of which items changed. If given, only
+        these and their descendants are written to `out`.
+    Returns `out`.
+    """
+    parents = np.asarray(parents)
+    if levels is None: levels = hierarchyLevels(parents)
+    if out    is None: out    = np.zeros(np.shape(local))
+    if dirty  is None: dirty  = np.ones(len(parents), dtype=bool)
+    else: dirty = np.array(dirty, dtype=bool)
+
+    for level in levels:
+        ps   = parents[level]
+        hasP = ps >= 0
+        dirty[level[hasP]] |= dirty[ps[hasP]]
+        sel  = level[dirty[level]]
+        if len(sel) == 0: continue
+        mtx  = local[sel].copy()
+        hasP = parents[sel] >= 0
+        mtx[hasP] = mtx[hasP] @ out[parents[sel][hasP]]
+        out[sel] = mtx
+    return out
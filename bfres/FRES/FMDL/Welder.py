@@ -0,0 +1,78 @@
+"""Merge duplicate vertices.
+
+Vertices are compared by all of their attributes at once: each
+attribute is rounded to a grid of its tolerance, and vertices whose
+rounded values are all the same become one.
+"""
+import logging; log = logging.getLogger(__name__)
+import numpy as np
+
+# attribute name prefix => max difference of vertices to merge.
+# others must match exactly.
+DEFAULT_TOLERANCE = {
+    '_p': 1e-5,  # position
+    '_n': 1/512, # normal
+    '_u': 1/4096, # texture coordinate
+}
+
+
+def _getTolerance(name, tolerance):
+    if name in tolerance: return tolerance[name]
+    return tolerance.get(name[0:2], 0)
+
+
+def _quantize(vals, tol):
+    """Convert values to integers that are equal for values that
+    are in the same cell of a grid of size `tol`.
+    """
+    vals = np.asarray(vals)
+    if vals.ndim == 1: vals = vals[:, None]
+    if vals.dtype.kind in 'iub' and tol < 1:
+        return vals.astype(np.int64)
+    if tol > 0:
+        return np.rint(np.nan_to_num(vals.astype(np.float64)) / tol) \
+            .astype(np.int64)
+    # compare the bits, so only identical values match.
+    vals = np.ascontiguousarray(vals)
+    if   vals.dtype.itemsize == 8: return vals.view(np.int64)
+    elif vals.dtype.itemsize == 4: return vals.view(np.int32).astype(np.int64)
+    elif vals.dtype.itemsize == 2: return vals.view(np.int16).astype(np.int64)
+    return vals.astype(np.int64)
+
+
+def weldVertices(attrs, tolerance=None) -> tuple:
+    """Find vertices that can be merged.
+
+    attrs:     Dict of attribute name => array of each vertex's
+        values, all the same length.
+    tolerance: Dict of attribute name or prefix (eg '_u') => max
+        difference allowed, in the attribute's units. Attributes not
+        listed must match exactly. (default: DEFAULT_TOLERANCE)
+    Returns (keep, remap): array of the old index of each vertex to
+    keep, in their original order, and array of the new index of
+    each old vertex, to remap indices with.
+    Each merged vertex keeps the values of its first duplicate.
+    """
+    if tolerance is None: tolerance = DEFAULT_TOLERANCE
+    counts = set(len(vals) for vals in attrs.values())
+    if len(counts) > 1:
+        raise ValueError("Attributes have different lengths: %s" %
+            sorted(counts))
+    n = counts.pop() if counts else 0
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    key = np.concatenate([_quantize(vals, _getTolerance(name, tolerance))
+        .reshape(n, -1) for name, vals in sorted(attrs.items())], axis=1)
+    _, first, inverse = np.unique(key, axis=0,
+        return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    # number the kept vertices in order of first appearance.
+    order = np.argsort(first, kind='stable')
+    rank  = np.empty(len(first), dtype=np.int64)
+    rank[order] = np.arange(len(first))
+    keep  = first[order]
+    remap = rank[inverse]
+    log.debug("Welded %d vertices into %d", n, len(keep))
+    return keep, remap
@@ -8,7 +8,7 @@ from .FMAT import FMAT
 from .FVTX import FVTX
 from .FSHP import FSHP
 from .FSKL import FSKL
-from bfres.FRES.FresObject import FresObject
+from bfres.FRES.FresObject import FresObject, decodeParts
 
 
 class Header(BinaryStruct):
@@ -46,6 +46,8 @@ class Header(BinaryStruct):
 
 class FMDL(FresObject):
     """A 3D model in an FRES."""
+    Header = Header
+    tables = ('fshp', 'fmat', 'fvtx')
 
     def __init__(self, fres, name=None):
         self.name         = name
@@ -58,6 +60,7 @@ class FMDL(FresObject):
         self.udatas       = []
         self.totalVtxs    = None
         self.skeleton     = None
+        self.dicts        = {} # name => Dict
 
 
     def __str__(self):
@@ -80,54 +83,84 @@ class FMDL(FresObject):
         res = [' '.join(res)]
 
         for fvtx in self.fvtxs:
-            res.append(fvtx.dump())
+            if fvtx is not None: res.append(fvtx.dump())
 
         for i, fmat in enumerate(self.fmats):
+            if fmat is None: continue
             res.append('  FMAT %d:' % i)
             res.append('  '+fmat.dump().replace('\n', '\n  '))
 
         self._dumpFshps(res)
-        res.append('Skeleton:')
-        res.append(self.skeleton.dump())
+        if self.skeleton is None:
+            res.append('Skeleton: not loaded')
+        else:
+            res.append('Skeleton:')
+            res.append(self.skeleton.dump())
         return '\n'.join(res).replace('\n', '\n  ')
 
 
     def _dumpFshps(self, res):
         for i, fshp in enumerate(self.fshps):
+            if fshp is None: continue
             res.append('  FSHP %3d: %s' % (i, fshp.dump()))
 
         res.append('  \x1B[4mFSHP│LOD│Mshs│IdxB│PrimType'+
             '                     │'+
             'IdxTp│IdxCt│VisGp│Unk08   │Unk10   │Unk34   \x1B[0m')
         for i, fshp in enumerate(self.fshps):
+            if fshp is None: continue
             for j, lod in enumerate(fshp.lods):
                 res.append('  %s%4d│%3d│%s\x1B[0m' % (
                     '\x1B[4m' if j == len(fshp.lods) - 1 else '',
                     i, j, lod.dump()))
 
 
-    def readFromFRES(self, offset=None):
-        """Read this object from FRES."""
+    def readFromFRES(self, offset=None, shapes=None, include=decodeParts,
+    missingOk=False):
+        """Read this object from FRES.
+
+        shapes:    Names of shapes to read. (default: all)
+            If given, only those shapes and the materials and vertex
+            buffers they use are read; the others are None.
+        include:   Which parts to read. See `FresObject.decodeParts`.
+        missingOk: Skip names in `shapes` that this model doesn't
+            have, eg when they're shapes of other models.
+
+        Raises KeyError if a named shape doesn't exist, unless
+        `missingOk` is set.
+        """
         if offset is None: offset = self.fres.file.tell()
         self.headerOffset = offset
         self.header = self.fres.read(Header(), offset)
         self.name   = self.header['name']
-
-        self.fmats = self._readObjects('fmat', FMAT)
-        self.fvtxs = self._readObjects('fvtx', FVTX)
-        self.fshps = self._readObjects('fshp', FSHP)
-        self.skeleton = FSKL(self.fres).readFromFRES(
-            self.header['fskl_offset'])
+        readVtxs    = 'vertices' in include
+
+        fshpIdxs = fmatIdxs = fvtxIdxs = None
+        if shapes is not None:
+            fshpIdxs = self._findIdxs('fshp', shapes, missingOk)
+        self.fshps = self._readObjects('fshp', FSHP, only=fshpIdxs,
+            readVtxs=readVtxs)
+        if shapes is not None:
+            fshps    = [fshp for fshp in self.fshps if fshp is not None]
+            fmatIdxs = set(fshp.header['fmat_idx'] for fshp in fshps)
+            fvtxIdxs = set(fshp.header['fvtx_idx'] for fshp in fshps)
+
+        if 'materials' in include:
+            self.fmats = self._readObjects('fmat', FMAT, only=fmatIdxs)
+        if readVtxs:
+            self.fvtxs = self._readObjects('fvtx', FVTX, only=fvtxIdxs)
+        if 'skeleton' in include:
+            self.skeleton = self.fres.resolve(FSKL,
+                self.header['fskl_offset'])
         # XXX udata
         return self
 
 
-    def _readObjects(self, name, cls):
-        """Read objects."""
-        objs = []
-        offs = self.header[name + '_offset']
-        for i in range(self.header[name + '_count']):
-            vtx = cls(self.fres).readFromFRES(offs)
-            objs.append(vtx)
-            offs += cls.Header.size
-        return objs
+    def getShape(self, name, **kwargs):
+        """Get the FSHP with given name, or None."""
+        return self._getObject('fshp', FSHP, name, self.fshps, **kwargs)
+
+
+    def getMaterial(self, name):
+        """Get the FMAT with given name, or None."""
+        return self._getObject('fmat', FMAT, name, self.fmats)
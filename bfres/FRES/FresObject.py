@@ -1,5 +1,14 @@
 import logging; log = logging.getLogger(__name__)
 
+# parts of an FRES that FRES.decode() can be told to read or skip.
+decodeParts = frozenset((
+    'tables',    # relocation table and string table
+    'embeds',    # embedded files
+    'skeleton',  # models' skeletons
+    'materials', # models' materials
+    'vertices',  # models' vertex buffers
+))
+
 class FresObject:
     """Base class for an object in an FRES."""
 
@@ -10,3 +19,99 @@ class FresObject:
     def readFromFRES(self, offset=None):
         """Read this object from the FRES."""
         raise NotImplementedError
+
+
+    # objects that own tables of other objects (eg FRES's models,
+    # FMDL's shapes) find them through their header fields named
+    # after the table: 'x_offset', 'x_dict_offset', and 'x' plus
+    # `countSuffix` for the count. `dicts` holds the Dict of each
+    # table that's been read.
+    countSuffix = '_count'
+    # whether the tables' objects take their name as the second
+    # argument of their constructor.
+    namedObjects = False
+
+    # names of the tables this object has.
+    tables = ()
+
+    def readDicts(self):
+        """Read the Dicts of all tables that haven't been read yet."""
+        for name in self.tables: self._getDict(name)
+        return self
+
+
+    def _getDict(self, name):
+        """Get the Dict of given object type, or None."""
+        from .Dict import Dict # avoid circular import
+        if name not in self.dicts:
+            # some tables (eg FMDL's FVTXs) have no dict.
+            offs = self.header.get(name + '_dict_offset', 0)
+            log.debug("Reading dict '%s' from 0x%X", name, offs)
+            if offs == 0: self.dicts[name] = None
+            else: self.dicts[name] = self.fres.resolve(Dict, offs)
+        return self.dicts[name]
+
+
+    def _findIdxs(self, name, objNames, missingOk=False):
+        """Get the indices of named objects.
+
+        missingOk: Skip names that don't exist, instead of raising
+            KeyError.
+        """
+        objDict = self._getDict(name)
+        idxs = set()
+        for objName in objNames:
+            node = None if objDict is None else objDict.find(objName)
+            if node is not None: idxs.add(node.index)
+            elif not missingOk:
+                raise KeyError("%s '%s' has no %s named '%s'" % (
+                    type(self).__name__, self.name, name.upper(), objName))
+        return idxs
+
+
+    def _readObject(self, name, cls, idx, objName=None, **kwargs):
+        """Read the object at given index of a table."""
+        fres = self.fres
+        # objects may refer to buffers, so be sure those are known,
+        # in case this is read without decoding the whole FRES.
+        if not hasattr(fres, 'bufferSection'): fres._readBufferSection()
+        offs = self.header[name + '_offset'] + (idx * cls.Header.size)
+        log.debug('Reading %s #%2d @ %06X: "%s"',
+            cls.__name__, idx, offs, objName)
+        args = (objName,) if self.namedObjects else ()
+        return fres.resolve(cls, offs, *args, **kwargs)
+
+
+    def _readObjects(self, name, cls, only=None, **kwargs):
+        """Read a table of objects.
+
+        only:   Indices of objects to read. Others are None.
+            (default: all)
+        kwargs: Passed to the objects' `readFromFRES()`.
+        """
+        objs = []
+        objDict = self._getDict(name)
+        if objDict is None and self.namedObjects: return objs
+        for i in range(self.header[name + self.countSuffix]):
+            if only is None or i in only:
+                objName = None if objDict is None else objDict.nodes[i+1].name
+                objs.append(self._readObject(name, cls, i, objName, **kwargs))
+            else:
+                objs.append(None)
+        return objs
+
+
+    def _getObject(self, name, cls, objName, objs, **kwargs):
+        """Get object by name, reading it if necessary.
+
+        objs:   List of the objects already read.
+        kwargs: Passed to the object's `readFromFRES()` if it's read.
+        Returns None if there's no such object.
+        """
+        objDict = self._getDict(name)
+        if objDict is None: return None
+        node = objDict.find(objName)
+        if node is None: return None
+        if node.index < len(objs) and objs[node.index] is not None:
+            return objs[node.index]
+        return self._readObject(name, cls, node.index, objName, **kwargs)
@@ -0,0 +1,662 @@
+"""Write Switch FRES files.
+
+Models are given as arrays of vertex attributes and indices. Structs
+are laid out using the same definitions the reader uses, so anything
+written can be read back by `FRES`.
+"""
+import logging; log = logging.getLogger(__name__)
+from bfres.BinaryStruct.Padding import Padding
+from bfres.BinaryStruct.StringOffset import StringOffset
+from bfres.BinaryStruct.Switch import Offset64
+from bfres.BinaryStruct.Vector import Vector
+from bfres.Common.StringTable import Header as StrTabHeader
+from .Dict import Header as DictHeader, Node as DictNode, makeTree
+from .RLT import Header as RLTHeader, Section as RLTSection, \
+    Entry as RLTEntry
+from .BufferSection import BufferSection
+from .FMDL import Header as FMDLHeader
+from .FMDL.FVTX import Header as FVTXHeader, BufferSizeStruct, \
+    BufferStrideStruct
+from .FMDL.FSHP import Header as FSHPHeader
+from .FMDL.FMAT import Header as FMATHeader, ShaderAssign
+from .FMDL.FSKL import Header as FSKLHeader
+from .FMDL.LOD import Header as LODHeader
+from .FMDL.Bone import BoneStruct
+from .FMDL.Attribute import AttrStruct
+from .FMDL.Attribute.types import attrFmts, encodeArray, chooseFormat
+from .FMDL import Transform
+from .FMDL.MeshOptimizer import optimizeMesh
+import struct
+import numpy as np
+
+BUFFER_ALIGN = 12 # log2 of alignment of the buffer data
+NUM_RLT_SECTIONS = 5
+
+# attribute format used for each kind of attribute, by default.
+defaultAttrFmts = {
+    '_p': 0x1805, # float[3]
+    '_n': 0x1805, # float[3]
+    '_t': 0x1805, # float[3]
+    '_b': 0x1805, # float[3]
+    '_u': 0x1705, # float[2]
+    '_c': 0x1805, # float[3]
+    '_i': 0x0B02, # u8[4]
+    '_w': 0x0B01, # u8[4]
+}
+
+# kinds of attribute whose integer formats are normalized when
+# imported; others can only be given smaller float formats.
+normalizedAttrs = ('_u', '_w')
+floatAttrFmts = [fmtId for fmtId, fmt in attrFmts.items()
+    if fmt['ctype'] == 'float']
+
+
+def _bounds(positions):
+    """Get (center, extent) of the bounding box of positions."""
+    if len(positions) == 0: return np.zeros(3), np.zeros(3)
+    lo, hi = positions.min(axis=0), positions.max(axis=0)
+    return (lo + hi) / 2, (hi - lo) / 2
+
+
+class FresWriter:
+    """Builds a FRES file from array data.
+
+    Usage:
+        writer = FresWriter('name')
+        mdl = writer.addModel('model')
+        writer.addMaterial(mdl, 'material')
+        writer.addShape(mdl, 'shape', {'_p0': positions}, [indices])
+        writer.write(path)
+    """
+
+    def __init__(self, name):
+        self.name   = name
+        self.models = []
+
+
+    def addModel(self, name, bones=None, smoothBones=()) -> dict:
+        """Add a model.
+
+        name:        Model name.
+        bones:       List of dicts with keys 'name', 'parent' (index,
+            or -1 for none) and optionally 'pos', 'rot' (Euler
+            angles in radians) and 'scale'.
+            (default: one bone with the model's name)
+        smoothBones: Bone index of each smooth skinning matrix; vertex
+            `_i0` attributes index this list.
+        Returns the model, to pass to `addShape` and `addMaterial`.
+        """
+        if bones is None: bones = [{'name':name, 'parent':-1}]
+        model = {
+            'name':        name,
+            'bones':       bones,
+            'smoothBones': list(smoothBones),
+            'shapes':      [],
+            'materials':   [],
+        }
+        self.models.append(model)
+        return model
+
+
+    def addMaterial(self, model, name, textures=()) -> int:
+        """Add a material to a model.
+
+        textures: Names of textures it uses.
+        Returns the material's index.
+        """
+        model['materials'].append({'name':name, 'textures':list(textures)})
+        return len(model['materials']) - 1
+
+
+    def addShape(self, model, name, attrs, lods, material=0, bone=0,
+    formats=None, tolerance=None, optimize=False) -> int:
+        """Add a shape to a model.
+
+        attrs:    Dict of attribute name (eg '_p0') => array of
+            shape (num_vtxs, components). Integer arrays are stored
+            as-is, eg weights of 0 to 255; float arrays stored in
+            integer formats are normalized.
+        lods:     List of index arrays, one per LOD, as triangle lists.
+        material: Index of the material to use.
+        bone:     Index of the bone that unskinned vertices are
+            relative to.
+        formats:  Dict of attribute name => format ID, to override
+            `defaultAttrFmts`.
+        tolerance: Max error allowed when storing float attributes
+            in smaller formats, or dict of attribute kind (eg '_n')
+            => max error. Attributes with no tolerance or given
+            format use `defaultAttrFmts`.
+        optimize: Reorder triangles and vertices for the vertex cache;
+            see `MeshOptimizer`.
+        Returns the shape's index.
+        Raises ValueError if an attribute can't be stored in its
+        format.
+        """
+        if '_p0' not in attrs:
+            raise ValueError("Shape '%s' has no positions (_p0)" % name)
+        numVtxs = len(attrs['_p0'])
+        lods = [np.asarray(idxs, dtype=np.int64).reshape(-1) for idxs in lods]
+        if optimize:
+            # the 'Before' stats take an extra pass; they're only logged.
+            lods, order, stats = optimizeMesh(lods, numVtxs,
+                stats=log.isEnabledFor(logging.INFO))
+            attrs = {attrName: np.asarray(vals)[order]
+                for attrName, vals in attrs.items()}
+            for i, st in enumerate(stats):
+                log.info("Shape %s LOD %d: ACMR %.3f => %.3f, ATVR %.3f => %.3f",
+                    name, i, st['acmrBefore'], st['acmrAfter'],
+                    st['atvrBefore'], st['atvrAfter'])
+
+        shapeAttrs = []
+        for attrName, vals in attrs.items():
+            vals = np.asarray(vals)
+            if vals.ndim == 1: vals = vals[:, None]
+            if len(vals) != numVtxs:
+                raise ValueError("Attribute '%s' has %d values, expected %d" %
+                    (attrName, len(vals), numVtxs))
+            fmtId = self._getAttrFmt(attrName, vals, formats, tolerance)
+            # positions stored with 4 components need W = 1.
+            fill  = 1 if attrName.startswith('_p') else 0
+            shapeAttrs.append((attrName, encodeArray(fmtId, vals, fill), fmtId))
+
+        skinCount = 0
+        if '_i0' in attrs: skinCount = np.shape(attrs['_i0'])[1]
+        model['shapes'].append({
+            'name':      name,
+            'attrs':     shapeAttrs,
+            'positions': np.asarray(attrs['_p0'], dtype=float)[:, 0:3],
+            'skinIdxs':  attrs.get('_i0', None),
+            'lods':      lods,
+            'material':  material,
+            'bone':      bone,
+            'skinCount': skinCount,
+            'numVtxs':   numVtxs,
+        })
+        return len(model['shapes']) - 1
+
+
+    def _getAttrFmt(self, attrName, vals, formats, tolerance):
+        """Decide which format to store an attribute in."""
+        kind  = attrName[0:2]
+        fmtId = (formats or {}).get(attrName, None)
+        if fmtId is not None: return fmtId
+
+        if type(tolerance) is dict: tolerance = tolerance.get(kind, None)
+        if tolerance is not None and vals.dtype.kind == 'f':
+            fmtId = chooseFormat(vals, tolerance,
+                None if kind in normalizedAttrs else floatAttrFmts)
+            if fmtId is not None:
+                log.debug("Storing attribute %s as %s", attrName,
+                    attrFmts[fmtId]['name'])
+                return fmtId
+
+        fmtId = defaultAttrFmts.get(kind, None)
+        if fmtId is None:
+            raise ValueError("No format given for attribute '%s'" %
+                attrName)
+        return fmtId
+
+
+    def write(self, path):
+        """Write the FRES to a file."""
+        data = self.build()
+        with open(path, 'wb') as file:
+            file.write(data)
+        log.info("Wrote %s: %d bytes", path, len(data))
+
+
+    def build(self) -> bytes:
+        """Build the FRES file."""
+        from bfres.FRES import SwitchHeader # avoid circular import
+        self.data      = bytearray()
+        self._bufData  = bytearray() # index and vertex buffers
+        self._pointers = [] # offsets of pointers, for the RLT
+        self._strRefs  = [] # (offset, fmt, string, is length-prefixed)
+        self._strings  = {'', self.name} # the header is written last
+        self._structs  = {}
+
+        header   = self._alloc(SwitchHeader.size)
+        mdlArray = self._alloc(FMDLHeader.size * len(self.models))
+        mdlDict  = self._writeDict([mdl['name'] for mdl in self.models])
+        for i, mdl in enumerate(self.models):
+            self._writeModel(mdl, mdlArray + (i * FMDLHeader.size))
+        bufSection = self._alloc(BufferSection.size)
+
+        strTab, strEnd = self._writeStrTab()
+        bufStart = self._alloc(len(self._bufData), 1 << BUFFER_ALIGN)
+        self.data[bufStart:] = self._bufData
+        self._writeStruct(BufferSection, bufSection,
+            size=len(self._bufData), buf_offs=bufStart)
+
+        self._writeStruct(SwitchHeader, header,
+            version    = (3, 5),
+            byte_order = 0xFFFE, # little endian
+            alignment  = BUFFER_ALIGN,
+            name       = self.name,
+            name2      = self.name,
+            fmdl_offset      = mdlArray if self.models else 0,
+            fmdl_dict_offset = mdlDict,
+            buf_section_offset = bufSection,
+            str_tab_offset = strTab + StrTabHeader.size,
+            str_tab_size   = strEnd - strTab,
+            fmdl_cnt       = len(self.models),
+        )
+        self._resolveStrings()
+
+        # the RLT must come last, since it lists every pointer.
+        rlt = self._writeRLT(strEnd, bufStart, len(self._bufData))
+        struct.pack_into('<2I', self.data, 0x18, rlt, len(self.data))
+        log.debug("Built FRES '%s': %d bytes, %d pointers, %d strings",
+            self.name, len(self.data), len(self._pointers),
+            len(self._strings))
+        return bytes(self.data)
+
+
+    def _alloc(self, size, align=8):
+        """Add `size` zero bytes to the file, aligned.
+
+        Returns their offset.
+        """
+        self.data.extend(bytes(-len(self.data) % align))
+        offset = len(self.data)
+        self.data.extend(bytes(size))
+        return offset
+
+
+    def _addBuffer(self, data, align=8):
+        """Add data to the buffer section.
+
+        Returns its offset relative to the buffer section, and its
+        size padded to `align`.
+        """
+        self._bufData.extend(bytes(-len(self._bufData) % align))
+        offset = len(self._bufData)
+        self._bufData.extend(data)
+        self._bufData.extend(bytes(-len(self._bufData) % align))
+        return offset, len(self._bufData) - offset
+
+
+    def _getStruct(self, cls):
+        """Get an instance of a BinaryStruct class."""
+        res = self._structs.get(cls, None)
+        if res is None:
+            res = cls()
+            self._structs[cls] = res
+        return res
+
+
+    def _writeStruct(self, cls, offset=None, **values):
+        """Write a BinaryStruct.
+
+        offset: Where to write it. (default: allocate space)
+        values: Field values. Fields not given are zero, except
+            `magic`. Strings are given as str and placed in the
+            string table.
+        Returns the offset.
+        """
+        st = self._getStruct(cls)
+        if offset is None: offset = self._alloc(st.size)
+        if 'magic' in st.fields and 'magic' not in values:
+            values['magic'] = cls.magic
+
+        for field in st.orderedFields:
+            typ = field['type']
+            val = values.get(field['name'], None)
+            pos = offset + field['offset']
+            if val is None or isinstance(typ, Padding): continue
+
+            if isinstance(typ, StringOffset):
+                self._addStrRef(pos, typ.fmt, val,
+                    typ.lenprefix is not None)
+            elif isinstance(typ, Vector):
+                struct.pack_into('<%d%s' % (typ.count, typ.fmt),
+                    self.data, pos, *val)
+            else:
+                fmt = typ if type(typ) is str else typ.fmt
+                if fmt[0] not in '<>': fmt = '<' + fmt
+                if type(val) not in (tuple, list): val = (val,)
+                struct.pack_into(fmt, self.data, pos, *val)
+                if isinstance(typ, Offset64) and val[0]:
+                    self._pointers.append(pos)
+        return offset
+
+
+    def _writeArray(self, fmt, vals):
+        """Write an array of values.
+
+        Returns its offset, or 0 if it's empty.
+        """
+        vals = np.asarray(vals, dtype=fmt).reshape(-1)
+        if len(vals) == 0: return 0
+        offset = self._alloc(vals.nbytes)
+        self.data[offset : offset + vals.nbytes] = vals.tobytes()
+        return offset
+
+
+    def _addStrRef(self, offset, fmt, string, prefixed=True):
+        """Point a field to a string.
+
+        prefixed: Point to the string's length prefix instead of
+            its first character.
+        """
+        if fmt[0] not in '<>': fmt = '<' + fmt
+        self._strings.add(string)
+        self._strRefs.append((offset, fmt, string, prefixed))
+
+
+    def _writeStrArray(self, strings):
+        """Write an array of string pointers.
+
+        Returns its offset, or 0 if it's empty.
+        """
+        if len(strings) == 0: return 0
+        offset = self._alloc(8 * len(strings))
+        for i, string in enumerate(strings):
+            self._addStrRef(offset + (i*8), 'Q', string)
+        return offset
+
+
+    def _writeStrTab(self):
+        """Write the string table.
+
+        Returns (offset, end offset).
+        """
+        strs   = sorted(self._strings) # '' comes first
+        offset = self._alloc(StrTabHeader.size)
+        self._strOffsets = {}
+        for string in strs:
+            data = string.encode('shift-jis')
+            self.data.extend(bytes(len(self.data) & 1)) # pad to u16
+            self._strOffsets[string] = len(self.data)
+            self.data.extend(struct.pack('<H', len(data)) + data + b'\0')
+
+        end = len(self.data)
+        self._writeStruct(StrTabHeader, offset,
+            size=end - offset, num_strs=len(strs))
+        return offset, end
+
+
+    def _resolveStrings(self):
+        """Fill in the offsets of strings."""
+        for offset, fmt, string, prefixed in self._strRefs:
+            target = self._strOffsets[string]
+            if not prefixed: target += 2
+            struct.pack_into(fmt, self.data, offset, target)
+            # length-prefixed string offsets are 64 bits, even when
+            # the struct treats the upper half as a separate field.
+            if prefixed: self._pointers.append(offset)
+
+
+    def _writeRLT(self, strEnd, bufStart, bufSize):
+        """Write the relocation table.
+
+        Returns its offset.
+        """
+        # list runs of consecutive pointers as one entry each.
+        ptrs   = np.unique(np.array(self._pointers, dtype=np.int64))
+        starts = np.nonzero(np.diff(ptrs, prepend=-8) != 8)[0]
+        runs   = []
+        for start, end in zip(starts, list(starts[1:]) + [len(ptrs)]):
+            for i in range(start, end, 255):
+                runs.append((int(ptrs[i]), min(255, end - i)))
+
+        offset = self._alloc(RLTHeader.size +
+            (RLTSection.size * NUM_RLT_SECTIONS) +
+            (RLTEntry.size * len(runs)))
+        self._writeStruct(RLTHeader, offset,
+            curOffset=offset, numSections=NUM_RLT_SECTIONS)
+
+        # section 0: everything up to the end of the string table.
+        # section 1: the buffers, which have no pointers.
+        sections = [
+            {'curOffset':0, 'size':strEnd, 'idx':0, 'count':len(runs)},
+            {'curOffset':bufStart, 'size':bufSize, 'idx':len(runs)},
+        ]
+        pos = offset + RLTHeader.size
+        for i in range(NUM_RLT_SECTIONS):
+            sec = sections[i] if i < len(sections) else {'idx':len(runs)}
+            self._writeStruct(RLTSection, pos, **sec)
+            pos += RLTSection.size
+        for ptr, count in runs:
+            self._writeStruct(RLTEntry, pos,
+                curOffset=ptr, structCount=1, offsetCount=count)
+            pos += RLTEntry.size
+        return offset
+
+
+    def _writeDict(self, names):
+        """Write a Dict of names.
+
+        Returns its offset.
+        """
+        nodes  = makeTree(names)
+        offset = self._alloc(DictHeader.size + (DictNode.size * len(nodes)))
+        self._writeStruct(DictHeader, offset,
+            magic=b'_DIC', num_items=len(names))
+        pos = offset + DictHeader.size
+        for search, left, right, name in nodes:
+            self._writeStruct(DictNode, pos, search_value=search,
+                left_idx=left, right_idx=right, name=name)
+            pos += DictNode.size
+        return offset
+
+
+    def _writeModel(self, mdl, offset):
+        """Write a model's FMDL and everything in it."""
+        shapes, mats = mdl['shapes'], mdl['materials']
+        fvtxArray = self._alloc(FVTXHeader.size * len(shapes))
+        fshpArray = self._alloc(FSHPHeader.size * len(shapes))
+        fmatArray = self._alloc(FMATHeader.size * len(mats))
+        fshpDict  = self._writeDict([shape['name'] for shape in shapes])
+        fmatDict  = self._writeDict([mat['name'] for mat in mats])
+        fskl      = self._writeSkeleton(mdl)
+
+        for i, shape in enumerate(shapes):
+            fvtx = fvtxArray + (i * FVTXHeader.size)
+            self._writeFvtx(shape, fvtx, i)
+            self._writeShape(mdl, shape, fshpArray + (i * FSHPHeader.size),
+                i, fvtx)
+        for i, mat in enumerate(mats):
+            self._writeMaterial(mat, fmatArray + (i * FMATHeader.size), i)
+
+        self._writeStruct(FMDLHeader, offset,
+            name        = mdl['name'],
+            fskl_offset = fskl,
+            fvtx_offset = fvtxArray if shapes else 0,
+            fshp_offset = fshpArray if shapes else 0,
+            fshp_dict_offset = fshpDict,
+            fmat_offset = fmatArray if mats else 0,
+            fmat_dict_offset = fmatDict,
+            fvtx_count  = len(shapes),
+            fshp_count  = len(shapes),
+            fmat_count  = len(mats),
+        )
+        # this is 32 bits; the reader only uses the lower half.
+        totalVtxs = sum(shape['numVtxs'] for shape in shapes)
+        struct.pack_into('<I', self.data, offset +
+            self._getStruct(FMDLHeader).fields['total_vtxs']['offset'],
+            totalVtxs)
+
+
+    def _writeSkeleton(self, mdl):
+        """Write a model's FSKL.
+
+        Returns its offset.
+        """
+        bones  = mdl['bones']
+        smooth = mdl['smoothBones']
+        nBones = len(bones)
+
+        pos   = np.array([b.get('pos',   (0,0,0))[0:3] for b in bones], float)
+        rot   = np.array([b.get('rot',   (0,0,0))[0:3] for b in bones], float)
+        scale = np.array([b.get('scale', (1,1,1))[0:3] for b in bones], float)
+        parents = np.array([b['parent'] for b in bones], dtype=np.int64)
+        pos, rot, scale = (a.reshape(nBones, 3) for a in (pos, rot, scale))
+
+        # inverse bind matrices of the smooth matrices, stored as
+        # 3 rows of 4 for column vectors.
+        local   = Transform.composeSRT(scale, Transform.quatFromEuler(rot),
+            pos)
+        world   = Transform.concatHierarchy(local, parents)
+        invBind = np.linalg.inv(world[np.array(smooth, dtype=np.int64)])
+        invBind = invBind[:, :, 0:3].transpose(0, 2, 1)
+
+        offset     = self._alloc(FSKLHeader.size)
+        boneDict   = self._writeDict([b['name'] for b in bones])
+        smoothIdxs = self._writeArray('<i2', smooth)
+        smoothMtxs = self._writeArray('<f4', invBind)
+        boneArray  = self._alloc(BoneStruct.size * nBones)
+        smoothIdxOf = {bone: i for i, bone in reversed(list(enumerate(smooth)))}
+        for i, bone in enumerate(bones):
+            self._writeStruct(BoneStruct, boneArray + (i * BoneStruct.size),
+                name           = bone['name'],
+                bone_idx       = i,
+                parent_idx     = bone['parent'],
+                smooth_mtx_idx = smoothIdxOf.get(i, -1),
+                rigid_mtx_idx  = -1,
+                billboard_idx  = -1,
+                flags          = 0x00001001, # VISIBLE, EULER
+                scale          = scale[i],
+                rot            = tuple(rot[i]) + (1.0,),
+                pos            = pos[i],
+            )
+
+        self._writeStruct(FSKLHeader, offset,
+            bone_idx_group_offs = boneDict,
+            bone_array_offs     = boneArray,
+            smooth_idx_offs     = smoothIdxs,
+            smooth_mtx_offs     = smoothMtxs,
+            flags               = 0x00001100, # SCALE_STD, EULER
+            num_bones           = nBones,
+            num_smooth_idxs     = len(smooth),
+        )
+        return offset
+
+
+    def _writeFvtx(self, shape, offset, index):
+        """Write a shape's FVTX, interleaving its attributes into
+        one vertex buffer.
+        """
+        # lay out the attributes, each aligned to its type's size.
+        names, fmts, offsets = [], [], []
+        stride = 0
+        for name, vals, fmtId in shape['attrs']:
+            stride += -stride % vals.dtype.itemsize
+            names.append(name)
+            fmts.append((vals.dtype, (vals.shape[1],)))
+            offsets.append(stride)
+            stride += vals.dtype.itemsize * vals.shape[1]
+        stride += -stride % 4
+
+        vtxs = np.zeros(shape['numVtxs'], np.dtype({'names':names,
+            'formats':fmts, 'offsets':offsets, 'itemsize':max(stride, 1)}))
+        for name, vals, fmtId in shape['attrs']:
+            vtxs[name] = vals
+        bufOffs, bufSize = self._addBuffer(vtxs.tobytes())
+
+        attrArray = self._alloc(AttrStruct.size * len(names))
+        for i, (name, vals, fmtId) in enumerate(shape['attrs']):
+            self._writeStruct(AttrStruct, attrArray + (i * AttrStruct.size),
+                name=name, format=fmtId, buf_offs=offsets[i], buf_idx=0)
+        attrDict = self._writeDict(names)
+        sizes    = self._writeStruct(BufferSizeStruct,
+            size=bufSize, gpuAccessFlags=5)
+        strides  = self._writeStruct(BufferStrideStruct, stride=stride)
+
+        self._writeStruct(FVTXHeader, offset,
+            vtx_attrib_array_offs = attrArray if names else 0,
+            vtx_attrib_dict_offs  = attrDict,
+            vtx_bufsize_offs      = sizes,
+            vtx_stridesize_offs   = strides,
+            vtx_buf_offs          = bufOffs,
+            num_attrs             = len(names),
+            num_bufs              = 1,
+            index                 = index,
+            num_vtxs              = shape['numVtxs'],
+            skin_weight_influence = shape['skinCount'],
+        )
+
+
+    def _writeShape(self, mdl, shape, offset, index, fvtx):
+        """Write a shape's FSHP and LODs."""
+        lods      = shape['lods']
+        positions = shape['positions']
+
+        lodArray = self._alloc(LODHeader.size * len(lods))
+        radii    = []
+        bounds   = []
+        for i, idxs in enumerate(lods):
+            if len(idxs) and (idxs.min() < 0 or idxs.max() >= shape['numVtxs']):
+                raise ValueError("Shape '%s' LOD %d indices are out of range" %
+                    (shape['name'], i))
+            idxType, dtype = (0x01, '<u2') if shape['numVtxs'] <= 0x10000 \
+                else (0x02, '<u4')
+            faceOffs, size = self._addBuffer(idxs.astype(dtype).tobytes())
+
+            # one submesh, plus the whole LOD again for readers that
+            # expect submesh_cnt + 1 entries.
+            submeshes = self._writeArray('<u4', [0, len(idxs), 0, len(idxs)])
+            sizes = self._writeStruct(BufferSizeStruct,
+                size=size, gpuAccessFlags=5)
+            self._writeStruct(LODHeader, lodArray + (i * LODHeader.size),
+                submesh_array_offs = submeshes,
+                idx_buf_offs       = sizes,
+                face_offs          = faceOffs,
+                prim_fmt           = 0x03, # triangle_list
+                idx_type           = idxType,
+                idx_cnt            = len(idxs),
+                submesh_cnt        = 1,
+            )
+
+            used = positions[np.unique(idxs)]
+            center, extent = _bounds(used)
+            if i == 0: bounds.append((center, extent))
+            radii.append(np.sqrt(((used - center) ** 2).sum(axis=1)).max()
+                if len(used) else 0)
+
+        # the last bounding box covers the whole shape.
+        bounds.append(_bounds(positions[np.unique(np.concatenate(
+            [np.zeros(0, dtype=np.int64)] + list(lods)))]))
+        bbox    = self._writeArray('<f4', [np.concatenate(b) for b in bounds])
+        bradius = self._writeArray('<f4', radii)
+
+        skinBones = []
+        if shape['skinCount'] > 0:
+            smooth = np.array(mdl['smoothBones'], dtype=np.int64)
+            used = np.unique(np.asarray(shape['skinIdxs'], dtype=np.int64))
+            skinBones = np.unique(smooth[used[used < len(smooth)]])
+        skinArray = self._writeArray('<u2', skinBones)
+
+        self._writeStruct(FSHPHeader, offset,
+            name                = shape['name'],
+            fvtx_offset         = fvtx,
+            lod_offset          = lodArray if lods else 0,
+            fskl_idx_array_offs = skinArray,
+            bbox_offset         = bbox,
+            bradius_offset      = bradius,
+            index               = index,
+            fmat_idx            = shape['material'],
+            single_bind         = shape['bone'],
+            fvtx_idx            = index,
+            skin_bone_idx_cnt   = len(skinBones),
+            vtx_skin_cnt        = shape['skinCount'],
+            lod_cnt             = len(lods),
+        )
+
+
+    def _writeMaterial(self, mat, offset, index):
+        """Write a material's FMAT."""
+        textures = mat['textures']
+        assign = self._writeStruct(ShaderAssign, name='', name2='',
+            mat_param_dict=self._writeDict([]))
+        texRefs  = self._writeStrArray(textures)
+        texSlots = self._writeArray('<i8', range(len(textures)))
+        self._writeStruct(FMATHeader, offset,
+            name               = mat['name'],
+            shader_assign_offs = assign,
+            tex_ref_array_offs = texRefs,
+            tex_slot_offs      = texSlots,
+            mat_flags          = 1,
+            section_idx        = index,
+            tex_ref_cnt        = len(textures),
+        )
@@ -4,7 +4,9 @@ from bfres.BinaryStruct.Padding import Padding
 from bfres.BinaryStruct.StringOffset import StringOffset
 from bfres.BinaryStruct.Switch import Offset32, Offset64, String
 from bfres.BinaryFile import BinaryFile
+from bfres.Exceptions import MalformedFileError
 from .FresObject import FresObject
+import numpy as np
 
 # https://wiki.oatmealdome.me/BFRES_(File_Format)#Relocation_Table
 # BFRES always has 5 sections (some may be unused):
@@ -17,6 +19,10 @@ from .FresObject import FresObject
 # actually parsing them, the whole file is loaded into memory,
 # and this table is used to locate the structs. So the pointers
 # must be correct, but mostly aren't needed to parse the file.
+#
+# Each entry describes `structCount` structs, starting at `curOffset`,
+# which each have `offsetCount` consecutive pointers followed by
+# `stride` other 8-byte values.
 
 class Header(BinaryStruct):
     """RLT header."""
@@ -63,6 +69,7 @@ class RLT(FresObject):
 
     def __init__(self, fres):
         self.fres = fres
+        self._pointerMap = None
 
 
     def dump(self):
@@ -110,3 +117,99 @@ class RLT(FresObject):
             self.entries.append(entry)
 
         return self
+
+
+    def pointerMap(self) -> np.ndarray:
+        """Get the file offset of every pointer in the file.
+
+        Returns an array of offsets, in the order of the entries
+        that list them.
+        """
+        if self._pointerMap is None:
+            def field(name):
+                return np.array([e[name] for e in self.entries], np.int64)
+            curOffs  = field('curOffset')
+            nStructs = field('structCount')
+            nOffsets = field('offsetCount')
+            strides  = field('stride')
+
+            # expand every entry to one item per pointer.
+            counts = nStructs * nOffsets
+            entry  = np.repeat(np.arange(len(counts)), counts)
+            idx    = np.arange(counts.sum()) - \
+                np.repeat(np.cumsum(counts) - counts, counts)
+            strIdx = idx // nOffsets[entry]
+            ptr    = idx %  nOffsets[entry]
+            self._pointerMap = curOffs[entry] + 8 * (
+                (strIdx * (nOffsets[entry] + strides[entry])) + ptr)
+        return self._pointerMap
+
+
+    def readPointers(self, data=None) -> np.ndarray:
+        """Read the value of every pointer in `pointerMap()`.
+
+        data: The file contents. (default: read from the FRES)
+        """
+        if data is None: data = self.fres.read(self.fres.file.size, 0)
+        data = np.frombuffer(data, np.uint8)
+        idxs = self.pointerMap()[:, None] + np.arange(8)
+        return data[idxs].view(self.fres.byteOrderFmt + 'u8')[:, 0]
+
+
+    def checkPointers(self, data=None):
+        """Check that every pointer, and what it points to, is
+        within the file.
+
+        data: The file contents. (default: read from the FRES)
+
+        Raises MalformedFileError if not.
+        """
+        if data is None: data = self.fres.read(self.fres.file.size, 0)
+        size = len(data)
+        locs = self.pointerMap()
+        bad  = np.nonzero(locs + 8 > size)[0]
+        if len(bad) > 0:
+            log.error("RLT: %d pointers are past EOF (0x%X), first at 0x%X",
+                len(bad), size, locs[bad[0]])
+            raise MalformedFileError("Relocation table is out of bounds")
+
+        # don't complain about == size because some files have an
+        # offset field that's their own size
+        vals = self.readPointers(data)
+        bad  = np.nonzero(vals > size)[0]
+        if len(bad) > 0:
+            log.error("RLT: %d pointers point past EOF (0x%X), first at 0x%X = 0x%X",
+                len(bad), size, locs[bad[0]], vals[bad[0]])
+            raise MalformedFileError("Pointer out of bounds")
+
+
+    def relocate(self, data:bytearray, offset:int, delta:int):
+        """Adjust pointers after inserting bytes into the file.
+
+        data:   The file contents, with `delta` bytes already inserted
+            at `offset` (or removed, if `delta` is negative).
+        offset: Where the bytes were inserted.
+        delta:  Number of bytes inserted.
+
+        Pointers to `offset` or later are moved, both in `data` and
+        in this table. Null pointers are left alone.
+        Offsets which aren't in this table (such as the RLT's own)
+        are up to the caller.
+        """
+        fmt  = self.fres.byteOrderFmt + 'u8'
+        locs = self.pointerMap()
+        locs = np.where(locs >= offset, locs + delta, locs)
+
+        buf  = np.frombuffer(data, np.uint8)
+        idxs = locs[:, None] + np.arange(8)
+        vals = buf[idxs].view(fmt)[:, 0].astype(np.int64)
+        vals = np.where((vals >= offset) & (vals != 0), vals + delta, vals)
+        buf[idxs] = vals.astype(fmt).view(np.uint8).reshape(-1, 8)
+
+        for entry in self.entries:
+            if entry['curOffset'] >= offset: entry['curOffset'] += delta
+        for sec in self.sections:
+            if sec['curOffset'] >= offset: sec['curOffset'] += delta
+            elif sec['curOffset'] + sec['size'] > offset:
+                sec['size'] += delta
+        self._pointerMap = None
@@ -0,0 +1,388 @@
+"""Save and load decoded FRES objects.
+
+A snapshot file is laid out as:
+    Header (see `Header` below)
+    Raw array data, each array aligned to `ALIGN` bytes
+    Metadata: UTF-8 JSON describing the objects
+
+Arrays are stored as-is, so on load they can be mapped into memory
+instead of being read and parsed. Nothing in the file is executed
+or unpickled; it can only refer to classes defined in the `bfres`
+package and to functions passed to `registerFunction()`.
+
+Objects can define `__getstate__` and `__setstate__` to control
+what is saved, like with `pickle`.
+"""
+import logging; log = logging.getLogger(__name__)
+from bfres.BinaryStruct import BinaryStruct
+from bfres.BinaryFile import BinaryFile
+from enum import Enum
+import base64
+import hashlib
+import importlib
+import json
+import mmap
+import os
+import os.path
+import struct
+import tempfile
+import types
+import numpy as np
+
+VERSION = 1
+ALIGN   = 64 # alignment of array data
+
+# smaller bytes objects and lists are stored in the metadata.
+MIN_RAW_SIZE = 64
+
+
+class Header(BinaryStruct):
+    """Snapshot file header."""
+    magic  = b'FRESSNAP'
+    fields = (
+        ('8s',  'magic'),     # 0x00
+        ('I',   'version'),   # 0x08
+        ('I',   'flags'),     # 0x0C; unused, 0
+        ('Q',   'meta_offs'), # 0x10; offset of metadata
+        ('Q',   'meta_size'), # 0x18; size of metadata
+        ('Q',   'src_size'),  # 0x20; size of source file
+        ('d',   'src_mtime'), # 0x28; modification time of source file
+        ('20s', 'src_hash'),  # 0x30; SHA-1 of source file
+        ('4s',  'reserved'),  # 0x44
+    )
+    size = 0x48
+
+_headerFmt = '<' + ''.join(typ for typ, name in Header.fields)
+
+
+# functions that snapshots may refer to, by saved name. anything
+# else a snapshot names must be a class defined in bfres.
+_functions = {}
+
+
+def registerFunction(func):
+    """Allow snapshots to refer to a function.
+
+    Returns the function, so this can be used as a decorator.
+    """
+    _functions[_qualName(func)] = func
+    return func
+
+
+def _qualName(obj):
+    """Get the name a class or function is saved as."""
+    module = obj.__module__
+    if module != 'bfres' and not module.startswith('bfres.'):
+        raise TypeError("Can't save reference to %s.%s" % (
+            module, obj.__qualname__))
+    return '%s:%s' % (module, obj.__qualname__)
+
+
+def _fromQualName(name):
+    """Find a class saved by `_qualName`.
+
+    Only classes defined in the bfres package are found, and only by
+    the name they're defined under, so a snapshot can't reach other
+    objects through names that modules import.
+    Raises ValueError if there's no such class.
+    """
+    module, _, qualName = str(name).partition(':')
+    if module != 'bfres' and not module.startswith('bfres.'):
+        raise ValueError("Snapshot references %s" % name)
+    try:
+        obj = importlib.import_module(module)
+        for part in qualName.split('.'):
+            obj = getattr(obj, part)
+    except (ImportError, AttributeError) as ex:
+        raise ValueError("Snapshot references %s: %s" % (name, ex))
+    if not isinstance(obj, type) or obj.__module__ != module \
+    or obj.__qualname__ != qualName:
+        raise ValueError("Snapshot references %s, which isn't a class "
+            "defined in bfres" % name)
+    return obj
+
+
+def _fromFuncName(name):
+    """Find a class or registered function saved by `_qualName`."""
+    func = _functions.get(name, None)
+    if func is not None: return func
+    return _fromQualName(name)
+
+
+def _getState(obj):
+    """Get the attributes of an object to save."""
+    getState = getattr(obj, '__getstate__', None)
+    state = None if getState is None else getState()
+    if state is None: state = getattr(obj, '__dict__', {})
+    if type(state) is not dict:
+        raise TypeError("Can't save %s with state of type %s" % (
+            type(obj).__name__, type(state).__name__))
+    return state
+
+
+def _fileInfo(path):
+    """Get (size, mtime, hash) of a file."""
+    st = os.stat(path)
+    h  = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            h.update(chunk)
+    return st.st_size, st.st_mtime, h.digest()
+
+
+class _Encoder:
+    """Converts objects to JSON-compatible values and arrays."""
+
+    def __init__(self):
+        self.objects = [] # encoded objects
+        self.objIds  = {} # id(obj) => index in objects
+        self.arrays  = [] # numpy arrays
+        self._keep   = [] # keep objects alive so their IDs stay unique
+        self._queue  = []
+
+
+    def encodeGraph(self, root):
+        """Encode `root` and every object it refers to."""
+        res = self.encode(root)
+        # encode objects as they're found, rather than recursively,
+        # so long chains of objects don't hit the recursion limit.
+        while self._queue:
+            idx, obj = self._queue.pop()
+            state = _getState(obj)
+            self.objects[idx] = {
+                'cls':   _qualName(type(obj)),
+                'state': self._encodeDict(state),
+            }
+        return res
+
+
+    def _addArray(self, arr):
+        self.arrays.append(np.ascontiguousarray(arr))
+        return len(self.arrays) - 1
+
+
+    def _encodeDict(self, val):
+        if all(type(k) is str and not k.startswith('$') for k in val):
+            return {k: self.encode(v) for k, v in val.items()}
+        return {'$d': [[self.encode(k), self.encode(v)]
+            for k, v in val.items()]}
+
+
+    def encode(self, val):
+        """Encode one value."""
+        typ = type(val)
+        if val is None or typ in (bool, int, float, str): return val
+        if isinstance(val, Enum):
+            return {'$e': [_qualName(typ), val.value]}
+        if isinstance(val, np.generic): return val.item()
+        if typ in (bytes, bytearray, memoryview):
+            val = bytes(val)
+            if len(val) < MIN_RAW_SIZE:
+                return {'$b': base64.b64encode(val).decode('ascii')}
+            return {'$B': self._addArray(np.frombuffer(val, np.uint8))}
+        if typ is np.ndarray:
+            if val.dtype.hasobject:
+                raise TypeError("Can't save array of Python objects")
+            return {'$a': self._addArray(val)}
+        if typ is tuple: return {'$t': [self.encode(v) for v in val]}
+        if typ in (set, frozenset):
+            return {'$s': [self.encode(v) for v in val]}
+        if typ is list:
+            if len(val) >= MIN_RAW_SIZE and \
+            all(type(v) is int for v in val):
+                try: return {'$L': self._addArray(np.array(val, np.int64))}
+                except OverflowError: pass
+            return [self.encode(v) for v in val]
+        if typ is dict: return self._encodeDict(val)
+        if typ is type: return {'$f': _qualName(val)}
+        if typ is types.FunctionType:
+            name = _qualName(val)
+            if _functions.get(name, None) is not val:
+                raise TypeError("Can't save reference to unregistered "
+                    "function %s; see `registerFunction()`" % name)
+            return {'$f': name}
+
+        # some other object.
+        key = id(val)
+        if key not in self.objIds:
+            _qualName(typ) # fail early on classes we can't restore
+            self.objIds[key] = len(self.objects)
+            self.objects.append(None)
+            self._keep.append(val)
+            self._queue.append((self.objIds[key], val))
+        return {'$o': self.objIds[key]}
+
+
+class _Decoder:
+    """Converts values produced by `_Encoder` back to objects."""
+
+    def __init__(self, meta, arrays):
+        self.meta    = meta
+        self.arrays  = arrays
+        self.objects = []
+
+
+    def decodeGraph(self):
+        """Rebuild the objects and return the root."""
+        # create all objects first, so that references between
+        # them can be resolved in any order.
+        for entry in self.meta['objects']:
+            cls = _fromQualName(entry['cls'])
+            self.objects.append(cls.__new__(cls))
+
+        for obj, entry in zip(self.objects, self.meta['objects']):
+            state = self.decode(entry['state'])
+            setState = getattr(obj, '__setstate__', None)
+            if setState is not None: setState(state)
+            else: obj.__dict__.update(state)
+        return self.decode(self.meta['root'])
+
+
+    def decode(self, val):
+        """Decode one value."""
+        if type(val) is list: return [self.decode(v) for v in val]
+        if type(val) is not dict: return val
+        if len(val) != 1 or not next(iter(val)).startswith('$'):
+            return {k: self.decode(v) for k, v in val.items()}
+
+        tag, arg = next(iter(val.items()))
+        if tag == '$o': return self.objects[arg]
+        if tag == '$a': return self.arrays[arg]
+        if tag == '$B': return self.arrays[arg].tobytes()
+        if tag == '$L': return self.arrays[arg].tolist()
+        if tag == '$b': return base64.b64decode(arg)
+        if tag == '$t': return tuple(self.decode(v) for v in arg)
+        if tag == '$s': return set(self.decode(v) for v in arg)
+        if tag == '$d':
+            return {self.decode(k): self.decode(v) for k, v in arg}
+        if tag == '$e':
+            cls = _fromQualName(arg[0])
+            if not issubclass(cls, Enum):
+                raise ValueError("Snapshot enum %s is not an Enum" % arg[0])
+            return cls(arg[1])
+        if tag == '$f': return _fromFuncName(arg)
+        raise ValueError("Unknown snapshot value type '%s'" % tag)
+
+
+def saveSnapshot(fres, path, source=None):
+    """Save a decoded FRES to a snapshot file.
+
+    fres:   The FRES to save.
+    path:   Path to write the snapshot to.
+    source: Path of the file the FRES was read from, used to
+        tell if the snapshot is out of date. (default: the path
+        of `fres.file`, if it has one)
+    """
+    if source is None:
+        source = getattr(fres.file, 'name', None)
+        if type(source) is not str: source = None
+    if source is not None:
+        source = os.path.abspath(source)
+        srcSize, srcMtime, srcHash = _fileInfo(source)
+    else:
+        log.warning("Snapshot %s has no source file to check against", path)
+        srcSize, srcMtime, srcHash = 0, 0, bytes(20)
+
+    enc  = _Encoder()
+    root = enc.encodeGraph(fres)
+
+    # write to a temp file first so that a half-written snapshot
+    # is never loaded.
+    dirName = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=dirName, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(bytes(Header.size))
+            arrays = []
+            for arr in enc.arrays:
+                offs = -file.tell() % ALIGN
+                file.write(bytes(offs))
+                arrays.append({
+                    'offset': file.tell(),
+                    'dtype':  arr.dtype.str,
+                    'shape':  list(arr.shape),
+                })
+                file.write(arr.tobytes())
+
+            meta = json.dumps({
+                'source':  source,
+                'root':    root,
+                'objects': enc.objects,
+                'arrays':  arrays,
+            }, separators=(',', ':')).encode('utf-8')
+            metaOffs = file.tell()
+            file.write(meta)
+
+            file.seek(0)
+            file.write(struct.pack(_headerFmt, Header.magic, VERSION, 0,
+                metaOffs, len(meta), srcSize, srcMtime, srcHash,
+                bytes(4)))
+        os.replace(tmp, path)
+    except:
+        try: os.remove(tmp)
+        except FileNotFoundError: pass
+        raise
+    log.info("Saved snapshot %s: %d objects, %d arrays, %d bytes",
+        path, len(enc.objects), len(enc.arrays), metaOffs + len(meta))
+
+
+def _isCurrent(header, source):
+    """Check whether the snapshot's source file is unchanged."""
+    try: st = os.stat(source)
+    except OSError as ex:
+        log.info("Can't check snapshot source %s: %s", source, ex)
+        return False
+    if st.st_size != header['src_size']: return False
+    if st.st_mtime == header['src_mtime']: return True
+
+    # modified time differs, but maybe not the contents.
+    size, mtime, srcHash = _fileInfo(source)
+    return srcHash == header['src_hash']
+
+
+def loadSnapshot(path, source=None, useMmap=True):
+    """Load a FRES from a snapshot file.
+
+    path:    Path of the snapshot.
+    source:  Path of the file the FRES was read from.
+        (default: the path recorded in the snapshot)
+    useMmap: Map arrays into memory instead of reading them.
+        The arrays are then read-only.
+
+    Returns the FRES, or None if the snapshot is from a different
+    version or its source file has changed.
+    The loaded FRES has no file, so it can't read anything that
+    wasn't decoded when the snapshot was saved.
+    """
+    with open(path, 'rb') as file:
+        header = Header().readFromFile(BinaryFile(file))
+        if header['version'] != VERSION:
+            log.info("Snapshot %s is version %d, expected %d",
+                path, header['version'], VERSION)
+            return None
+
+        file.seek(header['meta_offs'])
+        meta = json.loads(file.read(header['meta_size']).decode('utf-8'))
+        if source is None: source = meta['source']
+        if source is not None and not _isCurrent(header, source):
+            log.info("Snapshot %s is out of date", path)
+            return None
+
+        if useMmap and len(meta['arrays']) > 0:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            file.seek(0)
+            data = file.read(header['meta_offs'])
+
+    arrays = []
+    for entry in meta['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        count = int(np.prod(shape))
+        if count == 0: arr = np.empty(shape, dtype)
+        else:
+            arr = np.frombuffer(data, dtype, count, entry['offset'])
+            arr = arr.reshape(shape)
+        arrays.append(arr)
+
+    return _Decoder(meta, arrays).decodeGraph()
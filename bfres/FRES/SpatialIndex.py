@@ -0,0 +1,268 @@
+"""Find shapes by location, across many FRES files.
+
+The index holds an axis-aligned bounding box for each shape (and
+optionally each submesh), computed from the decoded vertices, in a
+bounding volume hierarchy. Box and ray queries return the shapes
+they hit, so only those need to be fully decoded.
+
+The hierarchy is a tree with BRANCH children per node over the boxes
+sorted along a Morton curve, stored as one array of node bounds per
+level, so it can be built and searched with array operations, a
+level at a time.
+"""
+import logging; log = logging.getLogger(__name__)
+import numpy as np
+from bfres.FRES.FMDL.Bounds import computeShapeBounds
+
+VERSION = 1
+
+# number of children of each node of the tree. wider trees have
+# fewer levels to search, which matters more than the number of
+# boxes tested.
+BRANCH = 8
+
+# submesh number of entries covering a whole shape.
+WHOLE_SHAPE = -1
+
+
+def _spreadBits(v):
+    """Insert two zero bits between each of the low 10 bits."""
+    v = v.astype(np.uint32) & 0x3FF
+    v = (v | (v << 16)) & 0x030000FF
+    v = (v | (v <<  8)) & 0x0300F00F
+    v = (v | (v <<  4)) & 0x030C30C3
+    v = (v | (v <<  2)) & 0x09249249
+    return v
+
+
+def _mortonCodes(points):
+    """Compute 30-bit Morton codes of points, within their bounds."""
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    size = np.where(hi > lo, hi - lo, 1)
+    q = np.clip((points - lo) / size * 1023, 0, 1023)
+    return (_spreadBits(q[:, 0]) << 2) | (_spreadBits(q[:, 1]) << 1) | \
+        _spreadBits(q[:, 2])
+
+
+def _rayHits(bounds, origin, invDir, maxDist):
+    """Slab test of a ray against boxes.
+
+    bounds: Array of shape (n, 6) of each box's min and -max.
+    Returns (hit, near): whether each box is hit within maxDist,
+    and the distance along the ray where it enters each box.
+    """
+    with np.errstate(over='ignore', invalid='ignore'):
+        t1 = (bounds[:, 0:3] - origin) * invDir
+        t2 = (-bounds[:, 3:6] - origin) * invDir
+    near = np.minimum(t1, t2).max(axis=1)
+    far  = np.maximum(t1, t2).min(axis=1)
+    return (near <= far) & (far >= 0) & (near <= maxDist), near
+
+
+class SpatialIndex:
+    """Bounding volume hierarchy of shapes.
+
+    Usage:
+        index = SpatialIndex()
+        index.addFres(fres, 'Map.bfres')
+        for i in index.queryBox((0, 0, 0), (10, 10, 10)):
+            print(index.describe(i))
+    """
+
+    def __init__(self):
+        self.files   = [] # file names
+        self.lo      = np.zeros((0, 3)) # min corner of each box
+        self.hi      = np.zeros((0, 3)) # max corner of each box
+        self.fileIdx = np.zeros(0, dtype=np.int32)
+        self.fmdlIdx = np.zeros(0, dtype=np.int32)
+        self.fshpIdx = np.zeros(0, dtype=np.int32)
+        self.submesh = np.zeros(0, dtype=np.int32)
+        self.names   = np.zeros(0, dtype=str) # shape names
+        self._levels = None
+
+
+    def __str__(self):
+        return "<SpatialIndex(%d boxes, %d files) at 0x%x>" % (
+            len(self), len(self.files), id(self))
+
+
+    def __len__(self):
+        return len(self.lo)
+
+
+    def addBoxes(self, lo, hi, file, fmdlIdx, fshpIdx, submesh, names):
+        """Add boxes to the index.
+
+        lo, hi:  Arrays of shape (n, 3) of the boxes' corners.
+        file:    Name of the file they're from.
+        fmdlIdx: Array of model index of each box.
+        fshpIdx: Array of shape index of each box.
+        submesh: Array of submesh index of each box, or WHOLE_SHAPE.
+        names:   List of shape name of each box.
+        """
+        if file not in self.files: self.files.append(file)
+        n = len(lo)
+        self.lo      = np.concatenate((self.lo, np.asarray(lo).reshape(n, 3)))
+        self.hi      = np.concatenate((self.hi, np.asarray(hi).reshape(n, 3)))
+        self.fileIdx = np.concatenate((self.fileIdx,
+            np.full(n, self.files.index(file), dtype=np.int32)))
+        self.fmdlIdx = np.concatenate((self.fmdlIdx, fmdlIdx)).astype(np.int32)
+        self.fshpIdx = np.concatenate((self.fshpIdx, fshpIdx)).astype(np.int32)
+        self.submesh = np.concatenate((self.submesh, submesh)).astype(np.int32)
+        self.names   = np.concatenate((self.names, np.asarray(names, dtype=str)))
+        self._levels = None
+
+
+    def addFres(self, fres, file=None, submeshes=False):
+        """Add the shapes of a decoded FRES.
+
+        file:      Name to identify the file by. (default: its name)
+        submeshes: Whether to also add a box for each submesh of
+            each shape's first LOD.
+        """
+        if file is None: file = fres.name
+        boxes, keys, names = [], [], []
+        for iMdl, fmdl in enumerate(fres.models):
+            for iShp, fshp in enumerate(fmdl.fshps):
+                bbox = computeShapeBounds(fshp)['bbox']
+                # the last box is the whole shape.
+                rows = range(len(bbox)) if submeshes else [len(bbox) - 1]
+                for row in rows:
+                    sub = WHOLE_SHAPE if row == len(bbox) - 1 else row
+                    boxes.append(bbox[row])
+                    keys.append((iMdl, iShp, sub))
+                    names.append(fshp.name)
+        if not boxes: return
+        boxes = np.array(boxes)
+        keys  = np.array(keys)
+        self.addBoxes(boxes[:, 0] - boxes[:, 1], boxes[:, 0] + boxes[:, 1],
+            file, keys[:, 0], keys[:, 1], keys[:, 2], names)
+        log.debug("Added %d boxes from %s", len(boxes), file)
+
+
+    def describe(self, idx) -> dict:
+        """Get what a box belongs to."""
+        return {
+            'file':    self.files[self.fileIdx[idx]],
+            'fmdl':    int(self.fmdlIdx[idx]),
+            'fshp':    int(self.fshpIdx[idx]),
+            'submesh': int(self.submesh[idx]),
+            'name':    str(self.names[idx]),
+            'min':     self.lo[idx].tolist(),
+            'max':     self.hi[idx].tolist(),
+        }
+
+
+    def build(self):
+        """Build the hierarchy.
+
+        This is done automatically by the first query after boxes
+        are added.
+        """
+        n = len(self)
+        if n: order = np.argsort(_mortonCodes((self.lo + self.hi) / 2),
+            kind='stable')
+        else: order = np.zeros(0, dtype=np.int64)
+        self._order = order
+
+        # the boxes, then each level of nodes above them, until one
+        # node's worth is left. each level is padded to a whole
+        # number of nodes with NaN boxes, which never pass a test.
+        # boxes are stored as (min, -max), so that two boxes
+        # overlap if one's is <= the other's (max, -min).
+        bounds = np.concatenate((self.lo[order], -self.hi[order]), axis=1)
+        levels = []
+        while True:
+            pad = -len(bounds) % BRANCH
+            if pad or not len(bounds):
+                bounds = np.concatenate((bounds,
+                    np.full((pad or BRANCH, 6), np.nan)))
+            levels.append(bounds)
+            if len(bounds) <= BRANCH: break
+            # fmin ignores the padding.
+            bounds = np.fmin.reduce(bounds.reshape(-1, BRANCH, 6), axis=1)
+        self._levels = levels[::-1]
+        log.debug("Built spatial index of %d boxes, depth %d", n, len(levels))
+
+
+    def _search(self, test):
+        """Find the boxes passing a test.
+
+        test: Function(bounds) => array of whether each node or box
+            could contain a hit.
+        Returns array of the indices (in sorted order) of the boxes
+        that pass.
+        """
+        if self._levels is None: self.build()
+        nodes    = np.nonzero(test(self._levels[0]))[0]
+        children = np.arange(BRANCH)
+        for bounds in self._levels[1:]:
+            if len(nodes) == 0: break
+            nodes = (nodes[:, None] * BRANCH + children).reshape(-1)
+            nodes = nodes[test(bounds[nodes])]
+        return nodes
+
+
+    def queryBox(self, lo, hi) -> np.ndarray:
+        """Find boxes that overlap a box.
+
+        lo, hi: Min and max corners of the box.
+        Returns sorted array of box indices.
+        """
+        key   = np.concatenate((np.asarray(hi, dtype=np.float64),
+            -np.asarray(lo, dtype=np.float64)))
+        found = self._search(lambda bounds: (bounds <= key).all(axis=1))
+        return np.sort(self._order[found])
+
+
+    def queryPoint(self, point) -> np.ndarray:
+        """Find boxes that contain a point."""
+        return self.queryBox(point, point)
+
+
+    def queryRay(self, origin, direction, maxDist=np.inf) -> tuple:
+        """Find boxes that a ray passes through.
+
+        origin:    Start point of the ray.
+        direction: Direction of the ray. Distances are in multiples
+            of its length.
+        maxDist:   How far along the ray to look.
+        Returns (idxs, dists): arrays of the box indices and the
+        distance where the ray enters each one, nearest first.
+        """
+        origin = np.asarray(origin,    dtype=np.float64)
+        dirn   = np.asarray(direction, dtype=np.float64)
+        # a tiny step instead of 0 along axes the ray doesn't move
+        # on; then boxes it's outside of along them are infinitely
+        # far, without needing a special case.
+        invDir = 1 / np.where(dirn == 0, 1e-300, dirn)
+        found  = self._search(lambda bounds:
+            _rayHits(bounds, origin, invDir, maxDist)[0])
+        dists  = np.maximum(_rayHits(self._levels[-1][found], origin,
+            invDir, maxDist)[1], 0)
+        order  = np.argsort(dists, kind='stable')
+        return self._order[found[order]], dists[order]
+
+
+    def save(self, path):
+        """Save the index to a file."""
+        with open(path, 'wb') as file:
+            np.savez(file, version=VERSION, files=np.array(self.files, dtype=str),
+                lo=self.lo, hi=self.hi, fileIdx=self.fileIdx,
+                fmdlIdx=self.fmdlIdx, fshpIdx=self.fshpIdx,
+                submesh=self.submesh, names=self.names)
+
+
+    @staticmethod
+    def load(path):
+        """Load an index saved by `save`."""
+        self = SpatialIndex()
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != VERSION:
+                raise ValueError("Spatial index %s is version %d, not %d" % (
+                    path, int(data['version']), VERSION))
+            self.files = data['files'].tolist()
+            for name in ('lo', 'hi', 'fileIdx', 'fmdlIdx', 'fshpIdx',
+            'submesh', 'names'):
+                setattr(self, name, data[name])
+        return self
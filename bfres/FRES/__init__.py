@@ -7,12 +7,13 @@ from bfres.BinaryFile import BinaryFile
 from .RLT import RLT
 from bfres.Common import StringTable
 from bfres.Exceptions import \
-    UnsupportedFormatError, UnsupportedFileTypeError
-from .Dict import Dict
-from .EmbeddedFile import EmbeddedFile, Header as EmbeddedFileHeader
-from .FMDL import FMDL, Header as FMDLHeader
+    UnsupportedFormatError, UnsupportedFileTypeError, NoFileError
+from .EmbeddedFile import EmbeddedFile
+from .FMDL import FMDL
 from .BufferSection import BufferSection
 from .DumpMixin import DumpMixin
+from .FresObject import FresObject, decodeParts
+from .Snapshot import saveSnapshot, loadSnapshot
 import traceback
 import struct
 
@@ -80,15 +81,24 @@ class SwitchHeader(BinaryStruct):
     size = 0xD0
 
 
-class FRES(DumpMixin):
+class FRES(DumpMixin, FresObject):
     """FRES file."""
+    countSuffix  = '_cnt'
+    namedObjects = True
+    tables       = ('fmdl', 'embed')
 
     def __init__(self, file:BinaryFile):
+        self.fres       = self # for FresObject's methods
         self.file       = file
         self.models     = [] # fmdl
         self.animations = [] # fska
         self.buffers    = [] # buffer data
         self.embeds     = [] # embedded files
+        self.dicts      = {} # name => Dict
+        self.objects    = {} # (class, offset) => object read from there
+        self.resolveStats = {} # class name => [objects read, reuses]
+        self.rlt        = None
+        self.strtab     = None
 
         # read magic and determine file type
         pos   = file.tell()
@@ -97,6 +107,7 @@ class FRES(DumpMixin):
         if magic == b'FRES    ':
             Header = SwitchHeader()
             self.header = Header.readFromFile(file)
+            self.platform = 'switch' # header format
         elif magic[0:4] == b'FRES':
             raise UnsupportedFormatError(
                 "Sorry, WiiU files aren't supported yet")
@@ -126,43 +137,138 @@ class FRES(DumpMixin):
                 self.header['byte_order'])
 
 
-    def decode(self):
-        """Decode objects from the file."""
-        self.rlt = RLT(self).readFromFRES()
+    def decode(self, models=None, shapes=None, include=decodeParts,
+    strict=False):
+        """Decode objects from the file.
 
-        # str_tab_offset points to the first actual string, not
-        # the header. (maybe it's actually the offset of some string,
-        # which happens to be empty here?)
-        offs = self.header['str_tab_offset'] - StringTable.Header.size
-        self.strtab = StringTable().readFromFile(self, offs)
+        models:  Names of models to read. (default: all)
+            Models not read are None in `self.models`.
+        shapes:  Names of shapes to read from those models; each
+            model reads the ones it has. (default: all)
+        include: Which other parts to read. (default: all)
+            See `FresObject.decodeParts`.
+        strict:  Check all pointers in the file up front, using the
+            relocation table, and raise MalformedFileError if any is
+            out of bounds, instead of warning as each struct is read.
 
-        self._readBufferSection()
+        Raises KeyError if a named model doesn't exist, or a named
+        shape isn't in any of the models read.
+        """
+        unknown = set(include) - decodeParts
+        if unknown:
+            raise ValueError("Unknown FRES parts: " + ', '.join(unknown))
+
+        if 'tables' in include or strict:
+            self.rlt = RLT(self).readFromFRES()
+        if strict:
+            self.rlt.checkPointers()
+            self.file.checkOffsets = False
+
+        if 'tables' in include:
+            # str_tab_offset points to the first actual string, not
+            # the header. (maybe it's actually the offset of some
+            # string, which happens to be empty here?)
+            offs = self.header['str_tab_offset'] - StringTable.Header.size
+            self.strtab = StringTable().readFromFile(self, offs)
 
-        self.embeds = self._readObjects(
-            EmbeddedFile, 'embed', EmbeddedFileHeader.size)
+        self._readBufferSection()
 
-        self.models = self._readObjects(FMDL, 'fmdl',
-            FMDLHeader.size)
+        if 'embeds' in include:
+            self.embeds = self._readObjects('embed', EmbeddedFile)
+
+        only = None
+        if models is not None: only = self._findIdxs('fmdl', models)
+        # each model reads the named shapes it has; a name is only
+        # an error if none of them has it.
+        self.models = self._readObjects('fmdl', FMDL, only=only,
+            shapes=shapes, include=include, missingOk=True)
+        if shapes is not None:
+            found = set(fshp.name for fmdl in self.models if fmdl is not None
+                for fshp in fmdl.fshps if fshp is not None)
+            missing = [name for name in shapes if name not in found]
+            if missing:
+                raise KeyError("No FSHP named '%s' in the models read" %
+                    missing[0])
         # XXX fska, fmaa, fvis, fshu, fscn
+        self.logResolveStats()
+
+
+    def __getstate__(self):
+        # the file isn't saved in snapshots, so read anything that
+        # would be read from it later, before `objects` is saved.
+        self.readDicts()
+        for fmdl in self.models:
+            if fmdl is not None: fmdl.readDicts()
+        state = dict(self.__dict__)
+        state['file'] = None
+        return state
+
 
+    def saveSnapshot(self, path, source=None):
+        """Save the decoded objects to a snapshot file.
 
-    def _readObjects(self, typ, name, size):
-        """Read array of objects from the file."""
-        offs = self.header[name + '_offset']
-        cnt  = self.header[name + '_cnt']
-        dofs = self.header[name + '_dict_offset']
-        objs = []
-        log.debug("Reading dict '%s' from 0x%X", name, dofs)
-        if dofs == 0: return objs
-        objDict = Dict(self).readFromFRES(dofs)
-        for i in range(cnt):
-            objName = objDict.root.left.name
-            log.debug('Reading %s #%2d @ %06X: "%s"',
-                typ.__name__, i, offs, objName)
-            obj = typ(self, objName).readFromFRES(offs)
-            objs.append(obj)
-            offs += size
-        return objs
+        See `Snapshot.saveSnapshot()`.
+        """
+        saveSnapshot(self, path, source)
+
+
+    @staticmethod
+    def loadSnapshot(path, source=None, useMmap=True):
+        """Load a FRES from a snapshot file.
+
+        Returns None if the snapshot is out of date.
+        It has no file, so getting objects that weren't decoded
+        before saving raises NoFileError.
+        See `Snapshot.loadSnapshot()`.
+        """
+        return loadSnapshot(path, source, useMmap)
+
+
+    def resolve(self, cls, offset, *args, **kwargs):
+        """Get the object of given class at given offset.
+
+        If it was already read, the same instance is returned, so
+        everything that refers to that offset shares one object.
+        Otherwise it's read and remembered.
+        args:   Passed to the class's constructor, after the FRES.
+        kwargs: Passed to the object's `readFromFRES()`. They have
+            no effect if the object was already read.
+        """
+        key   = (cls, offset)
+        stats = self.resolveStats.setdefault(cls.__name__, [0, 0])
+        obj   = self.objects.get(key, None)
+        if obj is not None:
+            stats[1] += 1
+            return obj
+
+        # remember it before reading, in case it refers to itself.
+        self._getFile()
+        obj = cls(self, *args)
+        self.objects[key] = obj
+        try: obj.readFromFRES(offset, **kwargs)
+        except:
+            del self.objects[key]
+            raise
+        stats[0] += 1
+        return obj
+
+
+    def logResolveStats(self):
+        """Log how many objects of each class were read and reused."""
+        for name, (read, reused) in sorted(self.resolveStats.items()):
+            log.debug("%-12s: %5d read, %5d reused", name, read, reused)
+        if self.file is not None:
+            log.debug("%-12s: %5d read", 'strings', len(self.file.strCache))
+
+
+    def getModel(self, name, **kwargs):
+        """Get the FMDL with given name.
+
+        If the models haven't been decoded, only this one is read.
+        kwargs: Passed to `FMDL.readFromFRES()` if it's read.
+        Returns None if there's no such model.
+        """
+        return self._getObject('fmdl', FMDL, name, self.models, **kwargs)
 
 
     def _readBufferSection(self):
@@ -233,27 +339,46 @@ class FRES(DumpMixin):
         """
         if rel:
             log.warning("Read using rel=True: %s", traceback.extract_stack())
-        if pos is None: pos = self.file.tell()
+        file = self._getFile()
+        if pos is None: pos = file.tell()
         if rel: pos += self.rlt.sections[1]['curOffset'] # XXX
         #self._logRead(size, pos, count, rel)
-        return self.file.read(pos=pos, fmt=size, count=count)
+        return file.read(pos=pos, fmt=size, count=count)
+
+
+    def _getFile(self):
+        """Get the file to read from.
+
+        Raises NoFileError if there isn't one, eg because this was
+        loaded from a snapshot.
+        """
+        if self.file is None:
+            raise NoFileError("FRES '%s' has no file to read from; "
+                "it was probably loaded from a snapshot" % self.name)
+        return self.file
 
 
     def seek(self, pos, whence=0):
         """Seek the file."""
-        return self.file.seek(pos, whence)
+        return self._getFile().seek(pos, whence)
 
 
     def tell(self):
         """Report the current position of the file."""
-        return self.file.tell()
+        return self._getFile().tell()
 
 
     def readStr(self, offset, fmt='<H', encoding='shift-jis'):
         """Read string (prefixed with length) from given offset."""
+        cache = self._getFile().strCache
+        key   = (offset, fmt, None, encoding)
+        data  = cache.get(key, None)
+        if data is not None: return data
+
         size = self.read(fmt, offset)
         data = self.read(size)
         if encoding is not None: data = data.decode(encoding)
+        cache[key] = data
         return data
 
 
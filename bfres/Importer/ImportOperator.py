@@ -32,6 +32,18 @@ class ImportOperator(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
         description="Export textures to PNG.",
         default=False)
 
+    texture_workers = bpy.props.IntProperty(name="Decode Processes",
+        description="Number of processes to decode textures with (0 to decode in Blender's process).",
+        default=0, min=0, max=64)
+
+    texture_cache_dir = bpy.props.StringProperty(name="Texture Cache",
+        description="Directory to cache decoded textures in (blank to disable).",
+        subtype='DIR_PATH', default="")
+
+    texture_cache_size = bpy.props.IntProperty(name="Cache Size (MB)",
+        description="Maximum size of the texture cache.",
+        default=1024, min=1)
+
     dump_debug = bpy.props.BoolProperty(name="Dump Debug Info",
         description="Create `fres-SomeFile-dump.txt` files for debugging.",
         default=False)
@@ -40,6 +52,29 @@ class ImportOperator(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
         description="Set smooth=True on generated faces.",
         default=False)
 
+    weld_vertices = bpy.props.BoolProperty(name="Weld Vertices",
+        description="Merge vertices whose attributes are the same.",
+        default=False)
+
+    weld_position_tolerance = bpy.props.FloatProperty(
+        name="Position Tolerance",
+        description="Max distance between vertices to weld.",
+        default=1e-5, min=0, precision=6)
+
+    weld_normal_tolerance = bpy.props.FloatProperty(
+        name="Normal Tolerance",
+        description="Max difference of normals of vertices to weld.",
+        default=1/512, min=0, precision=6)
+
+    weld_uv_tolerance = bpy.props.FloatProperty(name="UV Tolerance",
+        description="Max difference of UVs of vertices to weld.",
+        default=1/4096, min=0, precision=6)
+
+    weld_weight_tolerance = bpy.props.FloatProperty(
+        name="Weight Tolerance",
+        description="Max difference of bone weights of vertices to weld.",
+        default=0, min=0, max=1, precision=4)
+
     save_decompressed = bpy.props.BoolProperty(name="Save Decompressed Files",
         description="Keep decompressed FRES files.",
         default=False)
@@ -54,10 +89,19 @@ class ImportOperator(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
         box.label("Texture Options:", icon='TEXTURE')
         box.prop(self, "import_tex_file")
         box.prop(self, "dump_textures")
+        box.prop(self, "texture_workers")
+        box.prop(self, "texture_cache_dir")
+        box.prop(self, "texture_cache_size")
 
         box = self.layout.box()
         box.label("Mesh Options:", icon='OUTLINER_OB_MESH')
         box.prop(self, "smooth_faces")
+        box.prop(self, "weld_vertices")
+        if self.weld_vertices:
+            box.prop(self, "weld_position_tolerance")
+            box.prop(self, "weld_normal_tolerance")
+            box.prop(self, "weld_uv_tolerance")
+            box.prop(self, "weld_weight_tolerance")
 
         box = self.layout.box()
         box.label("Misc Options:", icon='PREFERENCES')
@@ -134,6 +134,7 @@ class Importer(ModelImporter):
 
         # import the models.
         for i, model in enumerate(self.fres.models):
+            if model is None: continue # not decoded
             log.info("Importing model    %3d / %3d...",
                 i+1, len(self.fres.models))
             self._importModel(model)
@@ -154,6 +155,16 @@ class Importer(ModelImporter):
                     file.name, ex.magic)
 
 
+    def _getTextureCache(self):
+        """Get the decoded texture cache, if enabled."""
+        path = self.operator.texture_cache_dir
+        if not path: return None
+        if getattr(self, 'textureCache', None) is None:
+            self.textureCache = BNTX.TextureCache(bpy.path.abspath(path),
+                maxSize=self.operator.texture_cache_size << 20)
+        return self.textureCache
+
+
     def _importBntx(self, file):
         """Import BNTX file."""
         self.bntx = BNTX.BNTX(file)
@@ -163,6 +174,8 @@ class Importer(ModelImporter):
                 f.write(self.bntx.dump())
 
         imp = TextureImporter(self)
-        imp.importTextures(self.bntx)
+        imp.importTextures(self.bntx,
+            workers=self.operator.texture_workers,
+            cache=self._getTextureCache())
 
         return {'FINISHED'}
@@ -3,8 +3,11 @@ import bmesh
 import bpy
 import bpy_extras
 import struct
+import numpy as np
 from .MaterialImporter import MaterialImporter
 from .SkeletonImporter import SkeletonImporter
+from bfres.FRES.FMDL import Primitives
+from bfres.FRES.FMDL.Welder import weldVertices
 from bfres.Exceptions import UnsupportedFormatError, MalformedFileError
 
 
@@ -14,14 +17,21 @@ class LodImporter:
         self.parent = parent
 
 
-    def _importLod(self, fvtx, fmdl, fshp, lod, idx):
-        """Import given LOD model."""
-        self.fvtx   = fvtx
-        self.fmdl   = fmdl
-        self.fshp   = fshp
-        self.lod    = lod
-        self.lodIdx = idx
+    def _importLod(self, fvtx, fmdl, fshp, lod, idx, boneIdxs=None):
+        """Import given LOD model.
+
+        boneIdxs: Bone indices of each vertex in `fvtx`, from
+            `FSKL.remapIndices()`. Shared by all LODs of a shape.
+        """
+        self.fvtx     = fvtx
+        self.fmdl     = fmdl
+        self.fshp     = fshp
+        self.lod      = lod
+        self.lodIdx   = idx
+        self.boneIdxs = boneIdxs
         self.attrBuffers = self._getAttrBuffers()
+        self.idxRemap    = None # FVTX vertex index => mesh vertex index
+        if self.parent.operator.weld_vertices: self._weldVertices()
 
         # Create an object for this LOD
         self.lodName = "%s.%d" % (self.fshp.name, self.lodIdx)
@@ -41,6 +51,7 @@ class LodImporter:
         Returns a dict of attribute name => [values].
         """
         attrBuffers = {}
+        vtxIdxs     = [] # FVTX vertex index of each mesh vertex
         for attr in self.fvtx.attrs:
             attrBuffers[attr.name] = []
 
@@ -52,6 +63,7 @@ class LodImporter:
             if len(idxs) == 0:
                 raise MalformedFileError("Submesh %d is empty" % i)
             #log.debug("Submesh idxs (%d): %s", len(idxs), idxs)
+            vtxIdxs.append(np.arange(max(idxs)+1))
             for idx in range(max(idxs)+1):
                 for attr in self.fvtx.attrs:
                     fmt  = attr.format
@@ -75,12 +87,51 @@ class LodImporter:
         #    print("%s: %s" % (
         #        name, ' '.join(map(str, data[0:16]))
         #    ))
+        self.vtxIdxs = np.concatenate(vtxIdxs)
         return attrBuffers
 
 
+    def _weldVertices(self):
+        """Merge vertices whose attributes are the same, within the
+        operator's tolerances.
+        """
+        op = self.parent.operator
+        tolerance = {
+            '_p': op.weld_position_tolerance,
+            '_n': op.weld_normal_tolerance,
+            '_u': op.weld_uv_tolerance,
+            '_w': op.weld_weight_tolerance,
+        }
+        # compare UVs and weights as they'll be imported.
+        attrs = {}
+        for name, data in self.fvtx.attrData.items():
+            data = data[self.vtxIdxs]
+            fmt  = self.fvtx.attrsByName[name].format
+            if name[0:2] in ('_u', '_w') and fmt['ctype'] == 'int':
+                data = data / fmt['max']
+            attrs[name] = data
+        keep, remap = weldVertices(attrs, tolerance)
+
+        # the index buffer refers to FVTX vertices, which may be
+        # in vtxIdxs more than once; use the first.
+        vals, first = np.unique(self.vtxIdxs, return_index=True)
+        self.idxRemap = np.zeros(int(vals.max()) + 1 if len(vals) else 0,
+            dtype=np.int64)
+        self.idxRemap[vals] = remap[first]
+
+        nOld = len(self.vtxIdxs)
+        self.vtxIdxs = self.vtxIdxs[keep]
+        keep = keep.tolist()
+        for name, data in self.attrBuffers.items():
+            self.attrBuffers[name] = [data[i] for i in keep]
+        log.info("Welded %s.%d vertices: %d => %d, saved %d",
+            self.fshp.name, self.lodIdx, nOld, len(keep), nOld - len(keep))
+
+
     def _createMesh(self):
         p0   = self.attrBuffers['_p0']
         idxs = self.lod.idx_buf
+        if self.idxRemap is not None: idxs = self.idxRemap[idxs]
         # the game doesn't tell how many vertices each LOD has,
         # but we can usually rely on this.
         nVtxs = int(self.lod.header['idx_cnt'] / 3)
@@ -110,39 +161,28 @@ class LodImporter:
     def _createFaces(self, idxs, mesh):
         """Create the faces."""
         fmt = self.lod.prim_fmt
-        meth = getattr(self, '_createFaces_'+fmt, None)
-        if meth is None:
-            log.error("Unsupported prim format: %s", fmt)
-            raise UnsupportedFormatError(
-                "Unsupported prim format: " + fmt)
         try:
-            return meth(idxs, mesh)
-        except (struct.error, IndexError):
+            prims = Primitives.decompose(fmt, idxs)
+        except UnsupportedFormatError:
+            log.error("Unsupported prim format: %s", fmt)
+            raise
+        if len(prims) and prims.max() >= len(mesh.verts):
+            log.error("LOD submesh face uses vertex %d, out of bounds (max %d)",
+                prims.max(), len(mesh.verts))
             raise MalformedFileError("LOD submesh faces are out of bounds")
 
-    def _createFacesBasic(self, idxs, mesh, step, nVtxs):
-        for i in range(0, len(idxs), step):
-            try:
-                vs   = list(mesh.verts[j] for j in idxs[i:i+nVtxs])
-                #log.debug("face %d: %s", i, vs)
-                face = mesh.faces.new(vs)
-                face.smooth = self.parent.operator.smooth_faces
-            except IndexError:
-                log.error("LOD submesh face %d is out of bounds (max %d)",
-                    i, len(idxs))
-                raise
-
-    def _createFaces_point_list(self, idxs, mesh):
-        return self._createFacesBasic(idxs, mesh, 1, 1)
-
-    def _createFaces_line_list(self, idxs, mesh):
-        return self._createFacesBasic(idxs, mesh, 2, 2)
-
-    def _createFaces_line_strip(self, idxs, mesh):
-        return self._createFacesBasic(idxs, mesh, 1, 2)
-
-    def _createFaces_triangle_list(self, idxs, mesh):
-        return self._createFacesBasic(idxs, mesh, 3, 3)
+        verts  = mesh.verts
+        smooth = self.parent.operator.smooth_faces
+        if prims.shape[1] == 3:
+            for a, b, c in prims.tolist():
+                try: face = mesh.faces.new((verts[a], verts[b], verts[c]))
+                except ValueError: continue # duplicate face
+                face.smooth = smooth
+        elif prims.shape[1] == 2:
+            for a, b in prims.tolist():
+                try: mesh.edges.new((verts[a], verts[b]))
+                except ValueError: continue # duplicate edge
+        # points are just the vertices, which already exist.
 
 
     def _addVerticesToMesh(self, mesh, vtxs):
@@ -199,6 +239,7 @@ class LodImporter:
 
     def _addArmature(self):
         """Add armature to mesh."""
+        if self.parent.armature is None: return None
         mod = self.meshObj.modifiers.new(self.lodName, 'ARMATURE')
         mod.object = self.parent.armature
         mod.use_bone_envelopes = False
@@ -209,31 +250,43 @@ class LodImporter:
     def _makeVertexGroup(self):
         """Make vertex group for mesh object from attributes."""
         # XXX move to SkeletonImporter?
-        groups = {}
         try:
-            w0 = self.attrBuffers['_w0']
-            i0 = self.attrBuffers['_i0']
+            w0 = self.fvtx.attrData['_w0'][self.vtxIdxs]
         except KeyError:
             log.info("FRES: mesh '%s' has no weights",
                 self.meshObj.name)
             return
+        if self.boneIdxs is None:
+            log.info("FRES: mesh '%s' has weights but no bone indices",
+                self.meshObj.name)
+            return
 
         # create a vertex group for each bone
         # each bone affects the vertex group with the same
         # name as that bone, and these weights define how much.
-        for bone in self.fmdl.skeleton.bones:
-            grp = self.meshObj.vertex_groups.new(bone.name)
-            groups[bone.smooth_mtx_idx] = grp
-
-        # i0 specifies the bone smooth matrix group.
-        # Look for a bone with the same group.
-        for i in range(0, len(w0)):
-            wgt = w0[i] # how much this bone affects this vertex
-            idx = i0[i] # which bone index group
-            for j, w in enumerate(wgt):
-                if w > 0:
-                    try:
-                        groups[idx[j]].add([i], w/255.0, 'REPLACE')
-                    except (KeyError, IndexError):
-                        log.warning("Bone group %d doesn't exist (referenced by weight of vtx %d, value %d)",
-                            idx[j], i, w)
+        groups = [self.meshObj.vertex_groups.new(bone.name)
+            for bone in self.fmdl.skeleton.bones]
+
+        # i0 specifies the bone smooth matrix group, which the
+        # skeleton maps to a bone.
+        bones = self.boneIdxs[self.vtxIdxs]
+        nSlots = min(w0.shape[1], bones.shape[1])
+        w0, bones = w0[:, 0:nSlots], bones[:, 0:nSlots]
+        vtxs, slots = np.nonzero(w0 > 0)
+        wgts  = w0[vtxs, slots]
+        bones = bones[vtxs, slots]
+        bad = (bones < 0) | (bones >= len(groups))
+        if bad.any():
+            log.warning("%d weights reference bone groups that don't exist (first: vtx %d)",
+                bad.sum(), vtxs[bad][0])
+            vtxs, wgts, bones = vtxs[~bad], wgts[~bad], bones[~bad]
+
+        # add all vertices with the same bone and weight at once.
+        keys, inverse = np.unique(np.stack((bones, wgts), axis=1),
+            axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order   = np.argsort(inverse, kind='stable')
+        splits  = np.cumsum(np.bincount(inverse, minlength=len(keys)))
+        for (bone, wgt), vs in zip(keys,
+        np.split(vtxs[order], splits[:-1])):
+            groups[int(bone)].add(vs.tolist(), wgt/255.0, 'REPLACE')
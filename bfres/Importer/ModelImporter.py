@@ -23,17 +23,21 @@ class ModelImporter:
         # import the skeleton
         self.fmdl = fmdl
         self.skelImp  = SkeletonImporter(self, fmdl)
-        self.armature = self.skelImp.importSkeleton(fmdl.skeleton)
+        self.armature = None
+        if fmdl.skeleton is not None: # not decoded
+            self.armature = self.skelImp.importSkeleton(fmdl.skeleton)
 
         # import the materials.
         self.matImp = MaterialImporter(self, fmdl)
         for i, fmat in enumerate(fmdl.fmats):
+            if fmat is None: continue # not decoded
             log.info("Importing material %3d / %3d...",
                 i+1, len(fmdl.fmats))
             self.matImp.importMaterial(fmat)
 
         # create the shapes.
         for i, fshp in enumerate(fmdl.fshps):
+            if fshp is None: continue # not decoded
             log.info("Importing shape %3d / %3d '%s'...",
                 i+1, len(fmdl.fshps), fshp.name)
             self._importShape(fmdl, fshp, fmdl_obj)
@@ -47,10 +51,17 @@ class ModelImporter:
         parent: Object to parent the LOD models to.
         """
         fvtx = fmdl.fvtxs[fshp.header['fvtx_idx']]
+
+        # map the vertices' matrix indices to bones once for all LODs.
+        boneIdxs = None
+        if fmdl.skeleton is not None and '_i0' in fvtx.attrData:
+            boneIdxs = fmdl.skeleton.remapIndices(fvtx.attrData['_i0'])
+
         for ilod, lod in enumerate(fshp.lods):
             log.info("Importing LOD %3d / %3d...",
                 ilod+1, len(fshp.lods))
 
             lodImp  = LodImporter(self)
-            meshObj = lodImp._importLod(fvtx, fmdl, fshp, lod, ilod)
+            meshObj = lodImp._importLod(fvtx, fmdl, fshp, lod, ilod,
+                boneIdxs)
             meshObj.parent = parent
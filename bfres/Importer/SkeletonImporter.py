@@ -4,8 +4,16 @@ import bpy
 import bpy_extras
 import struct
 import math
+import numpy as np
 from mathutils import Matrix, Vector
 
+# rotates to make Z the up axis
+_rotUp = np.array(Matrix.Rotation(math.radians(90), 3, (1,0,0)))
+
+# bones can't have zero length, or Blender deletes them.
+MIN_BONE_LENGTH = 0.01
+
+
 class SkeletonImporter:
     """Imports skeleton from FMDL."""
 
@@ -19,45 +27,76 @@ class SkeletonImporter:
         """Import specified skeleton."""
         name = self.fmdl.name
 
-        # This is completely stupid. We basically automate the UI
-        # to create the bones manually.
-        # There is a better way (which still involves the UI, but
-        # less so), but it of course doesn't work. (The created
-        # bones fail to actually exist.)
-        bpy.context.scene.cursor_location = (0.0, 0.0, 0.0)
-
-        # Create armature and object
-        bpy.ops.object.add(
-            type='ARMATURE',
-            enter_editmode=True)
-
-        armObj = bpy.context.object
-        #armObj.show_x_ray = True
-        armObj.name = name
-        amt = armObj.data
-        amt.name = name+'.Armature'
+        # Create armature and object directly, rather than through
+        # operators, which update the UI and don't work in
+        # background mode.
+        amt = bpy.data.armatures.new(name+'.Armature')
         #amt.show_axes  = True
         amt.layers[0]  = True
         amt.show_names = True
+        armObj = bpy.data.objects.new(name, amt)
+        #armObj.show_x_ray = True
+        scene = self.context.scene
+        scene.objects.link(armObj)
+        scene.objects.active = armObj
+
+        heads, tails, zAxes, connect = self._computeBones(fskl)
+        heads, tails, zAxes = heads.tolist(), tails.tolist(), zAxes.tolist()
+        parents = fskl.parentIdxs
 
-        bpy.ops.object.mode_set(mode='EDIT')
-        boneObjs = {}
-        for i, bone in enumerate(fskl.bones):
-            boneObj = amt.edit_bones.new(bone.name)
-            boneObjs[i] = boneObj
-            #boneObj.use_relative_parent = True
-            #boneObj.use_local_location = True
-            xfrm = bone.computeTransform().transposed()
-            # rotate to make Z the up axis
-            boneObj.matrix = Matrix.Rotation(
-                math.radians(90), 4, (1,0,0)) * xfrm
-
-            if bone.parent:
-                boneObj.parent = boneObjs[bone.parent_idx]
-                boneObj.head   = boneObj.parent.tail
-                boneObj.use_connect = True
-            else:
-                boneObj.head = (0,0,0)
-
-        bpy.ops.object.mode_set(mode='OBJECT')
+        # bones can only be added in edit mode.
+        override = self.context.copy()
+        override['scene']         = scene
+        override['object']        = armObj
+        override['active_object'] = armObj
+        override['edit_object']   = armObj
+        bpy.ops.object.mode_set(override, mode='EDIT')
+        try:
+            boneObjs = []
+            for i, bone in enumerate(fskl.bones):
+                boneObj = amt.edit_bones.new(bone.name)
+                boneObj.head = heads[i]
+                boneObj.tail = tails[i]
+                boneObj.align_roll(zAxes[i])
+                boneObjs.append(boneObj)
+
+            # parents always seem to come first, but don't count on it.
+            for i, boneObj in enumerate(boneObjs):
+                if parents[i] >= 0:
+                    boneObj.parent      = boneObjs[parents[i]]
+                    boneObj.use_connect = bool(connect[i])
+        finally:
+            bpy.ops.object.mode_set(override, mode='OBJECT')
         return armObj
+
+
+    def _computeBones(self, fskl):
+        """Compute every bone's head, tail and Z axis, and whether
+        it connects to its parent.
+
+        Each bone goes from its parent's origin to its own, like a
+        chain. Root bones start at the armature's origin.
+        """
+        world   = fskl.computeWorldTransforms()
+        parents = fskl.parentIdxs
+        # world matrices are for row vectors, so transpose them.
+        mtxs = _rotUp @ world[:, 0:3, 0:3].transpose(0, 2, 1)
+        pos  = world[:, 3, 0:3] @ _rotUp.T
+
+        heads = np.zeros_like(pos)
+        hasP  = parents >= 0
+        heads[hasP] = pos[parents[hasP]]
+        tails = pos.copy()
+
+        # give zero-length bones some length, along their Y axis.
+        short = np.linalg.norm(tails - heads, axis=1) < MIN_BONE_LENGTH
+        if short.any():
+            yAxes = mtxs[short, :, 1]
+            yLen  = np.linalg.norm(yAxes, axis=1, keepdims=True)
+            yAxes = np.where(yLen > 0, yAxes / np.maximum(yLen, 1e-12),
+                (0, 1, 0))
+            tails[short] = heads[short] + yAxes * MIN_BONE_LENGTH
+
+        connect = hasP.copy()
+        connect[hasP] = ~short[parents[hasP]]
+        return heads, tails, mtxs[:, :, 2], connect
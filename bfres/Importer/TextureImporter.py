@@ -5,6 +5,7 @@ import bpy_extras
 import struct
 import os
 import os.path
+import numpy as np
 
 class TextureImporter:
     """Imports texture images from BNTX archive."""
@@ -15,8 +16,18 @@ class TextureImporter:
         self.context  = parent.context
 
 
-    def importTextures(self, bntx):
-        """Import textures from BNTX."""
+    def importTextures(self, bntx, workers=None, cache=None):
+        """Import textures from BNTX.
+
+        workers: Number of processes to decode the textures with.
+        cache:   TextureCache to look up decoded textures in.
+        """
+        if cache is not None:
+            found = cache.load(bntx.textures)
+            log.info("Texture cache: %d / %d textures found (%d%% hit rate overall)",
+                found, len(bntx.textures), cache.hitRate * 100)
+        if workers: bntx.decodePixels(workers)
+
         images = {}
         for i, tex in enumerate(bntx.textures):
             log.info("Importing texture %3d/%3d '%s' (%s)...",
@@ -27,22 +38,7 @@ class TextureImporter:
                 width=tex.width, height=tex.height)
             image.use_alpha = True
 
-            pixels = [None] * tex.width * tex.height
-            offs   = 0
-            for y in range(tex.height):
-                for x in range(tex.width):
-                    b, g, r, a = tex.pixels[offs:offs+4]
-                    pixels[(y*tex.width)+x] = (
-                        r / 255.0,
-                        g / 255.0,
-                        b / 255.0,
-                        a / 255.0,
-                    )
-                    offs += 4
-
-            # flatten list
-            pixels = [chan for px in pixels for chan in px]
-            image.pixels = pixels
+            image.pixels = self._getPixels(tex)
 
             # save to file
             if self.operator.dump_textures:
@@ -55,6 +51,21 @@ class TextureImporter:
                 log.info("Saving image to %s", image.filepath_raw)
                 image.save()
 
-            image.pack(True, bytes(tex.pixels), len(tex.pixels))
+            data = bytes(tex.pixels)
+            image.pack(True, data, len(data))
             images[tex.name] = image
+
+        if cache is not None: cache.store(bntx.textures)
         return images
+
+
+    def _getPixels(self, tex):
+        """Convert texture's decoded pixels to a flat array of
+        RGBA floats, as Blender wants them.
+        """
+        fmt    = tex.fmt_type
+        pixels = np.asarray(tex.pixels).reshape(-1, 4)
+        pixels = pixels[0 : tex.width * tex.height]
+        order  = [fmt.channelOrder.index(c) for c in 'RGBA']
+        pixels = pixels[:, order] / float((1 << tex.depth) - 1)
+        return pixels.ravel()
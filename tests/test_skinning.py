@@ -0,0 +1,111 @@
+"""Compare Skinning's vertex deformation to a per-vertex reference."""
+import types
+import numpy as np
+import pytest
+from bfres.FRES.FMDL.Bone import Bone
+from bfres.FRES.FMDL.FSKL import FSKL
+from bfres.FRES.FMDL import Skinning
+from bfres.FRES.FMDL.Attribute.types import attrFmts
+
+NUM_BONES = 12
+NUM_VTXS  = 200
+NUM_INFL  = 4
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(2)
+
+
+@pytest.fixture
+def fskl(rng):
+    """A random skeleton with one smooth and one rigid matrix per
+    bone, bound in its rest pose."""
+    fskl  = FSKL(None)
+    bones = []
+    for i in range(NUM_BONES):
+        bone = Bone(None)
+        bone.name  = 'bone%d' % i
+        bone.pos   = list(rng.normal(size=3))
+        bone.rot   = list(rng.normal(size=3))
+        bone.scale = list(rng.uniform(0.8, 1.2, 3))
+        comp = bool(rng.random() < 0.3)
+        bone.flags  = {'_raw':comp << 23, 'SEG_SCALE_COMPENSATE':comp}
+        bone.parent = bones[rng.integers(0, i)] if i else None
+        bone.fskl   = fskl
+        bones.append(bone)
+    fskl.bones = bones
+    world = fskl.computeWorldTransforms()
+    fskl.mtxToBone   = np.concatenate((np.arange(NUM_BONES),
+        np.arange(NUM_BONES)))
+    fskl.smooth_mtxs = np.linalg.inv(world)[:, :, 0:3]
+    return fskl
+
+
+def makeFvtx(rng, nInfl):
+    positions = rng.normal(size=(NUM_VTXS, 3)).astype(np.float32)
+    idxs      = rng.integers(0, NUM_BONES, (NUM_VTXS, NUM_INFL))
+    weights   = rng.integers(0, 256, (NUM_VTXS, NUM_INFL)).astype(np.uint8)
+    weights[:, 0] = np.maximum(weights[:, 0], 1) # no all-zero weights
+    return types.SimpleNamespace(
+        attrData    = {'_p0':positions, '_i0':idxs, '_w0':weights},
+        header      = {'skin_weight_influence':nInfl},
+        attrsByName = {'_w0':types.SimpleNamespace(format=attrFmts[0x0B02])},
+    )
+
+
+def makePose(fskl):
+    rot = np.array([bone.rot[0:3] for bone in fskl.bones])
+    rot[3] += 0.7
+    rot[5] -= 1.1
+    return fskl.computePoseTransforms(rot=rot)
+
+
+def transform(point, mtx):
+    return (np.append(point, 1) @ mtx)[0:3]
+
+
+def test_restPose(rng, fskl):
+    fvtx = makeFvtx(rng, NUM_INFL)
+    res  = Skinning.skinVertices(fskl, fvtx)
+    assert np.allclose(res, fvtx.attrData['_p0'], atol=1e-5)
+
+
+def test_smooth(rng, fskl):
+    fvtx  = makeFvtx(rng, NUM_INFL)
+    pose  = makePose(fskl)
+    world = fskl.computeWorldTransforms()
+    res   = Skinning.skinVertices(fskl, fvtx, pose, chunkSize=37)
+
+    weights = fvtx.attrData['_w0'] / fvtx.attrData['_w0'].sum(axis=1,
+        keepdims=True)
+    for v in range(NUM_VTXS):
+        ref = np.zeros(3)
+        for k in range(NUM_INFL):
+            b    = fvtx.attrData['_i0'][v, k]
+            ref += weights[v, k] * transform(fvtx.attrData['_p0'][v],
+                np.linalg.inv(world[b]) @ pose[b])
+        assert np.allclose(res[v], ref, atol=1e-9), v
+
+
+def test_rigid(rng, fskl):
+    fvtx = makeFvtx(rng, 1)
+    fvtx.attrData['_i0'] += NUM_BONES # the rigid matrices
+    pose = makePose(fskl)
+    res  = Skinning.skinVertices(fskl, fvtx, pose)
+    for v in range(NUM_VTXS):
+        b = fvtx.attrData['_i0'][v, 0] - NUM_BONES
+        assert np.allclose(res[v],
+            transform(fvtx.attrData['_p0'][v], pose[b]), atol=1e-9), v
+
+
+def test_unskinned(rng, fskl):
+    fvtx = makeFvtx(rng, 0)
+    pose = makePose(fskl)
+    res  = Skinning.skinVertices(fskl, fvtx, pose, bone=3)
+    ref  = np.array([transform(p, pose[3]) for p in fvtx.attrData['_p0']])
+    assert np.allclose(res, ref, atol=1e-9)
+
+    # with no bone, vertices aren't moved.
+    res = Skinning.skinVertices(fskl, fvtx, pose)
+    assert np.allclose(res, fvtx.attrData['_p0'])
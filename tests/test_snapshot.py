@@ -0,0 +1,53 @@
+"""Check that snapshots can't refer to anything outside bfres."""
+import enum
+import pytest
+from bfres.FRES import Snapshot
+from bfres.FRES.Snapshot import _Decoder
+from bfres.FRES.FMDL.Attribute.types import unpack10bitArray
+from bfres.FRES.FMDL.FSHP import FSHP
+from bfres.BNTX.BRTI import BRTI
+
+
+def decode(root, objects=()):
+    return _Decoder({'objects':list(objects), 'root':root}, []).decodeGraph()
+
+
+@pytest.mark.parametrize('name', [
+    'bfres.FRES.Snapshot:os.system', # imported into a bfres module
+    'os:system',
+    'bfres.FRES.Snapshot:_fromQualName', # unregistered function
+    'bfres.FRES.Snapshot:importlib.import_module',
+    'bfres.FRES.Snapshot:Header.__init__',
+])
+def test_rejectsNames(name):
+    with pytest.raises(ValueError):
+        decode({'$e':[name, 'echo PWNED']})
+    with pytest.raises(ValueError):
+        decode({'$f':name})
+    with pytest.raises(ValueError):
+        decode(None, [{'cls':name, 'state':{}}])
+
+
+def test_rejectsNonEnum():
+    with pytest.raises(ValueError):
+        decode({'$e':['bfres.FRES.FMDL.FSHP:FSHP', 1]})
+
+
+def test_allowsBfresNames():
+    dtype = list(BRTI.TextureDataType)[0]
+    assert decode({'$e':[Snapshot._qualName(type(dtype)), dtype.value]}) \
+        is dtype
+    assert decode({'$f':'bfres.FRES.FMDL.FSHP:FSHP'}) is FSHP
+    assert decode({'$f':Snapshot._qualName(unpack10bitArray)}) \
+        is unpack10bitArray
+    obj = decode({'$o':0}, [{'cls':'bfres.FRES.FMDL.FSHP:FSHP',
+        'state':{'name':'Body'}}])
+    assert type(obj) is FSHP and obj.name == 'Body'
+
+
+def test_savesOnlyRegisteredFunctions():
+    enc = Snapshot._Encoder()
+    assert enc.encode(unpack10bitArray) == {'$f':
+        'bfres.FRES.FMDL.Attribute.types:unpack10bitArray'}
+    with pytest.raises(TypeError):
+        enc.encode(Snapshot._fromQualName)